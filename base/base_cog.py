@@ -1,8 +1,18 @@
+import asyncio
+import functools
+from typing import Any, Awaitable, Callable, Optional, List, TypeVar
+
+import discord
 from discord.ext import commands
 
 from core.bot import MyBot
+from core.job_scheduler import JobScheduler, CatchUpPolicy
+from core.send_scheduler import SendPriority
+from utils.batch_writer import BatchWriter
 from utils.logging import get_logger_for
 
+T = TypeVar("T")
+
 
 class BaseCog(commands.Cog):
     """
@@ -16,6 +26,10 @@ class BaseCog(commands.Cog):
         self.bot = bot
         self.logger = get_logger_for(self)
 
+        self.job_handler_names: List[str] = []
+        self.executor_tasks = set()
+        self.batch_writers: List[BatchWriter] = []
+
         self.logger.debug("Object initialised.")
 
     async def post_init(self):
@@ -30,3 +44,136 @@ class BaseCog(commands.Cog):
         This method is called when the cog is loaded.
         """
         self.logger.info(f"Cog initialised.")
+
+    async def cog_unload(self) -> None:
+        """
+        This method is called when the cog is unloaded.
+        """
+        for name in self.job_handler_names:
+            self.job_scheduler.unregister_handler(name)
+
+        for task in list(self.executor_tasks):
+            task.cancel()
+
+        for writer in self.batch_writers:
+            await writer.close()
+            self.bot.batch_writers.remove(writer)
+        self.batch_writers.clear()
+
+        self.logger.info(f"Cog unloaded.")
+
+    @property
+    def job_scheduler(self) -> JobScheduler:
+        """
+        Returns the bot's job scheduler.
+        """
+        return self.bot.job_scheduler
+
+    def get_job_handler_name(self, name: str) -> str:
+        """
+        Get the scheduler-wide name of one of this cog's job handlers.
+        :param name: Name of the handler within the cog.
+        :return: The handler name, prefixed with the cog's name.
+        """
+        return f"{self.qualified_name}:{name}"
+
+    def register_job_handler(self, name: str, func: Callable[[Any], Awaitable[Any]], max_concurrency: int = 1) -> None:
+        """
+        Register a job handler for this cog. Handlers are unregistered when the cog is unloaded.
+        Register handlers in post_init (or earlier), so persisted jobs can run as soon as the scheduler starts.
+        :param name: Name of the handler within the cog.
+        :param func: Coroutine function called with the job's payload.
+        :param max_concurrency: Maximum number of jobs for this handler running at once.
+        """
+        handler_name = self.get_job_handler_name(name)
+        self.job_scheduler.register_handler(handler_name, func, max_concurrency)
+        self.job_handler_names.append(handler_name)
+
+    async def schedule_job(self, name: str, *, at: Optional[float] = None, delay: Optional[float] = None,
+                           payload: Any = None, interval: Optional[float] = None, jitter: float = 0.0,
+                           catch_up: CatchUpPolicy = CatchUpPolicy.ONCE, key: Optional[str] = None) -> int:
+        """
+        Schedule a persistent job for one of this cog's handlers. See JobScheduler.schedule.
+        :param name: Name of the handler within the cog.
+        :param at: Time to run the job at, as a UNIX timestamp.
+        :param delay: Seconds from now to run the job in.
+        :param payload: JSON-serialisable payload passed to the handler.
+        :param interval: Seconds between runs for recurring jobs. None for one-off jobs.
+        :param jitter: Maximum random delay in seconds added to each run.
+        :param catch_up: What to do with missed runs.
+        :param key: Unique key for the job, prefixed with the cog's name. Used to avoid duplicating recurring jobs.
+        :return: The ID of the job.
+        """
+        return await self.job_scheduler.schedule(self.get_job_handler_name(name), at=at, delay=delay, payload=payload,
+                                                 interval=interval, jitter=jitter, catch_up=catch_up,
+                                                 key=self.get_job_handler_name(key) if key is not None else None)
+
+    async def respond(self, interaction: discord.Interaction, *args, **kwargs) -> None:
+        """
+        Respond to an interaction through the bot's send scheduler, at interaction priority.
+        Sends a followup if the interaction was already responded to.
+        :param interaction: The interaction.
+        :param args: Positional arguments for the message, e.g. its content.
+        :param kwargs: Keyword arguments for the message, e.g. `embed` or `ephemeral`.
+        """
+        send = interaction.followup.send if interaction.response.is_done() else interaction.response.send_message
+        await self.bot.send_scheduler.run(SendPriority.INTERACTION, functools.partial(send, *args, **kwargs))
+
+    async def reply(self, ctx: commands.Context, *args, **kwargs) -> discord.Message:
+        """
+        Reply to a prefix command through the bot's send scheduler, at user priority.
+        :param ctx: Context.
+        :param args: Positional arguments for the message, e.g. its content.
+        :param kwargs: Keyword arguments for the message, e.g. `embed`.
+        :return: The sent message.
+        """
+        return await self.bot.send_scheduler.run(SendPriority.USER, functools.partial(ctx.reply, *args, **kwargs))
+
+    def create_batch_writer(self, name: str, write: Callable[[List[Any]], None], flush_interval: float = 1.0,
+                            batch_size: int = 500, max_queued: int = 10000) -> BatchWriter:
+        """
+        Create a batch writer for this cog. Its remaining rows are written when the cog is unloaded or the bot closes.
+        :param name: Name of the writer within the cog.
+        :param write: Blocking function writing a batch of rows. Runs in the bot's thread pool.
+        :param flush_interval: Maximum number of seconds a row waits before being written.
+        :param batch_size: Maximum number of rows per write.
+        :param max_queued: Maximum number of rows waiting to be written.
+        :return: The writer.
+        """
+        writer = BatchWriter(f"{self.qualified_name}:{name}", write, self.bot.executor_pool.run_in_thread,
+                             flush_interval, batch_size, max_queued)
+        self.batch_writers.append(writer)
+        self.bot.batch_writers.append(writer)
+        return writer
+
+    async def run_in_thread(self, func: Callable[..., T], *args, **kwargs) -> T:
+        """
+        Run a blocking function in the bot's thread pool, so it doesn't block the event loop.
+        Cancelled when the cog is unloaded; work that already started runs to completion in the background.
+        :param func: The function.
+        :param args: Positional arguments for the function.
+        :param kwargs: Keyword arguments for the function.
+        :return: The function's result.
+        """
+        return await self._track_executor_work(self.bot.executor_pool.run_in_thread(func, *args, **kwargs))
+
+    async def run_in_process(self, func: Callable[..., T], *args, **kwargs) -> T:
+        """
+        Run a CPU-bound function in the bot's process pool. The function and its arguments must be picklable.
+        Cancelled when the cog is unloaded; work that already started runs to completion in the background.
+        :param func: The function.
+        :param args: Positional arguments for the function.
+        :param kwargs: Keyword arguments for the function.
+        :return: The function's result.
+        """
+        return await self._track_executor_work(self.bot.executor_pool.run_in_process(func, *args, **kwargs))
+
+    async def _track_executor_work(self, work: Awaitable[T]) -> T:
+        """
+        Run offloaded work as a task owned by this cog, so it can be cancelled on unload.
+        """
+        task = asyncio.ensure_future(work)
+        self.executor_tasks.add(task)
+        task.add_done_callback(self.executor_tasks.discard)
+
+        return await task
@@ -1,5 +1,110 @@
+import asyncio
+from collections import OrderedDict
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, List, Optional, Tuple
+
 import discord
 
+from core.send_scheduler import SendPriority
+
+
+class PageSource:
+    """
+    The data of a paginated menu's pages, loaded one page at a time.
+
+    Subclass it, or use CallablePageSource or IteratorPageSource.
+    """
+
+    async def prepare(self) -> None:
+        """
+        Called once before the menu is sent, e.g. to count the pages.
+        """
+        pass
+
+    def get_max_page(self) -> int:
+        """
+        Get the last page. May grow while pages are loaded, if the number of pages isn't known up front.
+        """
+        raise NotImplementedError
+
+    async def get_page(self, page: int) -> Any:
+        """
+        Get the data of a page.
+        :param page: The page.
+        :return: The data of the page.
+        :raises IndexError: If the page doesn't exist.
+        """
+        raise NotImplementedError
+
+    def get_page_hint(self, page: int) -> str:
+        """
+        Get a hint for loading a page cheaply from a new source, e.g. where the page starts. Used by persistent menus,
+        which create a new source for every press.
+        :param page: The page.
+        :return: The hint, without ':', or an empty string if there is none.
+        """
+        return ""
+
+    def apply_page_hint(self, hint: str) -> None:
+        """
+        Use a hint from get_page_hint. Called before prepare.
+        :param hint: The hint.
+        """
+        pass
+
+
+class CallablePageSource(PageSource):
+    """
+    Page source calling a coroutine function for each page.
+    """
+
+    def __init__(self, get_page: Callable[[int], Awaitable[Any]], max_page: int):
+        """
+        :param get_page: Coroutine function getting the data of a page.
+        :param max_page: The last page.
+        """
+        self._get_page = get_page
+        self.max_page = max_page
+
+    def get_max_page(self) -> int:
+        return self.max_page
+
+    async def get_page(self, page: int) -> Any:
+        if not 0 <= page <= self.max_page:
+            raise IndexError(page)
+        return await self._get_page(page)
+
+
+class IteratorPageSource(PageSource):
+    """
+    Page source over an async iterator yielding the data of one page at a time. The iterator is only advanced as far
+    as the pages that are shown (or prefetched), and its pages are kept, so earlier pages can be shown again.
+    """
+
+    def __init__(self, iterator: AsyncIterator[Any]):
+        """
+        :param iterator: Async iterator yielding the data of each page, in order.
+        """
+        self.iterator = iterator
+        self.pages: List[Any] = []
+        self.exhausted = False
+        self.lock = asyncio.Lock()
+
+    def get_max_page(self) -> int:
+        # Until the iterator is exhausted, there may be one more page.
+        return max(0, len(self.pages) - 1) if self.exhausted else len(self.pages)
+
+    async def get_page(self, page: int) -> Any:
+        async with self.lock:
+            while len(self.pages) <= page and not self.exhausted:
+                try:
+                    self.pages.append(await self.iterator.__anext__())
+                except StopAsyncIteration:
+                    self.exhausted = True
+
+        if not 0 <= page < len(self.pages):
+            raise IndexError(page)
+        return self.pages[page]
+
 
 class BasePaginatedMenu(discord.ui.View):
     """
@@ -11,6 +116,10 @@ class BasePaginatedMenu(discord.ui.View):
     - get_content()
     - get_page_display_value()
 
+    Alternatively, pass a page source and override format_page(). Pages of a page source are rendered once and kept in
+    an LRU cache, and the pages next to the current page are prefetched in the background, so turning pages is answered
+    from the cache.
+
     You may also override the following variables:
 
     - _min_page
@@ -26,7 +135,12 @@ class BasePaginatedMenu(discord.ui.View):
     - max_jump
     """
 
-    def __init__(self):
+    def __init__(self, page_source: Optional[PageSource] = None, cache_size: int = 16, prefetch: bool = True):
+        """
+        :param page_source: Source of the pages' data, or None to render pages with get_embed and get_content.
+        :param cache_size: Number of rendered pages of the page source to keep.
+        :param prefetch: Whether to render the pages next to the current page in the background.
+        """
         super().__init__()
         self.current_page = 0
 
@@ -35,6 +149,12 @@ class BasePaginatedMenu(discord.ui.View):
 
         self.message = None
 
+        self.page_source = page_source
+        self.cache_size = cache_size
+        self.prefetch = prefetch
+        self.page_cache: OrderedDict[int, Tuple[str, discord.Embed]] = OrderedDict()
+        self.render_tasks: Dict[int, asyncio.Task] = {}
+
     @property
     def min_page(self) -> int:
         return self._min_page
@@ -152,6 +272,7 @@ class BasePaginatedMenu(discord.ui.View):
         It closes the menu.
         """
         self.stop()
+        self.cancel_prefetch()
         # Remove all buttons
         for child in self.children:
             child.disabled = True
@@ -203,8 +324,11 @@ class BasePaginatedMenu(discord.ui.View):
         if interaction.is_expired():
             return
 
-        content = await self.get_content()
-        embed = await self.get_embed()
+        if self.page_source is not None:
+            await self.page_source.prepare()
+            self._max_page = self.page_source.get_max_page()
+
+        content, embed = await self.render_current_page()
 
         embed = await self.post_embed(embed)
 
@@ -213,9 +337,11 @@ class BasePaginatedMenu(discord.ui.View):
 
         await self.refresh_page_display_button()
         if interaction.response.is_done():
-            self.message = await interaction.followup.send(*args, **kwargs, view=self)
-            return
-        self.message = await interaction.response.send_message(*args, **kwargs, view=self)
+            send = lambda: interaction.followup.send(*args, **kwargs, view=self)
+        else:
+            send = lambda: interaction.response.send_message(*args, **kwargs, view=self)
+        self.message = await interaction.client.send_scheduler.run(SendPriority.INTERACTION, send)
+        self.prefetch_neighbours()
 
     async def refresh_page_display_button(self):
         """
@@ -229,15 +355,136 @@ class BasePaginatedMenu(discord.ui.View):
         """
         This is the refresh method for the menu.
 
-        It refreshes the embed, content and view, using the `get_embed` and `get_content` methods.
+        It refreshes the embed, content and view, using the page source or the `get_embed` and `get_content` methods.
         """
-        content = await self.get_content()
-        embed = await self.get_embed()
+        content, embed = await self.render_current_page()
 
         embed = await self.post_embed(embed)
 
         await self.refresh_page_display_button()
-        await interaction.response.edit_message(content=content, embed=embed, view=self)
+        await interaction.client.send_scheduler.run(
+            SendPriority.INTERACTION, lambda: interaction.response.edit_message(content=content, embed=embed, view=self))
+        self.prefetch_neighbours()
+
+    async def render_current_page(self) -> Tuple[str, discord.Embed]:
+        """
+        This renders the current page.
+
+        Without a page source, it uses the `get_content` and `get_embed` methods. With one, the page is taken from the
+        cache, or awaited if it is being prefetched, or rendered. If the page turns out not to exist, the menu moves to
+        the last page, and if the source has no pages at all, renders format_empty_page.
+        :return: The content and embed of the page.
+        """
+        if self.page_source is None:
+            return await self.get_content(), await self.get_embed()
+
+        try:
+            rendered = await self.get_rendered_page(self.current_page)
+        except IndexError:
+            self._max_page = self.page_source.get_max_page()
+            self.current_page = max(self.min_page, min(self.current_page, self.max_page))
+            try:
+                rendered = await self.get_rendered_page(self.current_page)
+            except IndexError:
+                rendered = await self.format_empty_page()
+
+        self._max_page = self.page_source.get_max_page()
+        content, embed = rendered
+        # A copy, as post_embed adds the page footer, and the number of pages may change.
+        return content, embed.copy()
+
+    async def get_rendered_page(self, page: int) -> Tuple[str, discord.Embed]:
+        """
+        This gets a rendered page of the page source, through the cache.
+        :param page: The page.
+        :return: The content and embed of the page.
+        """
+        if page in self.page_cache:
+            self.page_cache.move_to_end(page)
+            return self.page_cache[page]
+
+        task = self.render_tasks.get(page)
+        if task is None:
+            task = self.render_tasks[page] = asyncio.create_task(self.render_page(page))
+        try:
+            # Shielded, so cancelling the interaction doesn't cancel a render other callers may wait for.
+            return await asyncio.shield(task)
+        finally:
+            if task.done() and self.render_tasks.get(page) is task:
+                del self.render_tasks[page]
+
+    async def render_page(self, page: int) -> Tuple[str, discord.Embed]:
+        """
+        This renders a page of the page source, and caches it.
+        :param page: The page.
+        :return: The content and embed of the page.
+        """
+        rendered = await self.format_page(page, await self.page_source.get_page(page))
+
+        self.page_cache[page] = rendered
+        self.page_cache.move_to_end(page)
+        while len(self.page_cache) > self.cache_size:
+            self.page_cache.popitem(last=False)
+
+        return rendered
+
+    def prefetch_neighbours(self) -> None:
+        """
+        This starts rendering the pages before and after the current page in the background, if they aren't cached.
+        """
+        if self.page_source is None or not self.prefetch or self.is_finished():
+            return
+
+        for page in (self.current_page + 1, self.current_page - 1):
+            if self.min_page <= page <= self.max_page and page not in self.page_cache and \
+                    page not in self.render_tasks:
+                task = self.render_tasks[page] = asyncio.create_task(self.render_page(page))
+                task.add_done_callback(lambda done, page=page: self.on_prefetch_done(page, done))
+
+    def on_prefetch_done(self, page: int, task: asyncio.Task) -> None:
+        """
+        This forgets a finished prefetch. A failed prefetch is retried when the page is shown.
+        """
+        if self.render_tasks.get(page) is task:
+            del self.render_tasks[page]
+        if not task.cancelled():
+            task.exception()
+
+    def cancel_prefetch(self) -> None:
+        """
+        This cancels the pages being prefetched.
+        """
+        for task in self.render_tasks.values():
+            task.cancel()
+        self.render_tasks.clear()
+
+    def clear_page_cache(self) -> None:
+        """
+        This clears the rendered pages, e.g. when the underlying data changed.
+        """
+        self.cancel_prefetch()
+        self.page_cache.clear()
+
+    async def on_timeout(self) -> None:
+        self.cancel_prefetch()
+
+    async def format_page(self, page: int, data: Any) -> Tuple[str, discord.Embed]:
+        """
+        This is the format method for the pages of a page source.
+
+        It is called to render the data of a page into the content and embed to send.
+        :param page: The page.
+        :param data: The data of the page.
+        :return: The content and embed to send.
+        """
+        return "", discord.Embed(title=f"Page {page + 1}", description=str(data))
+
+    async def format_empty_page(self) -> Tuple[str, discord.Embed]:
+        """
+        This is the format method for a page source without any pages.
+        :return: The content and embed to send.
+        """
+        return "", discord.Embed(description="Nothing to show.")
 
     async def get_embed(self) -> discord.Embed:
         """
@@ -0,0 +1,219 @@
+import json
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, ClassVar, Dict, List, Optional, Tuple
+
+from sqlalchemy import Select, and_, func, or_, select
+from sqlalchemy.sql import operators
+from sqlalchemy.sql.elements import UnaryExpression
+
+from base.base_paginated_menu import PageSource
+from database.database_handler import DatabaseHandler
+
+
+class KeysetQueryPageSource(PageSource):
+    """
+    Page source over the rows of a query, using keyset (seek) pagination: a page continues from the row before it,
+    using the index of the order, instead of skipping all rows before it with an offset.
+
+    The start of every loaded page is remembered, and a page is loaded from the nearest known start before or after
+    it, or from the end of the rows, so only pages jumped to need to skip rows (at most half the distance between known
+    pages). The first, last and neighbouring pages are always single indexed queries.
+
+    The total is counted once, and shared between sources with the same query for `count_ttl` seconds. A shared total
+    may be out of date, so pages are only loaded backwards from the end when the source counted the total itself.
+    """
+
+    count_cache: ClassVar["OrderedDict[str, Tuple[float, int]]"] = OrderedDict()
+    """Cached totals, by query, with the time they were counted. Least recently used first."""
+    count_cache_size: ClassVar[int] = 256
+    """Maximum number of cached totals."""
+    count_cache_lock: ClassVar[threading.Lock] = threading.Lock()
+
+    def __init__(self, database_handler: DatabaseHandler, run_in_thread: Callable[..., Awaitable[Any]], query: Select,
+                 order_by: List[Any], page_size: int = 10, count_ttl: float = 60.0):
+        """
+        :param database_handler: Database handler.
+        :param run_in_thread: Coroutine function running a blocking function in a worker thread, used for queries.
+        :param query: The query for all rows, without order.
+        :param order_by: The order of the rows, e.g. `[Entity.created_at.desc(), Entity.id.desc()]`. Must be unique,
+        and should match an index. The columns must be selected by the query.
+        :param page_size: The number of rows per page.
+        :param count_ttl: Seconds a counted total is reused for. 0 to always count.
+        """
+        self.database_handler = database_handler
+        self.run_in_thread = run_in_thread
+        self.query = query
+        self.order = [self.parse_order(expression) for expression in order_by]
+        self.page_size = page_size
+        self.count_ttl = count_ttl
+
+        self.total = 0
+        self.total_exact = False
+        """Whether the total was counted for this source, rather than reused from the cache."""
+        self.starts: Dict[int, Optional[Tuple[Tuple[Any, ...], bool]]] = {0: None}
+        """Known page starts: the key of a row, and whether the page starts at it (or right after it)."""
+
+    @staticmethod
+    def parse_order(expression: Any) -> Tuple[Any, bool]:
+        """
+        Split an order by expression into its column and whether it is descending.
+        """
+        if isinstance(expression, UnaryExpression) and expression.modifier in (operators.desc_op, operators.asc_op):
+            return expression.element, expression.modifier is operators.desc_op
+        return expression, False
+
+    def get_order_by(self, reverse: bool = False) -> List[Any]:
+        """
+        Get the order by clause, or the reverse of it.
+        """
+        return [column.desc() if descending != reverse else column.asc() for column, descending in self.order]
+
+    def get_key(self, row) -> Tuple[Any, ...]:
+        """
+        Get the key of a row: the values of its order columns.
+        """
+        return tuple(getattr(row, column.key) for column, _ in self.order)
+
+    def seek(self, key: Tuple[Any, ...], inclusive: bool, reverse: bool = False):
+        """
+        Get the condition for the rows after a key in the order (before it if reversed).
+        :param key: The key.
+        :param inclusive: Whether to include the row with the key.
+        :param reverse: Whether to seek backwards.
+        """
+        conditions = []
+        for index, (column, descending) in enumerate(self.order):
+            last = index == len(self.order) - 1
+            if descending != reverse:
+                after = column <= key[index] if last and inclusive else column < key[index]
+            else:
+                after = column >= key[index] if last and inclusive else column > key[index]
+            conditions.append(and_(*[previous == key[position] for position, (previous, _) in
+                                     enumerate(self.order[:index])], after))
+        return or_(*conditions)
+
+    def count(self) -> int:
+        """
+        Count the rows, or reuse a recent count of the same query. Blocking.
+        """
+        compiled = self.query.compile(self.database_handler.engine)
+        cache_key = f"{compiled}|{sorted(compiled.params.items(), key=lambda param: param[0])}"
+
+        # Counts run in worker threads, so the cache is shared between threads.
+        with self.count_cache_lock:
+            cached = self.count_cache.get(cache_key)
+            if cached is not None and time.monotonic() - cached[0] < self.count_ttl:
+                self.count_cache.move_to_end(cache_key)
+                self.total_exact = False
+                return cached[1]
+
+        with self.database_handler.engine.connect() as connection:
+            total = connection.execute(select(func.count()).select_from(self.query.subquery())).scalar_one()
+        self.total_exact = True
+
+        with self.count_cache_lock:
+            now = time.monotonic()
+            self.count_cache[cache_key] = (now, total)
+            self.count_cache.move_to_end(cache_key)
+
+            # Drop expired totals, then the least recently used ones over the limit.
+            for key, (counted_at, _) in list(self.count_cache.items()):
+                if now - counted_at >= self.count_ttl:
+                    del self.count_cache[key]
+            while len(self.count_cache) > self.count_cache_size:
+                self.count_cache.popitem(last=False)
+
+        return total
+
+    async def prepare(self) -> None:
+        self.total = await self.run_in_thread(self.count)
+
+    def get_max_page(self) -> int:
+        return max(0, (self.total - 1) // self.page_size)
+
+    def fetch_page(self, page: int) -> List[Any]:
+        """
+        Fetch the rows of a page, from the nearest known page start. Blocking.
+        :param page: The page.
+        :return: The rows.
+        """
+        start_row = page * self.page_size
+        end_row = min(start_row + self.page_size, self.total)
+
+        # Pages may be fetched concurrently (e.g. prefetched), so iterate over a snapshot.
+        known_pages = list(self.starts)
+        before = max(known for known in known_pages if known <= page)
+        after = min((known for known in known_pages if known > page), default=None)
+        forward_skip = (page - before) * self.page_size
+        if after is not None:
+            backward_skip = (after - page - 1) * self.page_size
+        elif self.total_exact:
+            backward_skip = self.total - end_row
+        else:
+            # The offset from the end depends on the total being exact; from a known start, it doesn't.
+            backward_skip = forward_skip
+
+        if backward_skip < forward_skip:
+            query = self.query
+            if after is not None:
+                key, inclusive = self.starts[after]
+                # The rows before the start of the later page.
+                query = query.where(self.seek(key, not inclusive, reverse=True))
+            query = query.order_by(*self.get_order_by(reverse=True)).offset(backward_skip) \
+                .limit(max(0, end_row - start_row) if after is None else self.page_size)
+            rows = list(reversed(self.execute(query)))
+        else:
+            query = self.query
+            if self.starts[before] is not None:
+                query = query.where(self.seek(*self.starts[before]))
+            rows = self.execute(query.order_by(*self.get_order_by()).offset(forward_skip).limit(self.page_size))
+
+        if rows and page > 0:
+            self.starts.setdefault(page, (self.get_key(rows[0]), True))
+
+        if len(rows) == self.page_size:
+            self.starts.setdefault(page + 1, (self.get_key(rows[-1]), False))
+
+        return rows
+
+    def get_page_hint(self, page: int) -> str:
+        """
+        Get the known start of a page, as `[page, inclusive, *key]` in JSON, if its key values are JSON-serialisable.
+        """
+        start = self.starts.get(page)
+        if start is None:
+            return ""
+
+        key, inclusive = start
+        try:
+            hint = json.dumps([page, int(inclusive), *key], separators=(",", ":"))
+        except (TypeError, ValueError):
+            return ""
+
+        return hint if ":" not in hint else ""
+
+    def apply_page_hint(self, hint: str) -> None:
+        """
+        Add a page start from get_page_hint. Invalid hints are ignored.
+        """
+        try:
+            page, inclusive, *key = json.loads(hint)
+        except (TypeError, ValueError):
+            return
+
+        if isinstance(page, int) and page > 0 and len(key) == len(self.order):
+            self.starts[page] = (tuple(key), bool(inclusive))
+
+    def execute(self, query: Select) -> List[Any]:
+        """
+        Execute a query. Blocking.
+        """
+        with self.database_handler.engine.connect() as connection:
+            return connection.execute(query).all()
+
+    async def get_page(self, page: int) -> List[Any]:
+        if not 0 <= page <= self.get_max_page():
+            raise IndexError(page)
+        return await self.run_in_thread(self.fetch_page, page)
@@ -1,3 +1,5 @@
+from typing import Optional
+
 import discord
 
 from extensions.master_log.master_log_cog import MasterLogCog
@@ -8,6 +10,8 @@ class UsingMasterLogMixin:
     Mixin class for cogs that need to log actions to the master log channel.
 
     This mixin needs to be added to a class that also has the BaseCog as a parent.
+    Logs only go to a server's log channel if the server is passed as `guild`; callers handling something that happened
+    in a server should pass it.
     """
     master_log_cog_cache = None
 
@@ -26,28 +30,31 @@ class UsingMasterLogMixin:
         self.master_log_cog_cache = master_log_cog
         return master_log_cog
 
-    async def master_log_user_action(self, user: discord.Member, log: str):
+    async def master_log_user_action(self, user: discord.Member, log: str, guild: Optional[discord.Guild] = None):
         """
         Log a user action to the master log channel.
         :param user: The user.
         :param log: The log.
+        :param guild: The server the action was taken in, to send the log to the server's log channel if it has one.
         """
         embed = discord.Embed(title="User Action", description=log, color=0x0000ff)
         embed.set_author(name=user.display_name, icon_url=user.avatar.url)
-        await self.get_master_log_cog().send_master_log(embed=embed)
+        await self.get_master_log_cog().send_master_log(embed=embed, guild_id=guild.id if guild is not None else None)
 
-    async def master_log(self, log: str):
+    async def master_log(self, log: str, guild: Optional[discord.Guild] = None):
         """
         Send a log to the master log channel.
         :param log: The log.
+        :param guild: The server the log is about, to send it to the server's log channel if it has one.
         """
         embed = discord.Embed(title="Log", description=log, color=0x0000ff)
-        await self.get_master_log_cog().send_master_log(embed=embed)
+        await self.get_master_log_cog().send_master_log(embed=embed, guild_id=guild.id if guild is not None else None)
 
-    async def master_error_log(self, log: str):
+    async def master_error_log(self, log: str, guild: Optional[discord.Guild] = None):
         """
         Send an error log to the master log channel.
         :param log: The log.
+        :param guild: The server the log is about, to send it to the server's log channel if it has one.
         """
         embed = discord.Embed(title="Error Log", description=log, color=0xff0000)
-        await self.get_master_log_cog().send_master_log(embed=embed)
+        await self.get_master_log_cog().send_master_log(embed=embed, guild_id=guild.id if guild is not None else None)
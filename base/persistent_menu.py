@@ -0,0 +1,205 @@
+from typing import Any, ClassVar, Dict, Optional, Tuple, Type
+
+import discord
+
+from base.base_paginated_menu import PageSource
+from core.send_scheduler import SendPriority
+
+
+class PersistentMenu:
+    """
+    A stateless paginated menu, that keeps working after restarts.
+
+    Unlike BasePaginatedMenu, no view is kept in memory: the menu's type, page and parameters are encoded in the
+    `custom_id` of its buttons, and every press is handled by the persistent PersistentMenuButton dispatcher, which
+    creates the menu, renders the page, and discards the menu again. The previous and next buttons also carry the page
+    source's hint for their page (see PageSource.get_page_hint), so e.g. keyset pagination continues from the page
+    shown instead of skipping to it from the start.
+
+    Subclasses pass a short, unique `menu_id` to the class, and implement get_page_source() and format_page(). The
+    parameters are a string; together with the rest of the `custom_id` they must fit in 100 characters. A menu's
+    module must be imported for its buttons to be handled, e.g. by loading the extension using it.
+    """
+
+    menu_types: ClassVar[Dict[str, Type["PersistentMenu"]]] = {}
+    """Menu types, by menu ID."""
+
+    menu_id: ClassVar[str]
+
+    def __init_subclass__(cls, *, menu_id: Optional[str] = None, **kwargs):
+        super().__init_subclass__(**kwargs)
+
+        if menu_id is None:
+            return
+        if ":" in menu_id:
+            raise ValueError(f"Menu ID must not contain ':': {menu_id!r}")
+        if menu_id in PersistentMenu.menu_types and PersistentMenu.menu_types[menu_id].__qualname__ != cls.__qualname__:
+            raise ValueError(f"Menu ID {menu_id!r} is already used by {PersistentMenu.menu_types[menu_id]}")
+
+        cls.menu_id = menu_id
+        # Replaced when the module is reloaded, so buttons use the current code.
+        PersistentMenu.menu_types[menu_id] = cls
+
+    def __init__(self, bot, params: str = ""):
+        """
+        :param bot: The bot.
+        :param params: The menu's parameters, as encoded in its buttons.
+        """
+        self.bot = bot
+        self.params = params
+
+    def get_page_source(self) -> PageSource:
+        """
+        Get the source of the menu's pages. Created for every render.
+        """
+        raise NotImplementedError
+
+    async def format_page(self, page: int, data: Any) -> Tuple[str, discord.Embed]:
+        """
+        Render the data of a page into the content and embed to send.
+        :param page: The page.
+        :param data: The data of the page.
+        :return: The content and embed to send.
+        """
+        return "", discord.Embed(title=f"Page {page + 1}", description=str(data))
+
+    async def interaction_check(self, interaction: discord.Interaction) -> bool:
+        """
+        Check whether a user may use the menu. Anyone who can see the menu may use it by default.
+        :param interaction: The interaction of the button press.
+        :return: Whether the user may use the menu.
+        """
+        return True
+
+    async def render(self, page: int, hint: str = "") -> Tuple[str, discord.Embed, discord.ui.View]:
+        """
+        Render a page, clamped to the pages that currently exist.
+        :param page: The page.
+        :param hint: The page source's hint for loading the page, from the button pressed.
+        :return: The content, embed and view of the page.
+        """
+        page_source = self.get_page_source()
+        if hint:
+            page_source.apply_page_hint(hint)
+        await page_source.prepare()
+
+        page = max(0, min(page, page_source.get_max_page()))
+        try:
+            data = await page_source.get_page(page)
+        except IndexError:
+            page = page_source.get_max_page()
+            data = await page_source.get_page(page)
+        max_page = page_source.get_max_page()
+
+        content, embed = await self.format_page(page, data)
+        if embed.footer.text is None and embed.footer.icon_url is None:
+            embed.set_footer(text=f"Page {page + 1}/{max_page + 1}")
+
+        # The previous page ends where this one starts, and the next one starts where this one ends.
+        hints = {"p": page_source.get_page_hint(page), "n": page_source.get_page_hint(page + 1)}
+        return content, embed, self.build_view(page, max_page, hints)
+
+    def build_view(self, page: int, max_page: int, hints: Optional[Dict[str, str]] = None) -> discord.ui.View:
+        """
+        Build the buttons of a page. The view is only used to send them, and isn't stored.
+        :param page: The page.
+        :param max_page: The last page.
+        :param hints: Page source hints, by button slot. Left out of buttons they don't fit in.
+        :return: The view.
+        """
+        hints = hints or {}
+        view = discord.ui.View(timeout=None)
+        buttons = [("f", "<<", 0, discord.ButtonStyle.primary, page == 0),
+                   ("p", "<", max(0, page - 1), discord.ButtonStyle.primary, page == 0),
+                   ("c", f"{page + 1}/{max_page + 1}", page, discord.ButtonStyle.grey, True),
+                   ("n", ">", min(max_page, page + 1), discord.ButtonStyle.primary, page >= max_page),
+                   ("l", ">>", max_page, discord.ButtonStyle.primary, page >= max_page),
+                   ("x", "close", page, discord.ButtonStyle.danger, False)]
+        for slot, label, target_page, style, disabled in buttons:
+            hint = hints.get(slot, "")
+            if len(PersistentMenuButton.get_custom_id(self.menu_id, slot, target_page, hint, self.params)) > 100:
+                hint = ""
+            view.add_item(PersistentMenuButton(self.menu_id, slot, target_page, self.params, hint, label=label,
+                                               style=style, disabled=disabled))
+        return view
+
+    async def send(self, interaction: discord.Interaction, page: int = 0, **kwargs) -> None:
+        """
+        Send the menu in response to an interaction.
+        :param interaction: The interaction.
+        :param page: The page to show.
+        :param kwargs: Additional arguments for sending the message, e.g. `ephemeral`.
+        """
+        content, embed, view = await self.render(page)
+
+        if interaction.response.is_done():
+            send = lambda: interaction.followup.send(content=content, embed=embed, view=view, **kwargs)
+        else:
+            send = lambda: interaction.response.send_message(content=content, embed=embed, view=view, **kwargs)
+        await interaction.client.send_scheduler.run(SendPriority.INTERACTION, send)
+
+
+class PersistentMenuButton(discord.ui.DynamicItem[discord.ui.Button],
+                           template=r"pm:(?P<menu_id>[^:]+):(?P<slot>[a-z]):(?P<page>\d+):(?P<hint>[^:]*):"
+                                    r"(?P<params>.*)"):
+    """
+    A button of a PersistentMenu, and the dispatcher handling them. Register it once with `bot.add_dynamic_items`.
+
+    The `custom_id` is `pm:<menu ID>:<slot>:<page to show>:<page source hint>:<parameters>`. The slot keeps the buttons
+    of a message unique.
+    """
+
+    def __init__(self, menu_id: str, slot: str, page: int, params: str, hint: str = "", **button_kwargs):
+        """
+        :param menu_id: ID of the menu type.
+        :param slot: Single letter identifying the button within the menu. "x" closes the menu.
+        :param page: The page to show when pressed.
+        :param params: The menu's parameters.
+        :param hint: The page source's hint for loading the page, or an empty string.
+        :param button_kwargs: Arguments for the button, e.g. its label.
+        """
+        custom_id = self.get_custom_id(menu_id, slot, page, hint, params)
+        if len(custom_id) > 100:
+            raise ValueError(f"Menu parameters too long for a custom ID: {custom_id!r}")
+
+        super().__init__(discord.ui.Button(custom_id=custom_id, **button_kwargs))
+
+        self.menu_id = menu_id
+        self.slot = slot
+        self.page = page
+        self.params = params
+        self.hint = hint
+
+    @staticmethod
+    def get_custom_id(menu_id: str, slot: str, page: int, hint: str, params: str) -> str:
+        """
+        Get the `custom_id` of a button.
+        """
+        return f"pm:{menu_id}:{slot}:{page}:{hint}:{params}"
+
+    @classmethod
+    async def from_custom_id(cls, interaction: discord.Interaction, item: discord.ui.Button, match, /):
+        return cls(match["menu_id"], match["slot"], int(match["page"]), match["params"], match["hint"])
+
+    async def callback(self, interaction: discord.Interaction) -> None:
+        send_scheduler = interaction.client.send_scheduler
+
+        menu_type = PersistentMenu.menu_types.get(self.menu_id)
+        if menu_type is None:
+            await send_scheduler.run(SendPriority.INTERACTION, lambda: interaction.response.send_message(
+                "This menu is no longer available.", ephemeral=True))
+            return
+
+        menu = menu_type(interaction.client, self.params)
+        if not await menu.interaction_check(interaction):
+            await send_scheduler.run(SendPriority.INTERACTION, lambda: interaction.response.send_message(
+                "You can't use this menu.", ephemeral=True))
+            return
+
+        if self.slot == "x":
+            await send_scheduler.run(SendPriority.INTERACTION, lambda: interaction.response.edit_message(view=None))
+            return
+
+        content, embed, view = await menu.render(self.page, self.hint)
+        await send_scheduler.run(SendPriority.INTERACTION,
+                                 lambda: interaction.response.edit_message(content=content, embed=embed, view=view))
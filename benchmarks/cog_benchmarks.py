@@ -0,0 +1,164 @@
+"""
+Benchmarks driving the real cogs with fake interactions and contexts, against an in-memory SQLite database.
+
+Results are compared against a baseline file; regressions beyond the tolerance make the run fail.
+
+Usage: python -m benchmarks.cog_benchmarks [--update_baseline] [--tolerance 0.5] [--iterations 1000] [--rounds 5]
+                                           [--filter name]
+"""
+
+import argparse
+import asyncio
+import logging
+import sys
+import tempfile
+from pathlib import Path
+from types import SimpleNamespace
+from typing import Awaitable, Callable, Dict
+
+import discord
+from discord import app_commands
+from discord.ext import commands
+
+from benchmarks.fakes import BenchmarkBot, FakeUser, FakeGuild, FakeChannel, FakeInteraction, FakeContext, \
+    fake_app_commands, next_id
+from benchmarks.runner import run_benchmark, load_baseline, save_baseline, find_regressions
+from core.config import BotConfig
+from entities.setting import set_setting
+from extensions.core.core_cog import CoreCog
+from extensions.error.error_cog import ErrorCog
+from extensions.master_log.master_log_cog import MasterLogCog
+from extensions.settings.settings_cog import SettingsCog
+from utils.logging import get_logger_base_name
+
+DEFAULT_BASELINE_PATH = str(Path(__file__).parent / "baseline.json")
+
+COMMAND_NAMES = ["ping", "generate_command_link", "set-master-log-channel", "bot-settings", "help", "sync", "stats",
+                 "settings", "server-info", "user-info", "avatar", "remind", "reminders", "poll", "purge", "kick",
+                 "ban", "unban", "mute", "unmute", "warn", "warnings", "role", "roles", "emoji", "search", "queue"]
+
+
+async def create_bot() -> BenchmarkBot:
+    """
+    Create a bot with all provided cogs loaded, an in-memory database and a master log channel.
+    :return: The bot.
+    """
+    bot = BenchmarkBot(BotConfig.from_dict({"database_url": "sqlite:///:memory:", "spool_path": tempfile.mkdtemp()}))
+
+    for cog_class in (CoreCog, ErrorCog, MasterLogCog, SettingsCog):
+        await bot.add_cog(cog_class(bot))
+
+    bot.database_handler.initialise_database()
+    await bot.post_init_extensions()
+
+    guild = FakeGuild()
+    channel = bot.add_fake_channel(FakeChannel(guild=guild))
+    set_setting(bot, MasterLogCog.master_log_channel_key, str(channel.id))
+    set_setting(bot, "Benchmark:example", "value")
+
+    bot.owner_id = next_id()
+
+    return bot
+
+
+def create_benchmarks(bot: BenchmarkBot) -> Dict[str, Callable[[], Awaitable]]:
+    """
+    Create the benchmarks.
+    :param bot: The bot to benchmark.
+    :return: The benchmarks, by name.
+    """
+    guild = next(iter(bot.fake_channels.values())).guild
+    user = FakeUser(guild=guild)
+    owner = FakeUser(bot.owner_id, name="owner", guild=guild)
+
+    core_cog: CoreCog = bot.get_cog(CoreCog.__name__)
+    core_cog.update_scope(None, fake_app_commands(COMMAND_NAMES))
+    core_cog.update_scope(guild.id, [])
+    error_cog: ErrorCog = bot.get_cog(ErrorCog.__name__)
+    master_log_cog: MasterLogCog = bot.get_cog(MasterLogCog.__name__)
+    settings_cog: SettingsCog = bot.get_cog(SettingsCog.__name__)
+
+    prefix_command = SimpleNamespace(name="example", qualified_name="example")
+    app_command = SimpleNamespace(name="example", qualified_name="example")
+
+    def interaction(**kwargs) -> FakeInteraction:
+        return FakeInteraction(bot, kwargs.pop("user", user), guild, **kwargs)
+
+    def context(author: FakeUser = user) -> FakeContext:
+        return FakeContext(bot, author, guild, command=prefix_command, invoked_with="example", content="!example")
+
+    return {
+        "core.ping": lambda: core_cog.ping.callback(core_cog, interaction()),
+        "core.autocomplete_command_name": lambda: core_cog.autocomplete_command_name(interaction(), "se"),
+        "core.generate_command_link": lambda: core_cog.generate_command_link.callback(core_cog, interaction(),
+                                                                                      "ping"),
+        "settings.view_setting": lambda: settings_cog.view_setting.callback(settings_cog, interaction(user=owner),
+                                                                            "Benchmark:example"),
+        "settings.setting": lambda: settings_cog.setting.callback(settings_cog, interaction(user=owner),
+                                                                  "Benchmark:example", "value"),
+        "error.on_command_error": lambda: error_cog.on_command_error(context(), commands.BadArgument("bad")),
+        "error.on_command_error.owner": lambda: error_cog.on_command_error(context(owner),
+                                                                           commands.BadArgument("bad")),
+        "error.on_app_command_error": lambda: error_cog.on_app_command_error(
+            interaction(command=app_command), app_commands.CheckFailure("check")),
+        "master_log.send_master_log": lambda: master_log_cog.send_master_log(
+            embed=discord.Embed(title="Log", description="Benchmark log.", color=0x0000ff)),
+    }
+
+
+async def main(args: argparse.Namespace) -> int:
+    """
+    Run the benchmarks.
+    :param args: Parsed commandline arguments.
+    :return: The exit code.
+    """
+    # Log records are still created and filtered, but not printed.
+    base_logger = logging.getLogger(get_logger_base_name())
+    base_logger.addHandler(logging.NullHandler())
+    base_logger.propagate = False
+    base_logger.setLevel(logging.INFO)
+
+    bot = await create_bot()
+
+    async with bot:
+        bot.send_scheduler.start()
+
+        results = []
+        for name, func in create_benchmarks(bot).items():
+            if args.filter and args.filter not in name:
+                continue
+
+            result = await run_benchmark(name, func, iterations=args.iterations, warmup=args.iterations // 10,
+                                         rounds=args.rounds)
+            print(result.format())
+            results.append(result)
+
+    if args.update_baseline:
+        save_baseline(args.baseline, results)
+        print(f"Baseline written to {args.baseline}.")
+        return 0
+
+    regressions = find_regressions(results, load_baseline(args.baseline), args.tolerance)
+    if regressions:
+        print(f"\n{len(regressions)} regression(s) beyond {args.tolerance:.0%} of the baseline:")
+        for regression in regressions:
+            print(f"  {regression}")
+        return 1
+
+    return 0
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark the provided cogs.')
+    parser.add_argument('--baseline', type=str, help='The path to the baseline file.', default=DEFAULT_BASELINE_PATH,
+                        required=False)
+    parser.add_argument('--update_baseline', help='Write the results as the new baseline.', action='store_true')
+    parser.add_argument('--tolerance', type=float, help='Allowed relative regression against the baseline.',
+                        default=0.5, required=False)
+    parser.add_argument('--iterations', type=int, help='Number of timed calls per benchmark.', default=1000,
+                        required=False)
+    parser.add_argument('--rounds', type=int, help='Number of timed rounds per benchmark.', default=5, required=False)
+    parser.add_argument('--filter', type=str, help='Only run benchmarks containing this string.', default=None,
+                        required=False)
+
+    sys.exit(asyncio.run(main(parser.parse_args())))
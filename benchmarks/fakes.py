@@ -0,0 +1,212 @@
+"""
+Fake Discord objects for driving cogs without a Discord connection.
+
+The fakes only implement what the cogs actually touch. Sent messages are counted rather than delivered.
+"""
+
+from itertools import count
+from types import SimpleNamespace
+from typing import Any, Dict, List, Optional
+
+from core.bot import MyBot
+
+_ids = count(1 << 40)
+
+
+def next_id() -> int:
+    """
+    Get a fresh fake snowflake.
+    :return: The snowflake.
+    """
+    return next(_ids)
+
+
+class FakeMessageable:
+    """
+    Anything messages can be sent to. (channels, users)
+    """
+
+    def __init__(self):
+        self.sent: int = 0
+        self.last_sent: Optional[Dict[str, Any]] = None
+
+    async def send(self, content: Optional[str] = None, **kwargs) -> "FakeMessage":
+        self.sent += 1
+        self.last_sent = dict(kwargs, content=content)
+        return FakeMessage(self, content)
+
+
+class FakeMessage:
+    """
+    A sent message.
+    """
+
+    def __init__(self, channel: FakeMessageable, content: Optional[str] = None):
+        self.id = next_id()
+        self.channel = channel
+        self.content = content
+
+    async def edit(self, **kwargs) -> "FakeMessage":
+        return self
+
+
+class FakeUser(FakeMessageable):
+    """
+    A user or member.
+    """
+
+    def __init__(self, user_id: Optional[int] = None, name: str = "user", guild: Optional["FakeGuild"] = None):
+        super().__init__()
+        self.id = user_id or next_id()
+        self.name = name
+        self.display_name = name
+        self.bot = False
+        self.guild = guild
+        self.avatar = SimpleNamespace(url=f"https://cdn.discordapp.com/avatars/{self.id}/avatar.png")
+        self.mention = f"<@{self.id}>"
+
+    def __str__(self) -> str:
+        return self.name
+
+
+class FakeGuild:
+    """
+    A guild.
+    """
+
+    def __init__(self, guild_id: Optional[int] = None, name: str = "guild"):
+        self.id = guild_id or next_id()
+        self.name = name
+
+    def __str__(self) -> str:
+        return self.name
+
+
+class FakeChannel(FakeMessageable):
+    """
+    A text channel.
+    """
+
+    def __init__(self, channel_id: Optional[int] = None, guild: Optional[FakeGuild] = None):
+        super().__init__()
+        self.id = channel_id or next_id()
+        self.guild = guild
+        self.mention = f"<#{self.id}>"
+
+
+class FakeInteractionResponse:
+    """
+    The response of an interaction.
+    """
+
+    def __init__(self):
+        self.done = False
+        self.sent: int = 0
+
+    def is_done(self) -> bool:
+        return self.done
+
+    async def send_message(self, content: Optional[str] = None, **kwargs) -> None:
+        self.done = True
+        self.sent += 1
+
+    async def defer(self, **kwargs) -> None:
+        self.done = True
+
+    async def edit_message(self, **kwargs) -> None:
+        self.done = True
+        self.sent += 1
+
+    async def send_modal(self, modal) -> None:
+        self.done = True
+
+
+class FakeInteraction:
+    """
+    An application command interaction.
+    """
+
+    def __init__(self, bot: MyBot, user: FakeUser, guild: Optional[FakeGuild] = None,
+                 channel: Optional[FakeChannel] = None, command: Any = None, data: Optional[Dict[str, Any]] = None):
+        self.id = next_id()
+        self.client = bot
+        self.user = user
+        self.guild = guild
+        self.guild_id = guild.id if guild else None
+        self.channel = channel
+        self.channel_id = channel.id if channel else None
+        self.command = command
+        self.data = data or {}
+        self.extras: Dict[str, Any] = {}
+        self.response = FakeInteractionResponse()
+        self.followup = FakeMessageable()
+
+    def is_expired(self) -> bool:
+        return False
+
+
+class FakeContext(FakeMessageable):
+    """
+    A prefix command context.
+    """
+
+    def __init__(self, bot: MyBot, author: FakeUser, guild: Optional[FakeGuild] = None, command: Any = None,
+                 invoked_with: str = "", content: str = ""):
+        super().__init__()
+        self.bot = bot
+        self.author = author
+        self.guild = guild
+        self.channel = FakeChannel(guild=guild)
+        self.command = command
+        self.invoked_with = invoked_with
+        self.interaction = None
+        self.message = SimpleNamespace(id=next_id(), content=content, author=author, guild=guild)
+
+    async def reply(self, content: Optional[str] = None, **kwargs) -> FakeMessage:
+        return await self.send(content, **kwargs)
+
+
+class FakeAppCommand:
+    """
+    A synced application command, as returned by CommandTree.fetch_commands.
+    """
+
+    def __init__(self, name: str, command_id: Optional[int] = None):
+        self.id = command_id or next_id()
+        self.name = name
+        self.mention = f"</{name}:{self.id}>"
+
+
+class BenchmarkBot(MyBot):
+    """
+    MyBot with the parts that need a Discord connection replaced by fakes.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.fake_channels: Dict[int, FakeChannel] = {}
+
+    @property
+    def latency(self) -> float:
+        return 0.042
+
+    def get_channel(self, id: int, /) -> Optional[FakeChannel]:
+        return self.fake_channels.get(id)
+
+    def add_fake_channel(self, channel: FakeChannel) -> FakeChannel:
+        """
+        Register a fake channel so get_channel can resolve it.
+        :param channel: The channel.
+        :return: The channel.
+        """
+        self.fake_channels[channel.id] = channel
+        return channel
+
+
+def fake_app_commands(names: List[str]) -> List[FakeAppCommand]:
+    """
+    Create fake synced application commands.
+    :param names: The command names.
+    :return: The commands.
+    """
+    return [FakeAppCommand(name) for name in names]
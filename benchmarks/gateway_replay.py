@@ -0,0 +1,254 @@
+"""
+Replay driver feeding recorded gateway events into a MyBot instance, for offline throughput benchmarks.
+
+Recordings are made by running the bot with `gateway_record_path` set. The bot is replayed without a Discord connection:
+REST calls and interaction responses are answered by stubs, which count the calls instead.
+
+Usage: python -m benchmarks.gateway_replay path/to/recording.jsonl.gz [--speed 1.0] [--extensions core error ...]
+"""
+
+import argparse
+import asyncio
+import resource
+import tracemalloc
+from collections import Counter, defaultdict
+from datetime import datetime, timezone
+from itertools import count
+from time import perf_counter
+from typing import Any, Dict, List, Optional
+
+from discord.webhook import async_ as webhook_async
+
+from benchmarks.stats import percentile, format_duration
+from core.bot import MyBot
+from core.config import BotConfig
+from utils.gateway_recorder import read_gateway_recording
+
+_snowflakes = count(1 << 40)
+
+
+def _fake_message_payload(bot: MyBot, channel_id: Any, payload: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+    """
+    Build a minimal message payload, as returned by Discord when a message is sent.
+    :param bot: The bot.
+    :param channel_id: The channel the message is sent in.
+    :param payload: The JSON payload of the request.
+    :return: The message payload.
+    """
+    payload = payload or {}
+    user = bot.user
+    return {"id": str(next(_snowflakes)), "channel_id": str(channel_id), "type": 0, "content": payload.get("content") or "",
+            "author": {"id": str(user.id) if user else "0", "username": user.name if user else "bot",
+                       "discriminator": "0", "avatar": None, "bot": True},
+            "timestamp": datetime.now(timezone.utc).isoformat(), "edited_timestamp": None, "tts": False,
+            "mention_everyone": False, "mentions": [], "mention_roles": [], "attachments": [],
+            "embeds": payload.get("embeds") or [], "pinned": False}
+
+
+class StubHTTPClient:
+    """
+    Replaces the REST entry points of a bot with stubs that count calls and answer immediately.
+    """
+
+    def __init__(self, bot: MyBot):
+        """
+        :param bot: The bot to stub.
+        """
+        self.bot = bot
+        self.calls = Counter()
+
+        bot.http.request = self.request
+        webhook_async.async_context.set(StubWebhookAdapter(self))
+
+    async def request(self, route, *, files=None, form=None, **kwargs) -> Any:
+        """
+        Stub for HTTPClient.request.
+        :param route: The route being requested.
+        :return: A canned response.
+        """
+        self.calls[f"{route.method} {route.path}"] += 1
+
+        if route.method == "POST" and route.path.endswith("/messages"):
+            return _fake_message_payload(self.bot, route.channel_id, kwargs.get("json"))
+
+        return {}
+
+
+class StubWebhookAdapter(webhook_async.AsyncWebhookAdapter):
+    """
+    Webhook adapter stub. Interaction responses and followups are sent through this adapter rather than bot.http.
+    """
+
+    def __init__(self, http: StubHTTPClient):
+        """
+        :param http: The stub HTTP client to count calls on.
+        """
+        super().__init__()
+        self.http = http
+
+    async def request(self, route, session, *, payload=None, **kwargs) -> Any:
+        """
+        Stub for AsyncWebhookAdapter.request.
+        :param route: The route being requested.
+        :param session: The aiohttp session. Unused.
+        :param payload: The JSON payload of the request.
+        :return: A canned response.
+        """
+        self.http.calls[f"{route.method} {route.path}"] += 1
+
+        if route.method == "POST" and "/webhooks/" in route.path:
+            return _fake_message_payload(self.http.bot, 0, payload)
+
+        return {}
+
+
+class ReplayReport:
+    """
+    Results of a replay.
+    """
+
+    def __init__(self):
+        self.events = 0
+        self.elapsed = 0.0
+        self.latencies: List[float] = []
+        self.latencies_by_event: Dict[str, List[float]] = defaultdict(list)
+        self.memory_start = 0
+        self.memory_end = 0
+        self.max_rss_kib = 0
+        self.http_calls = Counter()
+
+    @property
+    def events_per_second(self) -> float:
+        """
+        Returns the number of events processed per second.
+        """
+        return self.events / self.elapsed if self.elapsed else 0.0
+
+    def format(self) -> str:
+        """
+        Format the report for printing.
+        :return: The formatted report.
+        """
+        lines = [f"Replayed {self.events} events in {self.elapsed:.3f}s ({self.events_per_second:.1f} events/s).",
+                 f"Latency p50 {format_duration(percentile(self.latencies, 50))}, "
+                 f"p99 {format_duration(percentile(self.latencies, 99))}, "
+                 f"max {format_duration(max(self.latencies, default=0.0))}."]
+
+        if self.memory_end or self.memory_start:
+            lines.append(f"Traced memory growth: {(self.memory_end - self.memory_start) / 1024:.1f} KiB.")
+        lines.append(f"Max RSS: {self.max_rss_kib / 1024:.1f} MiB.")
+
+        lines.append("Per event:")
+        for event, latencies in sorted(self.latencies_by_event.items(), key=lambda item: -len(item[1])):
+            lines.append(f"  {event:<32} {len(latencies):>8} p50 {format_duration(percentile(latencies, 50)):>10} "
+                         f"p99 {format_duration(percentile(latencies, 99)):>10}")
+
+        if self.http_calls:
+            lines.append("Stubbed REST calls:")
+            for route, calls in self.http_calls.most_common():
+                lines.append(f"  {route:<48} {calls:>8}")
+
+        return "\n".join(lines)
+
+
+async def replay(recording_path: str, config: BotConfig, speed: Optional[float] = None,
+                 trace_memory: bool = False) -> ReplayReport:
+    """
+    Replay a gateway recording into a fresh bot.
+    :param recording_path: The path to the recording.
+    :param config: The config to create the bot with. Should point to a disposable database.
+    :param speed: Playback speed relative to real time. None to replay at maximum speed.
+    :param trace_memory: Whether to trace memory growth with tracemalloc. Slows down the replay.
+    :return: The replay report.
+    """
+    report = ReplayReport()
+
+    bot = MyBot(config, chunk_guilds_at_startup=False, guild_ready_timeout=0.0)
+
+    async with bot:
+        http = StubHTTPClient(bot)
+        parsers = bot._connection.parsers
+
+        # Collect the tasks scheduled for each event, so the latency includes the listeners and cogs handling it.
+        scheduled: List[asyncio.Task] = []
+        original_schedule_event = bot._schedule_event
+
+        def schedule_event(*args, **kwargs) -> asyncio.Task:
+            task = original_schedule_event(*args, **kwargs)
+            scheduled.append(task)
+            return task
+
+        bot._schedule_event = schedule_event
+
+        # Load the extensions up front, as a live bot does on its first READY, so every replay measures the same cogs
+        # whatever the recording starts with. A recorded READY then counts as a reconnect.
+        await bot.setup_hook()
+        await bot.handle_initial_ready()
+
+        if trace_memory:
+            tracemalloc.start()
+            report.memory_start = tracemalloc.get_traced_memory()[0]
+
+        replay_start = perf_counter()
+        first_offset = None
+
+        for offset, event, data in read_gateway_recording(recording_path):
+            parser = parsers.get(event)
+            if parser is None:
+                continue
+
+            if speed is not None:
+                first_offset = offset if first_offset is None else first_offset
+                delay = (offset - first_offset) / speed - (perf_counter() - replay_start)
+                if delay > 0:
+                    await asyncio.sleep(delay)
+
+            event_start = perf_counter()
+            parser(data)
+            # READY is dispatched from a separate task, after waiting for the guilds.
+            ready_task = bot._connection._ready_task
+            if ready_task is not None:
+                scheduled.append(ready_task)
+            while scheduled:
+                pending = scheduled[:]
+                scheduled.clear()
+                await asyncio.gather(*pending, return_exceptions=True)
+            latency = perf_counter() - event_start
+
+            report.events += 1
+            report.latencies.append(latency)
+            report.latencies_by_event[event].append(latency)
+
+        report.elapsed = perf_counter() - replay_start
+
+        if trace_memory:
+            report.memory_end = tracemalloc.get_traced_memory()[0]
+            tracemalloc.stop()
+
+        report.max_rss_kib = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        report.http_calls = http.calls
+
+    return report
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Replay a gateway recording into the bot.')
+    parser.add_argument('recording', type=str, help='The path to the recording.')
+    parser.add_argument('--speed', type=float, help='Playback speed relative to real time. Maximum speed if omitted.',
+                        default=None, required=False)
+    parser.add_argument('--database_url', type=str, help='The database URL.', default='sqlite:///:memory:',
+                        required=False)
+    parser.add_argument('--extensions', type=str, help='The extensions to load.', default=None, required=False,
+                        nargs='*')
+    parser.add_argument('--trace_memory', help='Trace memory growth with tracemalloc.', action='store_true')
+
+    args = parser.parse_args()
+
+    replay_config = BotConfig.from_dict({"database_url": args.database_url})
+    if args.extensions is not None:
+        replay_config["extensions"] = args.extensions
+    else:
+        replay_config.update_from_yaml("./config.yaml")
+        replay_config["database_url"] = args.database_url
+
+    print(asyncio.run(replay(args.recording, replay_config, args.speed, args.trace_memory)).format())
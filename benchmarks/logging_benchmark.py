@@ -0,0 +1,106 @@
+"""
+Benchmark of log calls per second as seen by the caller, with handlers called directly versus through the log queue.
+
+Both setups write to the same kind of handlers as init_logging: a coloured console handler (to os.devnull here) and a
+rotating file handler in a temporary directory.
+
+Usage: python -m benchmarks.logging_benchmark [--iterations 10000] [--rounds 5] [--queue_size 10000]
+"""
+
+import argparse
+import asyncio
+import logging
+import os
+import tempfile
+from time import perf_counter
+from typing import List
+
+from benchmarks.runner import run_benchmark, BenchmarkResult
+from benchmarks.stats import format_duration
+from utils.log_rotation import CompressingRotatingFileHandler
+from utils.logging import ColourFormatter, start_queue_logging, shutdown_logging, get_logging_metrics
+
+
+def create_handlers(logs_path: str) -> List[logging.Handler]:
+    """
+    Create the console and file handlers, as configured by init_logging.
+    :param logs_path: Directory for the log file.
+    :return: The handlers.
+    """
+    stream_handler = logging.StreamHandler(open(os.devnull, "w"))
+    stream_handler.setFormatter(ColourFormatter())
+
+    file_handler = CompressingRotatingFileHandler(f"{logs_path}/discord.log")
+    file_handler.setFormatter(logging.Formatter("[{asctime}] [{levelname:<8}] {name}: {message}", style="{"))
+
+    return [stream_handler, file_handler]
+
+
+async def benchmark_logger(name: str, logger: logging.Logger, args: argparse.Namespace) -> BenchmarkResult:
+    """
+    Benchmark log calls on a logger.
+    :param name: Name of the benchmark.
+    :param logger: The logger.
+    :param args: Parsed commandline arguments.
+    :return: The result.
+    """
+    counter = 0
+
+    async def log_call():
+        nonlocal counter
+        counter += 1
+        logger.info("ping called successfully by user %d.", counter)
+
+    return await run_benchmark(name, log_call, iterations=args.iterations, warmup=args.iterations // 10,
+                               rounds=args.rounds)
+
+
+async def main(args: argparse.Namespace) -> None:
+    """
+    Run the benchmark.
+    :param args: Parsed commandline arguments.
+    """
+    with tempfile.TemporaryDirectory() as logs_path:
+        direct_logger = logging.getLogger("benchmark.direct")
+        direct_logger.propagate = False
+        direct_logger.setLevel(logging.INFO)
+        direct_handlers = create_handlers(logs_path)
+        for handler in direct_handlers:
+            direct_logger.addHandler(handler)
+
+        direct = await benchmark_logger("logging.direct", direct_logger, args)
+        print(direct.format())
+
+        for handler in direct_handlers:
+            direct_logger.removeHandler(handler)
+            handler.close()
+
+        queued_logger = logging.getLogger("benchmark.queued")
+        queued_logger.propagate = False
+        queued_logger.setLevel(logging.INFO)
+        queued_handlers = create_handlers(logs_path)
+        queued_logger.addHandler(start_queue_logging(queued_handlers, args.queue_size))
+
+        queued = await benchmark_logger("logging.queued", queued_logger, args)
+        print(queued.format())
+
+        metrics = get_logging_metrics()
+        start = perf_counter()
+        shutdown_logging()
+        print(f"Queue drained in {format_duration(perf_counter() - start)}; {metrics['dropped']} records dropped.")
+
+        for handler in queued_handlers:
+            handler.close()
+
+    print(f"Speedup: {queued.ops_per_sec / direct.ops_per_sec:.1f}x log calls per second.")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark log calls with and without the log queue.')
+    parser.add_argument('--iterations', type=int, help='Number of timed log calls per round.', default=10000,
+                        required=False)
+    parser.add_argument('--rounds', type=int, help='Number of timed rounds.', default=5, required=False)
+    parser.add_argument('--queue_size', type=int, help='Maximum number of queued records.', default=10000,
+                        required=False)
+
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,145 @@
+"""
+Micro-benchmark runner with baseline comparison.
+"""
+
+import json
+import tracemalloc
+from pathlib import Path
+from statistics import median
+from time import perf_counter
+from typing import Awaitable, Callable, Dict, List, Tuple
+
+from benchmarks.stats import percentile, format_duration
+
+
+class BenchmarkResult:
+    """
+    Results of a single benchmark.
+    """
+
+    def __init__(self, name: str, iterations: int, rounds: List[Tuple[float, List[float]]], alloc_bytes: float):
+        """
+        :param name: Name of the benchmark.
+        :param iterations: Number of timed calls per round.
+        :param rounds: Total time and per-call latencies of each round.
+        :param alloc_bytes: Mean peak memory allocated per call.
+        """
+        self.name = name
+        self.iterations = iterations
+        # Noise only ever makes calls slower, so the best round is the most representative for throughput and p50.
+        self.ops_per_sec = max(iterations / elapsed if elapsed else 0.0 for elapsed, _ in rounds)
+        self.p50 = min(percentile(latencies, 50) for _, latencies in rounds)
+        self.p99 = median(percentile(latencies, 99) for _, latencies in rounds)
+        self.alloc_bytes = alloc_bytes
+
+    def to_dict(self) -> Dict[str, float]:
+        """
+        Convert the result to a baseline entry.
+        :return: The result as a dictionary.
+        """
+        return {"ops_per_sec": round(self.ops_per_sec, 1), "p50": self.p50, "p99": self.p99,
+                "alloc_bytes": round(self.alloc_bytes)}
+
+    def format(self) -> str:
+        """
+        Format the result as a table row.
+        :return: The formatted result.
+        """
+        return (f"{self.name:<40} {self.ops_per_sec:>12.1f} ops/s  p50 {format_duration(self.p50):>10}  "
+                f"p99 {format_duration(self.p99):>10}  {self.alloc_bytes:>10.0f} B/call")
+
+
+async def run_benchmark(name: str, func: Callable[[], Awaitable], iterations: int = 1000, warmup: int = 100,
+                        rounds: int = 5) -> BenchmarkResult:
+    """
+    Benchmark an async callable. Latencies and allocations are measured in separate passes, as tracing allocations
+    distorts timings.
+    :param name: Name of the benchmark.
+    :param func: The callable to benchmark. Called without arguments, once per iteration.
+    :param iterations: Number of timed calls per round.
+    :param warmup: Number of untimed calls to make first.
+    :param rounds: Number of timed rounds.
+    :return: The result.
+    """
+    for _ in range(warmup):
+        await func()
+
+    timed_rounds = []
+    for _ in range(rounds):
+        latencies = []
+        start = perf_counter()
+        for _ in range(iterations):
+            call_start = perf_counter()
+            await func()
+            latencies.append(perf_counter() - call_start)
+        timed_rounds.append((perf_counter() - start, latencies))
+
+    allocation_iterations = max(1, iterations // 10)
+    allocated = 0
+    tracemalloc.start()
+    for _ in range(allocation_iterations):
+        tracemalloc.reset_peak()
+        before = tracemalloc.get_traced_memory()[0]
+        await func()
+        allocated += tracemalloc.get_traced_memory()[1] - before
+    tracemalloc.stop()
+
+    return BenchmarkResult(name, iterations, timed_rounds, allocated / allocation_iterations)
+
+
+def load_baseline(path: str) -> Dict[str, Dict[str, float]]:
+    """
+    Load a baseline file.
+    :param path: The path to the baseline file.
+    :return: The baseline, by benchmark name. Empty if the file does not exist.
+    """
+    if not Path(path).exists():
+        return {}
+
+    with open(path, "r") as file:
+        return json.load(file)
+
+
+def save_baseline(path: str, results: List[BenchmarkResult]) -> None:
+    """
+    Save results as the new baseline. Existing entries for other benchmarks are kept.
+    :param path: The path to the baseline file.
+    :param results: The results.
+    """
+    baseline = load_baseline(path)
+    baseline.update({result.name: result.to_dict() for result in results})
+
+    with open(path, "w") as file:
+        json.dump(baseline, file, indent=2, sort_keys=True)
+        file.write("\n")
+
+
+def find_regressions(results: List[BenchmarkResult], baseline: Dict[str, Dict[str, float]],
+                     tolerance: float) -> List[str]:
+    """
+    Compare results against a baseline.
+    :param results: The results.
+    :param baseline: The baseline.
+    :param tolerance: Allowed relative slowdown / allocation growth. (e.g. 0.5 allows 50% worse than the baseline)
+    :return: A description of each regression.
+    """
+    regressions = []
+    for result in results:
+        expected = baseline.get(result.name)
+        if expected is None:
+            continue
+
+        if result.p50 > expected["p50"] * (1 + tolerance):
+            regressions.append(f"{result.name}: p50 {format_duration(result.p50)} "
+                               f"(baseline {format_duration(expected['p50'])})")
+
+        if result.p99 > expected["p99"] * (1 + tolerance):
+            regressions.append(f"{result.name}: p99 {format_duration(result.p99)} "
+                               f"(baseline {format_duration(expected['p99'])})")
+
+        # Small allocations fluctuate too much in relative terms to be meaningful.
+        if result.alloc_bytes > max(expected["alloc_bytes"] * (1 + tolerance), expected["alloc_bytes"] + 1024):
+            regressions.append(f"{result.name}: {result.alloc_bytes:.0f} B/call "
+                               f"(baseline {expected['alloc_bytes']:.0f} B/call)")
+
+    return regressions
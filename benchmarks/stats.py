@@ -0,0 +1,33 @@
+"""
+Statistics helpers shared by the benchmarks.
+"""
+
+from typing import Sequence
+
+
+def percentile(values: Sequence[float], pct: float) -> float:
+    """
+    Get a percentile of some values, using nearest-rank on the sorted values.
+    :param values: The values.
+    :param pct: The percentile, between 0 and 100.
+    :return: The percentile, or 0 if there are no values.
+    """
+    if not values:
+        return 0.0
+
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, round(pct / 100 * len(ordered)) - 1))
+    return ordered[index]
+
+
+def format_duration(seconds: float) -> str:
+    """
+    Format a duration with a sensible unit.
+    :param seconds: The duration in seconds.
+    :return: The formatted duration.
+    """
+    if seconds >= 1:
+        return f"{seconds:.3f}s"
+    if seconds >= 1e-3:
+        return f"{seconds * 1e3:.3f}ms"
+    return f"{seconds * 1e6:.1f}us"
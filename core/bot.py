@@ -1,15 +1,29 @@
+import functools
 import logging
 from datetime import datetime, timedelta
-from typing import Optional
+from time import perf_counter
+from typing import Any, Callable, Dict, List, Optional
 
 from discord import Intents, Message
 from discord.ext import commands
 from discord.ext.tasks import loop
 from discord.utils import MISSING
 
+from base.persistent_menu import PersistentMenuButton
+from core.command_tree import BotCommandTree
 from core.config import BotConfig
+from core.executor_pool import ExecutorPool
+from core.job_scheduler import JobScheduler
+from core.send_scheduler import SendScheduler
 from database.database_handler import DatabaseHandler
+from utils.batch_writer import BatchWriter
+from utils.boot_profiler import BootProfiler
+from utils.data_loader import DataLoader
+from utils.gateway_recorder import GatewayRecorder
 from utils.logging import get_logger
+from utils.loop_monitor import LoopMonitor
+from utils.rate_limit import DatabaseRateLimitStore, RateLimitStore
+from utils.tracing import Tracer, current_trace
 
 
 class MyBot(commands.Bot):
@@ -17,21 +31,56 @@ class MyBot(commands.Bot):
     Custom bot class that inherits from discord.commands.Bot. Extends some functionality, and initialises custom systems.
     """
 
-    def __init__(self, config: BotConfig, *args, **kwargs):
+    def __init__(self, config: BotConfig, *args, boot_profiler: Optional[BootProfiler] = None, **kwargs):
         """
         Initialize the bot.
         :param config: Config used for the bot.
+        :param boot_profiler: Profiler recording the boot timeline. Created if not provided.
         """
         kwargs["intents"] = kwargs.get("intents", Intents.all())
         kwargs["case_insensitive"] = kwargs.get("case_insensitive", True)
         kwargs["command_prefix"] = kwargs.get("command_prefix", commands.when_mentioned_or("!"))
+        kwargs["tree_cls"] = kwargs.get("tree_cls", BotCommandTree)
 
         self.config = config
 
-        self.database_handler = DatabaseHandler(config.database_url)
+        self.boot_profiler = boot_profiler or BootProfiler()
+
+        with self.boot_profiler.phase("database_engine"):
+            self.database_handler = DatabaseHandler(config.database_url)
+
+        self.send_scheduler = SendScheduler(config.send_concurrency, config.send_requests_per_second,
+                                            config.send_low_priority_headroom)
+
+        self.executor_pool = ExecutorPool(config.thread_pool_size, config.process_pool_size)
+        self.job_scheduler = JobScheduler(self.database_handler, self.executor_pool.run_in_thread)
+        self.rate_limit_store: RateLimitStore = DatabaseRateLimitStore(self.database_handler,
+                                                                       self.executor_pool.run_in_thread)
+
+        self.batch_writers: List[BatchWriter] = []
+        self.data_loaders: Dict[str, DataLoader] = {}
+
+        self.tracer = Tracer(config.trace_slow_threshold)
+        self.tracer.instrument_engine(self.database_handler.engine)
+        kwargs["http_trace"] = kwargs.get("http_trace", self.tracer.create_http_trace_config())
+        if config.trace_export_path:
+            self.tracer.export_writer = BatchWriter(
+                "tracing:export", functools.partial(self.tracer.write_trace_events, config.trace_export_path),
+                self.executor_pool.run_in_thread)
+            self.batch_writers.append(self.tracer.export_writer)
+
+        self.loop_monitor = None
+        if config.loop_lag_threshold > 0:
+            self.loop_monitor = LoopMonitor(config.loop_lag_threshold, config.loop_monitor_interval)
 
         self.logger = get_logger()
 
+        self.gateway_recorder = None
+        if config.gateway_record_path:
+            # Raw gateway messages are only dispatched when debug events are enabled.
+            kwargs["enable_debug_events"] = True
+            self.gateway_recorder = GatewayRecorder(config.gateway_record_path)
+
         self.start_time = datetime.now()
         self.started = False
 
@@ -57,6 +106,18 @@ class MyBot(commands.Bot):
         """
         return self.database_handler.session
 
+    def get_data_loader(self, name: str, batch_load: Callable[[List[Any]], Dict[Any, Any]]) -> DataLoader:
+        """
+        Get the data loader with a name, creating it on first use. Loaders run their batches in the thread pool.
+        :param name: Name of the loader.
+        :param batch_load: Blocking function loading the values of a list of keys. Only used to create the loader.
+        :return: The data loader.
+        """
+        loader = self.data_loaders.get(name)
+        if loader is None:
+            loader = self.data_loaders[name] = DataLoader(name, batch_load, self.executor_pool.run_in_thread)
+        return loader
+
     async def on_message(self, message: Message, /) -> None:
         """
         Override the on_message method to ignore messages from bots.
@@ -67,6 +128,36 @@ class MyBot(commands.Bot):
 
         await super().on_message(message)
 
+    async def invoke(self, ctx: commands.Context, /) -> None:
+        """
+        Invoke a prefix command, within a trace of its stages. Stores the start time in `ctx.started_at`, before the
+        command starts (listeners of on_command only run once it has).
+        :param ctx: Context.
+        """
+        ctx.started_at = perf_counter()
+
+        if ctx.command is None:
+            await super().invoke(ctx)
+            return
+
+        self.tracer.instrument_command(ctx.command)
+        trace = self.tracer.start_trace(ctx.command.qualified_name, kind="prefix", user_id=ctx.author.id,
+                                        guild_id=ctx.guild.id if ctx.guild else None)
+        try:
+            await super().invoke(ctx)
+        finally:
+            trace.end = perf_counter()
+            self.tracer.finish_trace(trace, not ctx.command_failed)
+            current_trace.set(None)
+
+    async def on_socket_raw_receive(self, message: str, /) -> None:
+        """
+        Record raw gateway messages if gateway recording is enabled.
+        :param message: The raw gateway message.
+        """
+        if self.gateway_recorder:
+            self.gateway_recorder.record_raw(message)
+
     async def start(self, token: str, *, reconnect: bool = True) -> None:
         """
         Start the bot.
@@ -77,26 +168,82 @@ class MyBot(commands.Bot):
 
         await super().start(token=token, reconnect=reconnect)
 
+    async def login(self, token: str) -> None:
+        """
+        Log in to Discord. Also marks the start of the wait for the READY event.
+        :param token: The bot's token.
+        """
+        with self.boot_profiler.phase("login"):
+            await super().login(token)
+
+        self.boot_profiler.start_phase("ready_wait")
+
+    async def setup_hook(self) -> None:
+        """
+        Set up systems that need the event loop. Called during login, before connecting to the gateway.
+        """
+        self.send_scheduler.start()
+
+        # Handles the buttons of all persistent menus, including those sent before a restart.
+        self.add_dynamic_items(PersistentMenuButton)
+
+        if self.loop_monitor:
+            self.loop_monitor.start()
+
     async def close(self) -> None:
         """
         Close the bot.
         """
         self.logger.info(f"Bot is shutting down. Uptime: {self.uptime}")
 
+        await self.job_scheduler.close()
+
+        # Cogs flush their state on unload (batch writers, queued logs), which needs the thread pool, the database and
+        # the send scheduler, so unload them before those shut down. Bot.close then finds nothing left to unload.
+        for extension in tuple(self.extensions):
+            try:
+                await self.unload_extension(extension)
+            except Exception as e:
+                self.logger.exception(f"Failed to unload extension {extension}.", exc_info=e)
+        for cog in tuple(self.cogs):
+            try:
+                await self.remove_cog(cog)
+            except Exception as e:
+                self.logger.exception(f"Failed to remove cog {cog}.", exc_info=e)
+
+        await self.send_scheduler.close()
+
+        if self.loop_monitor:
+            self.loop_monitor.stop()
+
+        # Batch writers write through the thread pool, so write their remaining rows before shutting it down.
+        for writer in self.batch_writers:
+            await writer.close()
+
+        await self.executor_pool.shutdown()
+
         if self.database_handler:
             self.database_handler.close()
 
+        if self.gateway_recorder:
+            self.gateway_recorder.close()
+
         await super().close()
 
     async def handle_initial_ready(self):
         """
         Handle the first ready event (after the bot has started).
         """
-        await self.init_extensions()
+        with self.boot_profiler.phase("init_extensions"):
+            await self.init_extensions()
+
+        with self.boot_profiler.phase("initialise_database"):
+            self.database_handler.initialise_database()
 
-        self.database_handler.initialise_database()
+        with self.boot_profiler.phase("post_init_extensions"):
+            await self.post_init_extensions()
 
-        await self.post_init_extensions()
+        self.job_scheduler.start()
 
         self.commit_loop.start()
 
@@ -104,11 +251,26 @@ class MyBot(commands.Bot):
 
     async def on_ready(self):
         if not self.started:
+            self.boot_profiler.end_phase("ready_wait")
             await self.handle_initial_ready()
             self.logger.info(f"Bot is ready. Logged in as {self.user}. Boot time: {self.uptime}")
+            self.report_boot_profile()
         else:
             self.logger.info("Bot has reconnected.")
 
+    def report_boot_profile(self):
+        """
+        Log the boot timeline, and dump it as JSON if a boot profile path is configured.
+        """
+        self.logger.info(self.boot_profiler.format_waterfall())
+
+        if self.config.boot_profile_path:
+            try:
+                self.boot_profiler.dump_json(self.config.boot_profile_path)
+                self.logger.info(f"Boot profile written to {self.config.boot_profile_path}.")
+            except Exception as e:
+                self.logger.exception("Failed to write boot profile.", exc_info=e)
+
     async def on_disconnect(self):
         self.logger.warning("Bot has disconnected.")
 
@@ -121,7 +283,8 @@ class MyBot(commands.Bot):
         """
         for extension in self.config.extensions:
             try:
-                await self.load_extension(f"{self.config.extensions_path}.{extension}")
+                with self.boot_profiler.phase(f"extension:{extension}"):
+                    await self.load_extension(f"{self.config.extensions_path}.{extension}")
                 self.logger.info(f"Loaded extension: {extension}")
             except Exception as e:
                 self.logger.exception(f"Failed to load extension: {extension}", exc_info=e)
@@ -151,3 +314,10 @@ class MyBot(commands.Bot):
             self.logger.info("Database session committed.")
         except Exception as e:
             self.logger.error(f"Failed to commit database session: {e}")
+
+        if isinstance(self.rate_limit_store, DatabaseRateLimitStore):
+            try:
+                purged = await self.rate_limit_store.purge(max_age=24 * 60 * 60)
+                self.logger.debug(f"Purged {purged} stale rate limit buckets.")
+            except Exception as e:
+                self.logger.error(f"Failed to purge stale rate limit buckets: {e}")
@@ -0,0 +1,182 @@
+import bisect
+import difflib
+from typing import Any, Dict, Iterable, List, Optional
+
+
+class RegisteredCommand:
+    """
+    A synced application command, or a subcommand of one, as mentioned in Discord.
+    """
+
+    __slots__ = ("id", "name", "key")
+
+    def __init__(self, command_id: int, name: str):
+        """
+        :param command_id: ID of the top-level command.
+        :param name: Qualified name, e.g. "errors grouped" for a subcommand.
+        """
+        self.id = command_id
+        self.name = name
+        self.key = name.lower()
+
+    @property
+    def mention(self) -> str:
+        """
+        Returns the mention of the command.
+        """
+        return f"</{self.name}:{self.id}>"
+
+
+class CommandScope:
+    """
+    The commands synced to one scope (globally or to one server), indexed by ID and name, with the names sorted for
+    prefix search.
+    """
+
+    def __init__(self, commands: Iterable[RegisteredCommand]):
+        self.commands = sorted(commands, key=lambda command: command.key)
+        self.keys = [command.key for command in self.commands]
+        self.by_name = {command.key: command for command in self.commands}
+        self.by_id: Dict[int, RegisteredCommand] = {}
+        for command in self.commands:
+            # Subcommands share their parent's ID: the ID resolves to the top-level command.
+            if command.id not in self.by_id or " " not in command.key:
+                self.by_id[command.id] = command
+
+    def with_prefix(self, prefix: str) -> List[RegisteredCommand]:
+        """
+        Get the commands whose name starts with a prefix, in name order.
+        :param prefix: Lowercase prefix.
+        :return: The commands.
+        """
+        start = bisect.bisect_left(self.keys, prefix)
+        end = bisect.bisect_right(self.keys, prefix + "\uffff", lo=start)
+        return self.commands[start:end]
+
+
+class CommandRegistry:
+    """
+    Registry of the synced application command trees: the global tree and one per server with server-specific commands.
+
+    Scopes are replaced as a whole when they are synced or fetched, so the registry never needs to be invalidated
+    otherwise. Scopes serialise to plain data, so they can be persisted and loaded on startup without fetching.
+    """
+
+    def __init__(self):
+        self.scopes: Dict[Optional[int], CommandScope] = {}
+
+    @staticmethod
+    def from_app_commands(app_commands: Iterable[Any]) -> List[RegisteredCommand]:
+        """
+        Flatten synced application commands into registered commands, including subcommands.
+        :param app_commands: Commands returned by CommandTree.sync or CommandTree.fetch_commands.
+        :return: The registered commands.
+        """
+        registered = []
+
+        def add_options(command_id: int, name: str, options: Iterable[Any]):
+            for option in options:
+                # Subcommands and groups have options of their own; parameters don't.
+                if hasattr(option, "options"):
+                    qualified_name = f"{name} {option.name}"
+                    registered.append(RegisteredCommand(command_id, qualified_name))
+                    add_options(command_id, qualified_name, option.options)
+
+        for app_command in app_commands:
+            registered.append(RegisteredCommand(app_command.id, app_command.name))
+            add_options(app_command.id, app_command.name, getattr(app_command, "options", []))
+
+        return registered
+
+    def has_scope(self, guild_id: Optional[int]) -> bool:
+        """
+        Check whether a scope is known.
+        :param guild_id: ID of the server, or None for the global scope.
+        """
+        return guild_id in self.scopes
+
+    def set_scope(self, guild_id: Optional[int], commands: Iterable[RegisteredCommand]) -> None:
+        """
+        Replace the commands of a scope.
+        :param guild_id: ID of the server, or None for the global scope.
+        :param commands: The commands of the scope.
+        """
+        self.scopes[guild_id] = CommandScope(commands)
+
+    def get_scopes(self, guild_id: Optional[int]) -> List[CommandScope]:
+        """
+        Get the scopes visible in a server: its own commands first, then the global ones.
+        :param guild_id: ID of the server, or None outside of servers.
+        """
+        return [scope for scope in (self.scopes.get(guild_id) if guild_id is not None else None,
+                                    self.scopes.get(None)) if scope is not None]
+
+    def get(self, guild_id: Optional[int], id_or_name: str) -> Optional[RegisteredCommand]:
+        """
+        Get a command visible in a server by ID or qualified name.
+        :param guild_id: ID of the server, or None outside of servers.
+        :param id_or_name: ID or qualified name of the command.
+        :return: The command, or None if not found.
+        """
+        key = id_or_name.strip().lower()
+        command_id = int(key) if key.isdigit() else None
+
+        for scope in self.get_scopes(guild_id):
+            command = scope.by_id.get(command_id) if command_id is not None else scope.by_name.get(key)
+            if command is not None:
+                return command
+
+        return None
+
+    def search(self, guild_id: Optional[int], query: str, limit: int = 25) -> List[RegisteredCommand]:
+        """
+        Search the commands visible in a server: prefix matches first, then names containing the query. If no name
+        contains the query, the names closest to it are returned instead (for typos).
+        :param guild_id: ID of the server, or None outside of servers.
+        :param query: The query.
+        :param limit: Maximum number of results.
+        :return: The matching commands, best first.
+        """
+        query = query.strip().lower()
+        scopes = self.get_scopes(guild_id)
+        results: Dict[str, RegisteredCommand] = {}
+
+        def add(commands: Iterable[RegisteredCommand]) -> bool:
+            for command in commands:
+                results.setdefault(command.key, command)
+                if len(results) >= limit:
+                    return True
+            return False
+
+        if any(add(scope.with_prefix(query)) for scope in scopes):
+            return list(results.values())
+        if any(add(command for command in scope.commands if query in command.key) for scope in scopes) or results:
+            return list(results.values())
+
+        # Nothing contains the query: fall back to the names closest to it.
+        by_key = {}
+        for scope in reversed(scopes):
+            by_key.update(scope.by_name)
+        add(by_key[key] for key in difflib.get_close_matches(query, list(by_key), n=limit, cutoff=0.6))
+
+        return list(results.values())
+
+    @staticmethod
+    def to_data(scope: CommandScope) -> List[List[Any]]:
+        """
+        Serialise a scope to plain data.
+        """
+        return [[command.id, command.name] for command in scope.commands]
+
+    @staticmethod
+    def from_data(data: List[List[Any]]) -> List[RegisteredCommand]:
+        """
+        Deserialise commands serialised with to_data.
+        """
+        return [RegisteredCommand(int(command_id), name) for command_id, name in data]
+
+    def get_metrics(self) -> Dict[str, Any]:
+        """
+        Get the registry's metrics: the number of commands per scope.
+        """
+        return {str(guild_id or "global"): len(scope.commands) for guild_id, scope in self.scopes.items()}
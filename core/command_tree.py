@@ -0,0 +1,64 @@
+import hashlib
+import json
+from time import perf_counter
+from typing import Any, Dict, List, Optional, Set
+
+import discord
+from discord import app_commands
+from discord.abc import Snowflake
+
+
+class BotCommandTree(app_commands.CommandTree):
+    """
+    Command tree that records when each application command starts, so its duration can be measured, and starts the
+    command's trace. Also hashes the payloads sync sends, so unchanged scopes don't need to be synced.
+    """
+
+    async def get_sync_payload(self, guild: Optional[Snowflake] = None) -> List[Dict[str, Any]]:
+        """
+        Get the payload sync would send for a scope, translated if there is a translator.
+        :param guild: The server, or None for the global scope.
+        :return: The payload.
+        """
+        commands = self._get_all_commands(guild=guild)
+        if self.translator:
+            return [await command.get_translated_payload(self, self.translator) for command in commands]
+        return [command.to_dict(self) for command in commands]
+
+    async def get_sync_hash(self, guild: Optional[Snowflake] = None) -> str:
+        """
+        Hash the payload sync would send for a scope. Independent of the order commands were added in.
+        :param guild: The server, or None for the global scope.
+        :return: The hash.
+        """
+        payload = sorted(await self.get_sync_payload(guild), key=lambda command: (command.get("type", 1),
+                                                                                   command["name"]))
+        return hashlib.sha256(json.dumps(payload, sort_keys=True, default=str).encode()).hexdigest()
+
+    def get_guild_ids(self) -> Set[int]:
+        """
+        Get the IDs of the servers with server-specific commands.
+        """
+        context_menu_guild_ids = {guild_id for (_, guild_id, _) in self._context_menus if guild_id is not None}
+        return set(self._guild_commands) | context_menu_guild_ids
+
+    async def interaction_check(self, interaction: discord.Interaction, /) -> bool:
+        """
+        Called before every application command. Stores the start time in `interaction.extras["started_at"]`, and the
+        trace in `interaction.extras["trace"]`. Also called for autocomplete, which isn't traced: no completion or error
+        event would finish the trace.
+        :param interaction: The interaction.
+        :return: Whether the command may run.
+        """
+        if interaction.type is discord.InteractionType.autocomplete:
+            return True
+
+        interaction.extras["started_at"] = perf_counter()
+
+        tracer = getattr(self.client, "tracer", None)
+        if tracer is not None and interaction.command is not None:
+            tracer.instrument_command(interaction.command)
+            interaction.extras["trace"] = tracer.start_trace(interaction.command.qualified_name, kind="app",
+                                                             user_id=interaction.user.id,
+                                                             guild_id=interaction.guild_id)
+        return True
@@ -52,9 +52,32 @@ class BotConfig(dict):
         self["bot_token"] = ""
         self["database_url"] = ""
         self["logs_path"] = "logs"
+        self["log_queue_size"] = 10000
+        self["spool_path"] = "data/spool"
+        self["log_max_mb"] = 32
+        self["log_rotation_hours"] = 24
+        self["log_compression"] = "gzip"
+        self["log_retention_mb"] = 1024
+        self["log_retention_days"] = 30
+        self["log_format"] = "text"
+        self["log_sampling"] = {}
         self["debug"] = False
         self["extensions_path"] = "extensions"
         self["extensions"] = []
+        self["boot_profile_path"] = ""
+        self["gateway_record_path"] = ""
+        self["send_concurrency"] = 8
+        self["send_requests_per_second"] = 40
+        self["send_low_priority_headroom"] = 0.25
+        self["loop_lag_threshold"] = 0.25
+        self["loop_monitor_interval"] = 0.1
+        self["thread_pool_size"] = 8
+        self["process_pool_size"] = 0
+        self["error_digest_minutes"] = 60
+        self["usage_retention_days"] = 7
+        self["trace_slow_threshold"] = 1.0
+        self["trace_export_path"] = ""
+        self["sync_commands_on_ready"] = False
 
     def filter_relevant(self, in_data: Dict[str, Any]) -> Dict[str, Any]:
         """
@@ -93,6 +116,101 @@ class BotConfig(dict):
         """
         return self.get("logs_path", "./logs")
 
+    @property
+    def log_max_mb(self) -> float:
+        """
+        Get the size in MB at which the log file is rotated. 0 to disable size-based rotation.
+        :return: The maximum log file size.
+        """
+        return float(self.get("log_max_mb", 32))
+
+    @property
+    def log_rotation_hours(self) -> float:
+        """
+        Get the number of hours between time-based log rotations. 0 to disable time-based rotation.
+        :return: The log rotation interval.
+        """
+        return float(self.get("log_rotation_hours", 24))
+
+    @property
+    def log_compression(self) -> Optional[str]:
+        """
+        Get the compression of rotated log files: "gzip", "zstd" (requires the zstandard package) or "none".
+        :return: The log compression.
+        """
+        compression = self.get("log_compression", "gzip")
+        return None if compression in (None, "", "none") else compression
+
+    @property
+    def log_retention_mb(self) -> float:
+        """
+        Get the maximum total size in MB of rotated log files. The oldest are deleted first. 0 for no limit.
+        :return: The log retention size.
+        """
+        return float(self.get("log_retention_mb", 1024))
+
+    @property
+    def log_retention_days(self) -> float:
+        """
+        Get the maximum age in days of rotated log files. 0 for no limit.
+        :return: The log retention age.
+        """
+        return float(self.get("log_retention_days", 30))
+
+    @property
+    def spool_path(self) -> str:
+        """
+        Get the directory for on-disk spools of undelivered entries (e.g. master logs during outages). Relative paths
+        are relative to the project root, like logs_path, so the bot can be run from any directory.
+        :return: The spool path.
+        """
+        spool_path = self.get("spool_path", "data/spool")
+        if not os.path.isabs(spool_path):
+            spool_path = os.path.join(os.path.dirname(os.path.realpath(__file__)), "..", spool_path)
+
+        return os.path.normpath(spool_path)
+
+    @property
+    def log_queue_size(self) -> int:
+        """
+        Get the maximum number of log records waiting to be written. When full, the oldest records are dropped.
+        :return: The log queue size.
+        """
+        return int(self.get("log_queue_size", 10000))
+
+    @property
+    def log_format(self) -> str:
+        """
+        Get the log format: "text" for human-readable logs, or "json" for one JSON object per line.
+        :return: The log format.
+        """
+        return self.get("log_format", "text")
+
+    @property
+    def log_sampling(self) -> Dict[str, Dict[str, float]]:
+        """
+        Get the sampling rules for high-volume records, by the category records pass as `extra={"sampled": ...}`. Each
+        rule can have a `rate` (fraction of records to keep) and a `per_second` limit. Warnings and errors are always
+        kept. May be given as a YAML or JSON string, e.g. from an environment variable.
+        :return: The log sampling rules.
+        """
+        sampling = self.get("log_sampling", {}) or {}
+        if isinstance(sampling, str):
+            sampling = safe_load(sampling) or {}
+
+        if not isinstance(sampling, dict):
+            raise ValueError(f"log_sampling must be a mapping of categories to rules, not {sampling!r}")
+        for category, rule in sampling.items():
+            if not isinstance(rule, dict) or not set(rule) <= {"rate", "per_second"}:
+                raise ValueError(f"Invalid log_sampling rule for {category}: {rule!r}. "
+                                 f"Rules can only have a rate and a per_second limit.")
+            if not 0.0 <= float(rule.get("rate", 1.0)) <= 1.0:
+                raise ValueError(f"Invalid log_sampling rate for {category}: {rule['rate']!r}. Must be between 0 and 1.")
+            if rule.get("per_second") is not None and float(rule["per_second"]) < 0:
+                raise ValueError(f"Invalid log_sampling per_second for {category}: {rule['per_second']!r}.")
+
+        return sampling
+
     @property
     def debug(self) -> bool:
         """
@@ -117,6 +235,119 @@ class BotConfig(dict):
         """
         return self.get("extensions", [])
 
+    @property
+    def boot_profile_path(self) -> str:
+        """
+        Get the path to dump the boot timeline to as JSON. Empty to disable.
+        :return: The boot profile path.
+        """
+        return self.get("boot_profile_path", "")
+
+    @property
+    def gateway_record_path(self) -> str:
+        """
+        Get the path to record raw gateway dispatch events to, with each session's start time added to the file name.
+        Empty to disable.
+        :return: The gateway record path.
+        """
+        return self.get("gateway_record_path", "")
+
+    @property
+    def send_concurrency(self) -> int:
+        """
+        Get the maximum number of outbound sends in flight.
+        :return: The send concurrency.
+        """
+        return int(self.get("send_concurrency", 8))
+
+    @property
+    def send_requests_per_second(self) -> float:
+        """
+        Get the request budget shared by all outbound sends.
+        :return: The requests per second.
+        """
+        return float(self.get("send_requests_per_second", 40))
+
+    @property
+    def send_low_priority_headroom(self) -> float:
+        """
+        Get the fraction of the request budget that low priority sends (logs, DMs) can't use.
+        :return: The low priority headroom.
+        """
+        return float(self.get("send_low_priority_headroom", 0.25))
+
+    @property
+    def loop_lag_threshold(self) -> float:
+        """
+        Get the event loop lag in seconds from which the loop counts as blocked, and its stack is logged. 0 to disable.
+        :return: The loop lag threshold.
+        """
+        return float(self.get("loop_lag_threshold", 0.25))
+
+    @property
+    def loop_monitor_interval(self) -> float:
+        """
+        Get the number of seconds between event loop lag measurements.
+        :return: The loop monitor interval.
+        """
+        return float(self.get("loop_monitor_interval", 0.1))
+
+    @property
+    def thread_pool_size(self) -> int:
+        """
+        Get the number of worker threads for blocking work offloaded by cogs.
+        :return: The thread pool size.
+        """
+        return int(self.get("thread_pool_size", 8))
+
+    @property
+    def process_pool_size(self) -> int:
+        """
+        Get the number of worker processes for CPU-bound work offloaded by cogs. 0 to disable the process pool.
+        :return: The process pool size.
+        """
+        return int(self.get("process_pool_size", 0))
+
+    @property
+    def error_digest_minutes(self) -> float:
+        """
+        Get the number of minutes between error digests sent to the master log channel. 0 to disable.
+        :return: The error digest interval.
+        """
+        return float(self.get("error_digest_minutes", 60))
+
+    @property
+    def usage_retention_days(self) -> float:
+        """
+        Get the number of days raw command usage events and per-minute usage totals are kept. Per-day totals are kept.
+        :return: The usage retention.
+        """
+        return float(self.get("usage_retention_days", 7))
+
+    @property
+    def trace_slow_threshold(self) -> float:
+        """
+        Get the command duration in seconds from which a command's trace is logged with its spans. 0 to disable.
+        :return: The slow trace threshold.
+        """
+        return float(self.get("trace_slow_threshold", 1.0))
+
+    @property
+    def trace_export_path(self) -> str:
+        """
+        Get the file to export command traces to, in the Chrome trace event format. Empty to disable exporting.
+        :return: The trace export path.
+        """
+        return self.get("trace_export_path", "")
+
+    @property
+    def sync_commands_on_ready(self) -> bool:
+        """
+        Get whether to sync the command tree scopes that changed since their last sync when the bot is ready.
+        :return: The sync commands on ready setting.
+        """
+        return self.get("sync_commands_on_ready", False)
+
     def update_from_yaml(self, path: str) -> "BotConfig":
         """
         Update configuration settings from a YAML file.
@@ -0,0 +1,158 @@
+"""
+Shared executors for running blocking and CPU-bound work off the event loop.
+"""
+
+import asyncio
+import contextvars
+import functools
+import multiprocessing
+import threading
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+from time import monotonic
+from typing import Any, Callable, Dict, Optional, TypeVar
+
+from utils.logging import get_logger_for
+
+T = TypeVar("T")
+
+
+class ExecutorPool:
+    """
+    Holds the bot's thread pool, and an optional process pool.
+
+    Use the thread pool for blocking I/O and for work in libraries that release the GIL, and the process pool for pure
+    Python CPU-bound work. Functions sent to the process pool, and their arguments, must be picklable.
+    """
+
+    def __init__(self, thread_pool_size: int = 8, process_pool_size: int = 0):
+        """
+        :param thread_pool_size: Number of worker threads.
+        :param process_pool_size: Number of worker processes. 0 to disable the process pool.
+        """
+        self.logger = get_logger_for(self)
+
+        self.thread_pool_size = thread_pool_size
+        self.process_pool_size = process_pool_size
+
+        self.thread_pool = ThreadPoolExecutor(max_workers=thread_pool_size, thread_name_prefix="ExecutorPool")
+        self.process_pool: Optional[ProcessPoolExecutor] = None
+
+        self.lock = threading.Lock()
+        self.thread_submitted = 0
+        self.thread_queued = 0
+        self.thread_active = 0
+        self.thread_completed = 0
+        self.thread_max_queued = 0
+        self.thread_total_queue_wait = 0.0
+        self.thread_max_queue_wait = 0.0
+        self.process_submitted = 0
+        self.process_in_flight = 0
+        self.cancelled = 0
+
+    async def run_in_thread(self, func: Callable[..., T], *args, **kwargs) -> T:
+        """
+        Run a function in the thread pool, in a copy of the current context.
+        :param func: The function.
+        :param args: Positional arguments for the function.
+        :param kwargs: Keyword arguments for the function.
+        :return: The function's result.
+        """
+        submitted_at = monotonic()
+        state = {"started": False, "abandoned": False}
+        # Like asyncio.to_thread, run in a copy of the caller's context, so e.g. the current trace is kept.
+        context = contextvars.copy_context()
+
+        def run() -> T:
+            waited = monotonic() - submitted_at
+            with self.lock:
+                if state["abandoned"]:
+                    return None
+                state["started"] = True
+                self.thread_queued -= 1
+                self.thread_active += 1
+                self.thread_total_queue_wait += waited
+                self.thread_max_queue_wait = max(self.thread_max_queue_wait, waited)
+            try:
+                return context.run(func, *args, **kwargs)
+            finally:
+                with self.lock:
+                    self.thread_active -= 1
+                    self.thread_completed += 1
+
+        with self.lock:
+            self.thread_submitted += 1
+            self.thread_queued += 1
+            self.thread_max_queued = max(self.thread_max_queued, self.thread_queued)
+
+        try:
+            return await asyncio.get_running_loop().run_in_executor(self.thread_pool, run)
+        except asyncio.CancelledError:
+            with self.lock:
+                self.cancelled += 1
+                if not state["started"]:
+                    # Make sure the work never starts, even if a worker already picked it up.
+                    state["abandoned"] = True
+                    self.thread_queued -= 1
+            raise
+
+    async def run_in_process(self, func: Callable[..., T], *args, **kwargs) -> T:
+        """
+        Run a function in the process pool. The pool is started on first use.
+        :param func: The function. Must be picklable, i.e. defined at the top level of a module.
+        :param args: Positional arguments for the function. Must be picklable.
+        :param kwargs: Keyword arguments for the function. Must be picklable.
+        :return: The function's result.
+        """
+        if self.process_pool_size <= 0:
+            raise RuntimeError("The process pool is disabled. Set process_pool_size to use it.")
+
+        if self.process_pool is None:
+            # Forking a process with running threads can deadlock the child, so start workers fresh.
+            self.process_pool = ProcessPoolExecutor(max_workers=self.process_pool_size,
+                                                    mp_context=multiprocessing.get_context("spawn"))
+
+        self.process_submitted += 1
+        self.process_in_flight += 1
+        try:
+            return await asyncio.get_running_loop().run_in_executor(self.process_pool,
+                                                                    functools.partial(func, *args, **kwargs))
+        except asyncio.CancelledError:
+            with self.lock:
+                self.cancelled += 1
+            raise
+        finally:
+            self.process_in_flight -= 1
+
+    async def shutdown(self) -> None:
+        """
+        Shut down the pools. Queued work is cancelled, and running work is waited for.
+        """
+        pools = [self.thread_pool] + ([self.process_pool] if self.process_pool is not None else [])
+
+        for pool in pools:
+            # Waiting for workers blocks, so do it off the event loop.
+            await asyncio.to_thread(pool.shutdown, wait=True, cancel_futures=True)
+
+        self.logger.info("Executor pools shut down.")
+
+    def get_metrics(self) -> Dict[str, Any]:
+        """
+        Get the pools' metrics.
+        :return: The metrics.
+        """
+        with self.lock:
+            metrics = {"thread_pool": {"size": self.thread_pool_size, "active": self.thread_active,
+                                       "queued": self.thread_queued, "max_queued": self.thread_max_queued,
+                                       "saturated": self.thread_active >= self.thread_pool_size,
+                                       "submitted": self.thread_submitted, "completed": self.thread_completed,
+                                       "total_queue_wait": round(self.thread_total_queue_wait, 3),
+                                       "max_queue_wait": round(self.thread_max_queue_wait, 3)},
+                       "cancelled": self.cancelled}
+
+        if self.process_pool_size > 0:
+            metrics["process_pool"] = {"size": self.process_pool_size, "started": self.process_pool is not None,
+                                       "in_flight": self.process_in_flight,
+                                       "saturated": self.process_in_flight >= self.process_pool_size,
+                                       "submitted": self.process_submitted}
+
+        return metrics
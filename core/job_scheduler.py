@@ -0,0 +1,439 @@
+"""
+Persistent scheduler for one-off and recurring background jobs.
+"""
+
+import asyncio
+import heapq
+import json
+import random
+import time
+from collections import deque
+from enum import Enum
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+from sqlalchemy import select, update, delete, insert, bindparam
+
+from database.database_handler import DatabaseHandler
+from entities.scheduled_job import ScheduledJob
+from utils.logging import get_logger_for
+
+
+class CatchUpPolicy(str, Enum):
+    """
+    What to do with runs that were missed, e.g. because the bot was offline.
+    """
+    SKIP = "skip"
+    """Drop missed runs."""
+    ONCE = "once"
+    """Run once for all missed runs."""
+    ALL = "all"
+    """Run once for every missed run."""
+
+
+class PendingJob:
+    """
+    In-memory state of a scheduled job.
+
+    `due_at` is the time the job is scheduled for, and what is persisted; recurring jobs advance it by their interval.
+    `run_at` adds the job's random jitter to it, and orders the heap, so the jitter of one run doesn't shift later ones.
+    """
+
+    __slots__ = ("job_id", "handler", "payload", "due_at", "run_at", "interval", "jitter", "catch_up")
+
+    def __init__(self, job_id: int, handler: str, payload: Any, due_at: float, interval: Optional[float],
+                 jitter: float, catch_up: CatchUpPolicy):
+        self.job_id = job_id
+        self.handler = handler
+        self.payload = payload
+        self.due_at = due_at
+        self.run_at = due_at + random.uniform(0, jitter) if jitter else due_at
+        self.interval = interval
+        self.jitter = jitter
+        self.catch_up = catch_up
+
+
+class JobHandler:
+    """
+    A registered job handler, with its concurrency limit and the jobs waiting for a free slot.
+    """
+
+    def __init__(self, func: Callable[[Any], Awaitable[Any]], max_concurrency: int):
+        self.func = func
+        self.max_concurrency = max_concurrency
+        self.running = 0
+        self.backlog = deque()
+
+
+class JobScheduler:
+    """
+    Runs jobs persisted in the ScheduledJobs table.
+
+    Pending jobs are indexed in a single heap ordered by due time, and a single runner task sleeps until the earliest one
+    is due, so pending jobs cost no tasks. Jobs are run by handlers registered by name; each handler has its own
+    concurrency limit, and due jobs over the limit wait in the handler's backlog.
+
+    Completed runs are persisted in batches, so a job that ran shortly before a crash may run again after a restart.
+    Statements run in a worker thread; only the in-memory index is updated on the event loop.
+    """
+
+    def __init__(self, database_handler: DatabaseHandler,
+                 run_in_thread: Optional[Callable[..., Awaitable[Any]]] = None, misfire_grace: float = 60.0,
+                 flush_delay: float = 1.0):
+        """
+        :param database_handler: The database handler.
+        :param run_in_thread: Coroutine function running a blocking function in a worker thread. Defaults to
+        asyncio.to_thread.
+        :param misfire_grace: How late in seconds a run may start before it counts as missed.
+        :param flush_delay: Seconds to collect completed runs for before persisting them in one transaction.
+        """
+        self.logger = get_logger_for(self)
+
+        self.database_handler = database_handler
+        self.run_in_thread = run_in_thread or asyncio.to_thread
+        self.misfire_grace = misfire_grace
+        self.flush_delay = flush_delay
+
+        self.handlers: Dict[str, JobHandler] = {}
+        self.jobs: Dict[int, PendingJob] = {}
+        self.heap: List[Tuple[float, int]] = []
+        self.orphaned: Dict[str, List[PendingJob]] = {}
+
+        self.wakeup = asyncio.Event()
+        self.runner: Optional[asyncio.Task] = None
+        self.running_tasks = set()
+
+        self.completed: set = set()
+        self.rescheduled: Dict[int, float] = {}
+        self.flush_handle: Optional[asyncio.TimerHandle] = None
+        self.flush_lock = asyncio.Lock()
+        self.flush_tasks = set()
+
+    @property
+    def started(self) -> bool:
+        """
+        Returns whether the runner is running.
+        """
+        return self.runner is not None and not self.runner.done()
+
+    def register_handler(self, name: str, func: Callable[[Any], Awaitable[Any]], max_concurrency: int = 1) -> None:
+        """
+        Register a job handler.
+        :param name: Name of the handler, as referenced by jobs.
+        :param func: Coroutine function called with the job's payload.
+        :param max_concurrency: Maximum number of jobs for this handler running at once.
+        """
+        self.handlers[name] = JobHandler(func, max_concurrency)
+
+        for job in self.orphaned.pop(name, []):
+            if job.job_id in self.jobs:
+                self._push(job)
+
+    def unregister_handler(self, name: str) -> None:
+        """
+        Unregister a job handler. Its jobs stay persisted, and run again once a handler is registered under the same name.
+        :param name: Name of the handler.
+        """
+        handler = self.handlers.pop(name, None)
+        if handler is None:
+            return
+
+        # Due jobs waiting for a slot go back onto the heap, where they are set aside until a handler is registered.
+        backlog, handler.backlog = handler.backlog, deque()
+        for job in backlog:
+            if job.job_id in self.jobs:
+                self._push(job)
+
+    def start(self) -> None:
+        """
+        Load the persisted jobs and start the runner.
+        """
+        if self.started:
+            return
+
+        with self.database_handler.engine.connect() as connection:
+            rows = connection.execute(select(ScheduledJob.row_id, ScheduledJob.handler, ScheduledJob.payload,
+                                             ScheduledJob.due_at, ScheduledJob.interval, ScheduledJob.jitter,
+                                             ScheduledJob.catch_up)).all()
+
+        self.orphaned = {}
+        self.jobs = {row.row_id: PendingJob(row.row_id, row.handler, json.loads(row.payload), row.due_at, row.interval,
+                                            row.jitter, CatchUpPolicy(row.catch_up)) for row in rows}
+        self.heap = [(job.run_at, job.job_id) for job in self.jobs.values()]
+        heapq.heapify(self.heap)
+
+        self.runner = asyncio.create_task(self.run_loop(), name="JobScheduler runner")
+        self.logger.info(f"Job scheduler started with {len(self.jobs)} pending jobs.")
+
+    async def close(self) -> None:
+        """
+        Stop the runner and cancel running jobs. Pending jobs stay persisted.
+        """
+        if self.runner is not None:
+            self.runner.cancel()
+            self.runner = None
+
+        for task in list(self.running_tasks):
+            task.cancel()
+
+        await self.flush()
+
+    async def schedule(self, handler: str, *, at: Optional[float] = None, delay: Optional[float] = None,
+                       payload: Any = None, interval: Optional[float] = None, jitter: float = 0.0,
+                       catch_up: CatchUpPolicy = CatchUpPolicy.ONCE, key: Optional[str] = None) -> int:
+        """
+        Schedule a job.
+        :param handler: Name of the handler to run the job.
+        :param at: Time to run the job at, as a UNIX timestamp.
+        :param delay: Seconds from now to run the job in. Used if `at` is not given; defaults to the interval, or 0.
+        :param payload: JSON-serialisable payload passed to the handler.
+        :param interval: Seconds between runs for recurring jobs. None for one-off jobs.
+        :param jitter: Maximum random delay in seconds added to each run, to spread out load. Runs stay scheduled at
+        multiples of the interval; the delay doesn't accumulate.
+        :param catch_up: What to do with missed runs.
+        :param key: Unique key for the job. Scheduling a job with an existing key updates that job but keeps its due
+        time, so recurring jobs can be scheduled on every start without duplicating them.
+        :return: The ID of the job.
+        """
+        if at is None:
+            at = time.time() + (delay if delay is not None else interval or 0.0)
+
+        values = dict(handler=handler, payload=json.dumps(payload), interval=interval, jitter=jitter,
+                      catch_up=CatchUpPolicy(catch_up).value)
+        job_id, at = await self.run_in_thread(self._persist_job, key, at, values)
+
+        self._add(PendingJob(job_id, handler, payload, at, interval, jitter, CatchUpPolicy(catch_up)))
+        return job_id
+
+    def _persist_job(self, key: Optional[str], at: float, values: Dict[str, Any]) -> Tuple[int, float]:
+        """
+        Insert a job, or update the job with the same key. Blocking.
+        :return: The ID of the job, and its due time.
+        """
+        with self.database_handler.engine.begin() as connection:
+            existing = None
+            if key is not None:
+                existing = connection.execute(
+                    select(ScheduledJob.row_id, ScheduledJob.due_at).where(ScheduledJob.key == key)).one_or_none()
+
+            if existing is not None:
+                job_id, at = existing
+                connection.execute(update(ScheduledJob).where(ScheduledJob.row_id == job_id).values(**values))
+            else:
+                job_id = connection.execute(
+                    insert(ScheduledJob).values(due_at=at, key=key, **values)).inserted_primary_key[0]
+
+        return job_id, at
+
+    async def cancel(self, job_id: int) -> bool:
+        """
+        Cancel a job.
+        :param job_id: The ID of the job.
+        :return: Whether the job existed.
+        """
+        # Removed from the index first, so the job can't start while it is being deleted. The heap entry is skipped
+        # once it comes up.
+        job = self.jobs.pop(job_id, None)
+        if job is not None and job in self.orphaned.get(job.handler, []):
+            self.orphaned[job.handler].remove(job)
+
+        deleted = await self.run_in_thread(self._delete_job, job_id)
+        return job is not None or deleted
+
+    def _delete_job(self, job_id: int) -> bool:
+        """
+        Delete a job. Blocking.
+        :return: Whether the job was persisted.
+        """
+        with self.database_handler.engine.begin() as connection:
+            return bool(connection.execute(delete(ScheduledJob).where(ScheduledJob.row_id == job_id)).rowcount)
+
+    def get_metrics(self) -> Dict[str, Any]:
+        """
+        Get the scheduler's metrics.
+        :return: The metrics.
+        """
+        return {"pending": len(self.jobs), "running": len(self.running_tasks),
+                "orphaned": sum(len(jobs) for jobs in self.orphaned.values()),
+                "backlog": {name: len(handler.backlog) for name, handler in self.handlers.items() if handler.backlog}}
+
+    def _add(self, job: PendingJob) -> None:
+        """
+        Add a job to the in-memory index.
+        """
+        existing = self.jobs.get(job.job_id)
+        self.jobs[job.job_id] = job
+
+        # A job updated without changing its due time keeps its run time, and still has a valid heap entry.
+        if existing is not None and existing.due_at == job.due_at:
+            job.run_at = existing.run_at
+            return
+
+        self._push(job)
+
+    def _push(self, job: PendingJob) -> None:
+        """
+        Push a job's run time onto the heap. Older entries for the same job are skipped once they come up.
+        """
+        heapq.heappush(self.heap, (job.run_at, job.job_id))
+
+        if self.heap[0][1] == job.job_id:
+            self.wakeup.set()
+
+    async def run_loop(self) -> None:
+        """
+        Start jobs as they become due.
+        """
+        while True:
+            if not self.heap:
+                self.wakeup.clear()
+                await self.wakeup.wait()
+                continue
+
+            run_at, job_id = self.heap[0]
+            delay = run_at - time.time()
+            if delay > 0:
+                self.wakeup.clear()
+                try:
+                    await asyncio.wait_for(self.wakeup.wait(), timeout=delay)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+
+            heapq.heappop(self.heap)
+
+            job = self.jobs.get(job_id)
+            if job is None or job.run_at != run_at:
+                # Cancelled or rescheduled since this entry was pushed.
+                continue
+
+            handler = self.handlers.get(job.handler)
+            if handler is None:
+                if job.handler not in self.orphaned:
+                    self.logger.warning(f"No handler registered for jobs of {job.handler}. "
+                                        f"They will run once the handler is registered.")
+                self.orphaned.setdefault(job.handler, []).append(job)
+                continue
+
+            self._dispatch(job, handler)
+
+    def _dispatch(self, job: PendingJob, handler: JobHandler) -> None:
+        """
+        Run a due job, or put it in its handler's backlog if the handler is at its concurrency limit.
+        """
+        if handler.running >= handler.max_concurrency:
+            handler.backlog.append(job)
+            return
+
+        handler.running += 1
+        task = asyncio.create_task(self._run_job(job, handler), name=f"Job {job.job_id} ({job.handler})")
+        self.running_tasks.add(task)
+        task.add_done_callback(self.running_tasks.discard)
+
+    async def _run_job(self, job: PendingJob, handler: JobHandler) -> None:
+        """
+        Run a job, then reschedule or delete it.
+        """
+        try:
+            missed = time.time() - job.run_at > self.misfire_grace
+            if missed and job.catch_up == CatchUpPolicy.SKIP:
+                self.logger.info(f"Skipping missed run of job {job.job_id} ({job.handler}).")
+            else:
+                await handler.func(job.payload)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            self.logger.exception(f"Job {job.job_id} ({job.handler}) failed.", exc_info=e)
+        finally:
+            handler.running -= 1
+
+        try:
+            self._reschedule(job)
+        except Exception as e:
+            self.logger.exception(f"Failed to reschedule job {job.job_id} ({job.handler}).", exc_info=e)
+
+        while handler.backlog and handler.running < handler.max_concurrency:
+            backlog_job = handler.backlog.popleft()
+            if backlog_job.job_id in self.jobs:
+                self._dispatch(backlog_job, handler)
+
+    def _reschedule(self, job: PendingJob) -> None:
+        """
+        Compute a job's next run and persist it, or delete the job if it does not recur.
+        """
+        # The job may have been updated or cancelled while it was running.
+        job = self.jobs.get(job.job_id)
+        if job is None:
+            return
+
+        if job.interval is None:
+            del self.jobs[job.job_id]
+            self.rescheduled.pop(job.job_id, None)
+            self.completed.add(job.job_id)
+            self._schedule_flush()
+            return
+
+        now = time.time()
+        next_due = job.due_at + job.interval
+        if next_due < now - self.misfire_grace and job.catch_up != CatchUpPolicy.ALL:
+            # Skip ahead to the first run that is not missed.
+            missed_runs = (now - next_due) // job.interval + 1
+            next_due += missed_runs * job.interval
+
+        job.due_at = next_due
+        job.run_at = next_due + random.uniform(0, job.jitter) if job.jitter else next_due
+        self._push(job)
+
+        self.rescheduled[job.job_id] = next_due
+        self._schedule_flush()
+
+    def _schedule_flush(self) -> None:
+        """
+        Schedule persisting completed runs, if not scheduled yet.
+        """
+        if self.flush_handle is None:
+            self.flush_handle = asyncio.get_running_loop().call_later(self.flush_delay, self._start_flush)
+
+    def _start_flush(self) -> None:
+        """
+        Start persisting completed runs in the background.
+        """
+        self.flush_handle = None
+        task = asyncio.create_task(self.flush(), name="JobScheduler flush")
+        self.flush_tasks.add(task)
+        task.add_done_callback(self.flush_tasks.discard)
+
+    async def flush(self) -> None:
+        """
+        Persist completed runs: delete finished one-off jobs and store the next due time of recurring jobs.
+        """
+        if self.flush_handle is not None:
+            self.flush_handle.cancel()
+            self.flush_handle = None
+
+        # One flush at a time, so a later due time is never overwritten by an earlier one.
+        async with self.flush_lock:
+            completed, self.completed = self.completed, set()
+            rescheduled, self.rescheduled = self.rescheduled, {}
+            if not completed and not rescheduled:
+                return
+
+            try:
+                await self.run_in_thread(self._persist_runs, completed, rescheduled)
+            except Exception as e:
+                self.logger.exception("Failed to persist completed jobs. Retrying later.", exc_info=e)
+                self.completed |= completed
+                self.rescheduled = {**rescheduled, **self.rescheduled}
+                self._schedule_flush()
+
+    def _persist_runs(self, completed: set, rescheduled: Dict[int, float]) -> None:
+        """
+        Delete finished one-off jobs and store the next due time of recurring jobs. Blocking.
+        """
+        with self.database_handler.engine.begin() as connection:
+            if completed:
+                connection.execute(delete(ScheduledJob).where(ScheduledJob.row_id.in_(completed)))
+            if rescheduled:
+                connection.execute(
+                    update(ScheduledJob).where(ScheduledJob.row_id == bindparam("job_id")).values(
+                        due_at=bindparam("next_due")),
+                    [{"job_id": job_id, "next_due": next_due} for job_id, next_due in rescheduled.items()])
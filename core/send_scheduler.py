@@ -0,0 +1,390 @@
+"""
+Prioritised scheduler for outbound REST calls, so log traffic can't starve replies to users.
+"""
+
+import asyncio
+import heapq
+from collections import deque
+from contextlib import nullcontext
+from enum import IntEnum
+from itertools import count
+from time import monotonic
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+import discord
+
+from utils.logging import get_logger_for
+from utils.tracing import current_trace, span
+
+MAX_MESSAGE_LENGTH = 2000
+MAX_MESSAGE_EMBEDS = 10
+MAX_EMBEDS_LENGTH = 6000
+"""Maximum total length of the embeds of a message, as counted by len(embed)."""
+MAX_EMBED_DESCRIPTION_LENGTH = 4096
+
+no_span = nullcontext()
+"""Reusable context used instead of a span outside of traces."""
+
+
+class SendPriority(IntEnum):
+    """
+    Priority classes for outbound sends. Lower values are sent first.
+    """
+    INTERACTION = 0
+    USER = 1
+    LOG = 2
+
+
+class SendJob:
+    """
+    A queued send.
+    """
+
+    __slots__ = ("priority", "sequence", "send", "future", "destination", "content", "embeds", "enqueued_at",
+                 "deferred")
+
+    def __init__(self, priority: SendPriority, sequence: int, send: Optional[Callable[[], Awaitable[Any]]],
+                 future: asyncio.Future, destination: Optional[discord.abc.Messageable] = None,
+                 content: Optional[str] = None, embeds: Optional[List[discord.Embed]] = None):
+        self.priority = priority
+        self.sequence = sequence
+        self.send = send
+        self.future = future
+        self.destination = destination
+        self.content = content
+        self.embeds = embeds or []
+        self.enqueued_at = monotonic()
+        self.deferred = False
+
+    def __lt__(self, other: "SendJob") -> bool:
+        return (self.priority, self.sequence) < (other.priority, other.sequence)
+
+    def can_absorb(self, content: Optional[str], embeds: List[discord.Embed]) -> bool:
+        """
+        Whether another message to the same destination fits into this one.
+        :param content: Content of the other message.
+        :param embeds: Embeds of the other message.
+        :return: Whether the message fits.
+        """
+        length = len(self.content or "") + len(content or "") + 1
+        embeds_length = sum(len(embed) for embed in self.embeds) + sum(len(embed) for embed in embeds)
+        return (length <= MAX_MESSAGE_LENGTH and len(self.embeds) + len(embeds) <= MAX_MESSAGE_EMBEDS
+                and embeds_length <= MAX_EMBEDS_LENGTH)
+
+    def absorb(self, content: Optional[str], embeds: List[discord.Embed]) -> None:
+        """
+        Merge another message to the same destination into this one.
+        :param content: Content of the other message.
+        :param embeds: Embeds of the other message.
+        """
+        if content:
+            self.content = f"{self.content}\n{content}" if self.content else content
+        self.embeds.extend(embeds)
+
+    async def run(self) -> Any:
+        """
+        Perform the send.
+        :return: The result of the send.
+        """
+        if self.send is not None:
+            return await self.send()
+
+        return await self.destination.send(content=self.content, embeds=self.embeds)
+
+
+class SendScheduler:
+    """
+    Schedules outbound REST calls by priority.
+
+    All sends made through the scheduler share a budget of requests per second and a number of concurrency slots.
+    Interaction responses and user messages are always sent as soon as a slot is free. Low priority sends (logs, DMs)
+    can't use the reserved headroom of either: they are deferred while the recent request rate leaves less than the
+    headroom, and never hold more slots than the headroom leaves, so slow log sends can't hold up interaction responses.
+    Queued low priority messages to the same destination are coalesced into one.
+    """
+
+    def __init__(self, max_concurrency: int = 8, requests_per_second: float = 40.0,
+                 low_priority_headroom: float = 0.25):
+        """
+        :param max_concurrency: Maximum number of sends in flight.
+        :param requests_per_second: Request budget shared by all sends.
+        :param low_priority_headroom: Fraction of the budget and concurrency slots low priority sends can't use.
+        """
+        self.logger = get_logger_for(self)
+
+        self.max_concurrency = max_concurrency
+        self.requests_per_second = requests_per_second
+        self.low_priority_headroom = low_priority_headroom
+        # At least one slot is always kept free for interaction responses and user messages.
+        self.low_priority_concurrency = max(1, min(max_concurrency - 1,
+                                                   int(max_concurrency * (1 - low_priority_headroom))))
+
+        self.queue: List[SendJob] = []
+        self.queued = {priority: 0 for priority in SendPriority}
+        self.coalescable: Dict[int, SendJob] = {}
+        self.recent_sends = deque()
+
+        self.sequence = count()
+        self.wakeup = asyncio.Event()
+        self.slot_freed = asyncio.Event()
+        self.active = 0
+        self.active_low_priority = 0
+        self.dispatcher: Optional[asyncio.Task] = None
+        self.in_flight = set()
+
+        self.sent = 0
+        self.failed = 0
+        self.deferred = 0
+        self.coalesced = 0
+        self.max_queue_depth = 0
+        self.wait_time = {priority: 0.0 for priority in SendPriority}
+
+    @property
+    def running(self) -> bool:
+        """
+        Returns whether the dispatcher is running.
+        """
+        return self.dispatcher is not None and not self.dispatcher.done()
+
+    def start(self) -> None:
+        """
+        Start the dispatcher. Until it is started, sends are performed immediately.
+        """
+        if self.running:
+            return
+
+        self.dispatcher = asyncio.create_task(self.dispatch_loop(), name="SendScheduler dispatcher")
+
+    async def close(self, drain_timeout: float = 5.0) -> None:
+        """
+        Stop the dispatcher. Queued sends, such as logs, are started right away, and waited for up to `drain_timeout`
+        seconds together with the sends in flight. Sends still unfinished after that are cancelled.
+        :param drain_timeout: Seconds to wait for queued and in-flight sends.
+        """
+        if self.dispatcher is not None:
+            self.dispatcher.cancel()
+            self.dispatcher = None
+
+        queue, self.queue = sorted(self.queue), []
+        self.queued = {priority: 0 for priority in SendPriority}
+        self.coalescable.clear()
+
+        # Without the dispatcher, the rate budget isn't enforced anymore: discord.py still waits on actual rate limits.
+        for job in queue:
+            self._start_job(job, holds_slot=False)
+
+        if not self.in_flight:
+            return
+
+        _, pending = await asyncio.wait(list(self.in_flight), timeout=drain_timeout)
+        if pending:
+            self.logger.warning(f"Cancelling {len(pending)} send(s) unfinished after {drain_timeout}s on shutdown.")
+            for task in pending:
+                task.cancel()
+
+    async def run(self, priority: SendPriority, send: Callable[[], Awaitable[Any]]) -> Any:
+        """
+        Schedule an arbitrary REST call, such as an interaction response or a reply, and wait for it.
+        :param priority: The priority of the call.
+        :param send: Function returning the awaitable to schedule.
+        :return: The result of the call.
+        """
+        # Time spent queued and sending counts towards the command's trace.
+        with span("send", priority=priority.name.lower()) if current_trace.get() is not None else no_span:
+            # Fast path: nothing of the same or higher priority is waiting and a slot is free, so perform the call
+            # inline, without a job or future.
+            if self._can_skip_queue(priority):
+                self.active += 1
+                self.recent_sends.append(monotonic())
+                try:
+                    result = await send()
+                except Exception:
+                    self.failed += 1
+                    raise
+                finally:
+                    self.active -= 1
+                    self.slot_freed.set()
+
+                self.sent += 1
+                return result
+
+            return await self._enqueue(SendJob(priority, next(self.sequence), send, self._create_future()))
+
+    def send(self, destination: discord.abc.Messageable, priority: SendPriority = SendPriority.LOG,
+             content: Optional[str] = None, embed: Optional[discord.Embed] = None) -> asyncio.Future:
+        """
+        Schedule a message. Low priority messages may be coalesced with queued messages to the same destination.
+        :param destination: The channel or user to send to.
+        :param priority: The priority of the message.
+        :param content: The content of the message.
+        :param embed: The embed of the message.
+        :return: Future resolving to the sent message.
+        """
+        embeds = [embed] if embed is not None else []
+        key = getattr(destination, "id", None)
+
+        if priority >= SendPriority.LOG and key is not None and self.running:
+            job = self.coalescable.get(key)
+            if job is not None and job.can_absorb(content, embeds):
+                job.absorb(content, embeds)
+                self.coalesced += 1
+                return job.future
+
+        job = SendJob(priority, next(self.sequence), None, self._create_future(), destination, content, embeds)
+        if priority >= SendPriority.LOG and key is not None and self.running:
+            self.coalescable[key] = job
+
+        return self._enqueue(job)
+
+    def get_metrics(self) -> Dict[str, Any]:
+        """
+        Get the scheduler's metrics.
+        :return: The metrics.
+        """
+        return {"queue_depth": {priority.name: queued for priority, queued in self.queued.items()},
+                "max_queue_depth": self.max_queue_depth, "in_flight": len(self.in_flight),
+                "sent": self.sent, "failed": self.failed, "deferred": self.deferred, "coalesced": self.coalesced,
+                "total_wait_time": {priority.name: round(wait, 3) for priority, wait in self.wait_time.items()}}
+
+    def _create_future(self) -> asyncio.Future:
+        """
+        Create a future for a send. Failures are logged by the scheduler, so they don't need to be retrieved.
+        """
+        future = asyncio.get_running_loop().create_future()
+        future.add_done_callback(lambda f: f.cancelled() or f.exception())
+        return future
+
+    def _enqueue(self, job: SendJob) -> asyncio.Future:
+        """
+        Queue a job, or perform it immediately if the dispatcher is not running.
+        """
+        if not self.running:
+            self._start_job(job, holds_slot=False)
+            return job.future
+
+        if self._can_skip_queue(job.priority):
+            self._start_job(job, holds_slot=True)
+            return job.future
+
+        heapq.heappush(self.queue, job)
+        self.queued[job.priority] += 1
+        self.max_queue_depth = max(self.max_queue_depth, len(self.queue))
+        self.wakeup.set()
+        return job.future
+
+    def _can_skip_queue(self, priority: SendPriority) -> bool:
+        """
+        Whether a send can be started right away: nothing of the same or higher priority is waiting and a slot is free.
+        """
+        if not self.running or priority >= SendPriority.LOG or self.active >= self.max_concurrency:
+            return False
+
+        return not any(queued for queued_priority, queued in self.queued.items() if queued_priority <= priority)
+
+    def _recent_usage(self) -> int:
+        """
+        Get the number of sends started in the last second.
+        """
+        horizon = monotonic() - 1.0
+        while self.recent_sends and self.recent_sends[0] < horizon:
+            self.recent_sends.popleft()
+        return len(self.recent_sends)
+
+    def _low_priority_delay(self) -> float:
+        """
+        Get the time until low priority sends may use the budget again, or 0 if they may now.
+        """
+        low_priority_budget = self.requests_per_second * (1 - self.low_priority_headroom)
+        if self._recent_usage() < low_priority_budget:
+            return 0.0
+
+        return max(0.0, self.recent_sends[0] + 1.0 - monotonic())
+
+    async def dispatch_loop(self) -> None:
+        """
+        Dispatch queued jobs in priority order.
+        """
+        while True:
+            if not self.queue:
+                self.wakeup.clear()
+                await self.wakeup.wait()
+                continue
+
+            if self.active >= self.max_concurrency:
+                self.slot_freed.clear()
+                await self.slot_freed.wait()
+                continue
+
+            job = self.queue[0]
+            if job.priority >= SendPriority.LOG:
+                if self.active_low_priority >= self.low_priority_concurrency:
+                    # Higher priority jobs don't need this loop while slots are free, see _can_skip_queue.
+                    self.slot_freed.clear()
+                    await self.slot_freed.wait()
+                    continue
+
+                delay = self._low_priority_delay()
+                if delay > 0:
+                    if not job.deferred:
+                        job.deferred = True
+                        self.deferred += 1
+
+                    # Wake up early if a higher priority job arrives.
+                    self.wakeup.clear()
+                    try:
+                        await asyncio.wait_for(self.wakeup.wait(), timeout=delay)
+                    except asyncio.TimeoutError:
+                        pass
+                    continue
+
+            heapq.heappop(self.queue)
+            self.queued[job.priority] -= 1
+            if self.coalescable.get(getattr(job.destination, "id", None)) is job:
+                del self.coalescable[job.destination.id]
+
+            self._start_job(job, holds_slot=True)
+
+    def _start_job(self, job: SendJob, holds_slot: bool) -> None:
+        """
+        Start performing a job in the background.
+        :param job: The job.
+        :param holds_slot: Whether the job holds a concurrency slot, to release when done.
+        """
+        if holds_slot:
+            self.active += 1
+            if job.priority >= SendPriority.LOG:
+                self.active_low_priority += 1
+
+        self.wait_time[job.priority] += monotonic() - job.enqueued_at
+        self.recent_sends.append(monotonic())
+
+        task = asyncio.create_task(self._perform(job, holds_slot))
+        self.in_flight.add(task)
+        task.add_done_callback(self.in_flight.discard)
+
+    async def _perform(self, job: SendJob, holds_slot: bool) -> None:
+        """
+        Perform a job and resolve its future.
+        :param job: The job.
+        :param holds_slot: Whether the job holds a concurrency slot, to release when done.
+        """
+        try:
+            result = await job.run()
+        except Exception as e:
+            self.failed += 1
+            self.logger.error(f"{job.priority.name} send failed: {e}")
+            if not job.future.done():
+                job.future.set_exception(e)
+        else:
+            self.sent += 1
+            if not job.future.done():
+                job.future.set_result(result)
+        finally:
+            # Cancelled on shutdown: cancel the future too, so nothing waits on it.
+            if not job.future.done():
+                job.future.cancel()
+            if holds_slot:
+                self.active -= 1
+                if job.priority >= SendPriority.LOG:
+                    self.active_low_priority -= 1
+                self.slot_freed.set()
@@ -1,8 +1,9 @@
 """
 Database connection and initialisation.
 """
-from sqlalchemy import create_engine
+from sqlalchemy import MetaData, Table, create_engine, inspect, insert, make_url, select, text
 from sqlalchemy.orm import sessionmaker, scoped_session, close_all_sessions
+from sqlalchemy.pool import StaticPool
 
 from entities import Base
 from utils.logging import get_logger_for
@@ -26,7 +27,14 @@ class DatabaseHandler:
             raise ValueError("Database URL not provided.")
 
         self.logger.debug("Creating engine...")
-        self.database_engine = create_engine(database_url)
+        url = make_url(database_url)
+        if url.get_backend_name() == "sqlite" and url.database in (None, "", ":memory:"):
+            # Every connection to an in-memory database is a separate database, so share one across threads (e.g. for
+            # batch writes in the thread pool).
+            self.database_engine = create_engine(database_url, poolclass=StaticPool,
+                                                 connect_args={"check_same_thread": False})
+        else:
+            self.database_engine = create_engine(database_url)
         self.logger.debug(f"Engine created: {self.database_engine.url}")
 
         self.logger.debug("Creating session maker...")
@@ -73,8 +81,50 @@ class DatabaseHandler:
         Base.metadata.create_all(self.database_engine, checkfirst=True)
         self.logger.debug("Tables created.")
 
+        self.migrate_primary_keys()
+
         self.logger.info("Database initialised.")
 
+    def migrate_primary_keys(self):
+        """
+        Migrate existing tables whose primary key lacks columns that were added to it, as create_all doesn't change
+        existing tables. The rows are copied to a new table, which then replaces the old one.
+        Tables whose primary key lost columns can't be migrated automatically; starting is refused instead.
+        """
+        inspector = inspect(self.database_engine)
+        for table in Base.metadata.sorted_tables:
+            if not inspector.has_table(table.name):
+                continue
+
+            existing = set(inspector.get_pk_constraint(table.name)["constrained_columns"])
+            expected = {column.name for column in table.primary_key.columns}
+            if existing == expected:
+                continue
+
+            if not existing <= expected:
+                raise RuntimeError(f"The primary key of table {table.name} changed from {sorted(existing)} to "
+                                   f"{sorted(expected)}, which can't be migrated automatically. Migrate it manually "
+                                   f"before starting the bot.")
+
+            self.logger.warning(f"Migrating the primary key of table {table.name} from {sorted(existing)} to "
+                                f"{sorted(expected)}...")
+
+            # The old primary key is part of the new one, so the copied rows stay unique.
+            with self.database_engine.begin() as connection:
+                old_table = Table(table.name, MetaData(), autoload_with=connection)
+                new_table = table.to_metadata(MetaData(), name=f"{table.name}_migrating")
+                new_table.create(connection)
+
+                columns = [column.name for column in table.columns if column.name in old_table.columns]
+                connection.execute(insert(new_table).from_select(
+                    columns, select(*(old_table.c[name] for name in columns))))
+                old_table.drop(connection)
+
+                quote = connection.dialect.identifier_preparer.quote
+                connection.execute(text(f"ALTER TABLE {quote(new_table.name)} RENAME TO {quote(table.name)}"))
+
+            self.logger.warning(f"Migrated table {table.name}.")
+
     def close(self):
         """
         Close the database connection.
@@ -0,0 +1,52 @@
+from sqlalchemy import Column, String, Float, Integer, BigInteger, Boolean, PrimaryKeyConstraint
+
+from base.entities.row_identified import RowIdentified
+from entities import Base
+
+
+class CommandUsageEvent(RowIdentified, Base):
+    """
+    Table for storing raw command usage events. Rows are written in batches, rolled up into CommandUsageMinutes and
+    CommandUsageDays, and deleted after the retention period. Queries should use the rollups instead.
+    """
+    __tablename__ = "CommandUsageEvents"
+
+    occurred_at = Column(Float, nullable=False, index=True)
+    command_name = Column(String, nullable=False)
+    guild_id = Column(BigInteger, nullable=False, default=0)
+    user_id = Column(BigInteger, nullable=False)
+    duration_ms = Column(Float, nullable=False)
+    success = Column(Boolean, nullable=False)
+
+
+class CommandUsageRollup:
+    """
+    Base class for tables holding command usage totals per period, command and server (0 for DMs). The period leads
+    the primary key, so queries over a time range are index range scans.
+    """
+    command_name = Column(String, nullable=False)
+    guild_id = Column(BigInteger, nullable=False, default=0)
+    uses = Column(Integer, nullable=False, default=0)
+    failures = Column(Integer, nullable=False, default=0)
+    total_duration_ms = Column(Float, nullable=False, default=0.0)
+    max_duration_ms = Column(Float, nullable=False, default=0.0)
+
+
+class CommandUsageMinute(CommandUsageRollup, Base):
+    """
+    Table for storing command usage per minute. `minute` is the UNIX time of the start of the minute.
+    """
+    __tablename__ = "CommandUsageMinutes"
+    __table_args__ = (PrimaryKeyConstraint("minute", "command_name", "guild_id"),)
+
+    minute = Column(Integer, nullable=False)
+
+
+class CommandUsageDay(CommandUsageRollup, Base):
+    """
+    Table for storing command usage per day (UTC). `day` is the UNIX time of the start of the day.
+    """
+    __tablename__ = "CommandUsageDays"
+    __table_args__ = (PrimaryKeyConstraint("day", "command_name", "guild_id"),)
+
+    day = Column(Integer, nullable=False)
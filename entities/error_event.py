@@ -0,0 +1,40 @@
+from sqlalchemy import Column, String, Float, Integer, BigInteger, Text, Index
+
+from base.entities.row_identified import RowIdentified
+from entities import Base
+
+
+class ErrorEvent(RowIdentified, Base):
+    """
+    Table for storing command errors. Rows are written in batches by ErrorCog, and browsed newest first by row id.
+    Only the first error of a group since the last digest has its traceback stored.
+    """
+    __tablename__ = "ErrorEvents"
+    __table_args__ = (Index("ix_ErrorEvents_fingerprint_row_id", "fingerprint", "row_id"),)
+
+    fingerprint = Column(String, nullable=False)
+    occurred_at = Column(Float, nullable=False)
+    error_type = Column(String, nullable=False)
+    command_name = Column(String, nullable=True)
+    message = Column(Text, nullable=False, default="")
+    user_id = Column(BigInteger, nullable=True)
+    guild_id = Column(BigInteger, nullable=True)
+    channel_id = Column(BigInteger, nullable=True)
+    context = Column(Text, nullable=False, default="{}")
+    traceback = Column(Text, nullable=True)
+
+
+class ErrorEventGroup(Base):
+    """
+    Table for storing the totals of errors sharing a fingerprint. Browsed by most recently seen.
+    """
+    __tablename__ = "ErrorEventGroups"
+    __table_args__ = (Index("ix_ErrorEventGroups_last_seen_fingerprint", "last_seen", "fingerprint"),)
+
+    fingerprint = Column(String, primary_key=True)
+    error_type = Column(String, nullable=False)
+    command_name = Column(String, nullable=True)
+    message = Column(Text, nullable=False, default="")
+    count = Column(Integer, nullable=False, default=0)
+    first_seen = Column(Float, nullable=False)
+    last_seen = Column(Float, nullable=False)
@@ -0,0 +1,16 @@
+from sqlalchemy import Column, String, Float, Boolean
+
+from entities import Base
+
+
+class RateLimitBucket(Base):
+    """
+    Table for storing token buckets used by shared cooldowns, so they hold across processes and restarts.
+    Tokens are refilled lazily from the time of the last update, so buckets are only written when they are used.
+    """
+    __tablename__ = "RateLimitBuckets"
+
+    key = Column(String, primary_key=True)
+    tokens = Column(Float, nullable=False)
+    updated_at = Column(Float, nullable=False, index=True)
+    allowed = Column(Boolean, nullable=False, default=True)
@@ -0,0 +1,20 @@
+from sqlalchemy import Column, String, Float
+
+from base.entities.row_identified import RowIdentified
+from base.entities.tracks_creation import TracksCreation
+from entities import Base
+
+
+class ScheduledJob(RowIdentified, TracksCreation, Base):
+    """
+    Table for storing jobs scheduled through the job scheduler, so they survive restarts.
+    """
+    __tablename__ = "ScheduledJobs"
+
+    handler = Column(String, nullable=False)
+    payload = Column(String, nullable=False, default="null")
+    due_at = Column(Float, nullable=False, index=True)
+    interval = Column(Float, nullable=True)
+    jitter = Column(Float, nullable=False, default=0.0)
+    catch_up = Column(String, nullable=False, default="once")
+    key = Column(String, nullable=True, unique=True)
@@ -1,6 +1,6 @@
-from typing import Optional
+from typing import Dict, List, Optional, Tuple
 
-from sqlalchemy import Column, String
+from sqlalchemy import Column, String, select
 
 from base.entities.server_identified import ServerIdentified
 from entities import Base
@@ -12,7 +12,7 @@ class ServerSetting(Base, ServerIdentified):
     """
     __tablename__ = "ServerSettings"
 
-    key = Column(String, nullable=False)
+    key = Column(String, primary_key=True)
     value = Column(String, nullable=False, default="")
 
 
@@ -41,6 +41,47 @@ def get_setting(server_id: int, key: str, default_value: Optional[str] = None) -
     return server_settings_cache[setting_key] or default_value
 
 
+def fetch_settings(bot, keys: List[Tuple[int, str]]) -> Dict[Tuple[int, str], str]:
+    """
+    Fetch settings of several servers from the database in one query. Blocking.
+    :param bot: The bot instance.
+    :param keys: The IDs of the servers and keys of the settings.
+    :return: The values of the settings that exist, by server ID and key.
+    """
+    query = select(ServerSetting.server_id, ServerSetting.key, ServerSetting.value).where(
+        ServerSetting.server_id.in_({server_id for server_id, _ in keys}),
+        ServerSetting.key.in_({key for _, key in keys}))
+    with bot.database_handler.engine.connect() as connection:
+        rows = connection.execute(query).all()
+
+    # The query may match combinations of IDs and keys that weren't asked for; they are simply not used.
+    return {(server_id, key): value for server_id, key, value in rows}
+
+
+async def load_setting(bot, server_id: int, key: str, default_value: Optional[str] = None) -> Optional[str]:
+    """
+    Get a setting without blocking the event loop. Settings loaded concurrently are fetched in one query.
+    :param bot: The bot instance.
+    :param server_id: The ID of the server.
+    :param key: The key of the setting.
+    :param default_value: The default value of the setting.
+    :return: The value of the setting.
+    """
+    setting_key = (server_id, key)
+    if setting_key in server_settings_cache:
+        return server_settings_cache[setting_key]
+
+    value = await bot.get_data_loader("server_settings", lambda keys: fetch_settings(bot, keys)).load(setting_key)
+
+    if value is None:
+        return default_value
+
+    # A setting set while it was being loaded keeps its new value.
+    server_settings_cache.setdefault(setting_key, value)
+
+    return server_settings_cache[setting_key] or default_value
+
+
 def set_setting(bot, server_id: int, key: str, value: str) -> None:
     """
     Set a setting in the database.
@@ -53,10 +94,10 @@ def set_setting(bot, server_id: int, key: str, value: str) -> None:
 
     if setting is None:
         setting = ServerSetting(server_id=server_id, key=key, value=value)
-        bot.session.add(setting)
+        bot.database_session.add(setting)
     else:
         setting.value = value
 
-    bot.session.commit()
+    bot.database_session.commit()
 
     server_settings_cache[(server_id, key)] = value
@@ -1,6 +1,6 @@
-from typing import Optional
+from typing import Dict, List, Optional
 
-from sqlalchemy import Column, String
+from sqlalchemy import Column, String, select
 
 from entities import Base
 
@@ -47,6 +47,39 @@ def get_setting(key: str, default_value: Optional[str] = None) -> Optional[str]:
     return settings_cache[key] or default_value
 
 
+def fetch_settings(bot, keys: List[str]) -> Dict[str, str]:
+    """
+    Fetch settings from the database in one query. Blocking.
+    :param bot: The bot instance.
+    :param keys: The keys of the settings.
+    :return: The values of the settings that exist, by key.
+    """
+    with bot.database_handler.engine.connect() as connection:
+        return dict(connection.execute(select(Setting.key, Setting.value).where(Setting.key.in_(keys))).all())
+
+
+async def load_setting(bot, key: str, default_value: Optional[str] = None) -> Optional[str]:
+    """
+    Get a setting without blocking the event loop. Settings loaded concurrently are fetched in one query.
+    :param bot: The bot instance.
+    :param key: The key of the setting.
+    :param default_value: The default value of the setting.
+    :return: The value of the setting.
+    """
+    if key in settings_cache:
+        return settings_cache[key]
+
+    value = await bot.get_data_loader("settings", lambda keys: fetch_settings(bot, keys)).load(key)
+
+    if value is None:
+        return default_value
+
+    # A setting set while it was being loaded keeps its new value.
+    settings_cache.setdefault(key, value)
+
+    return settings_cache[key] or default_value
+
+
 def set_setting(bot, key: str, value: str) -> None:
     """
     Set a setting in the database.
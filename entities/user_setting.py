@@ -1,6 +1,6 @@
-from typing import Optional
+from typing import Dict, List, Optional, Tuple
 
-from sqlalchemy import Column, String
+from sqlalchemy import Column, String, select
 
 from base.entities.user_identified import UserIdentified
 from entities import Base
@@ -12,7 +12,7 @@ class UserSetting(Base, UserIdentified):
     """
     __tablename__ = "UserSettings"
 
-    key = Column(String, nullable=False)
+    key = Column(String, primary_key=True)
     value = Column(String, nullable=False, default="")
 
 
@@ -41,6 +41,46 @@ def get_setting(user_id: int, key: str, default_value: Optional[str] = None) ->
     return user_settings_cache[setting_key] or default_value
 
 
+def fetch_settings(bot, keys: List[Tuple[int, str]]) -> Dict[Tuple[int, str], str]:
+    """
+    Fetch settings of several users from the database in one query. Blocking.
+    :param bot: The bot instance.
+    :param keys: The IDs of the users and keys of the settings.
+    :return: The values of the settings that exist, by user ID and key.
+    """
+    query = select(UserSetting.user_id, UserSetting.key, UserSetting.value).where(
+        UserSetting.user_id.in_({user_id for user_id, _ in keys}), UserSetting.key.in_({key for _, key in keys}))
+    with bot.database_handler.engine.connect() as connection:
+        rows = connection.execute(query).all()
+
+    # The query may match combinations of IDs and keys that weren't asked for; they are simply not used.
+    return {(user_id, key): value for user_id, key, value in rows}
+
+
+async def load_setting(bot, user_id: int, key: str, default_value: Optional[str] = None) -> Optional[str]:
+    """
+    Get a setting without blocking the event loop. Settings loaded concurrently are fetched in one query.
+    :param bot: The bot instance.
+    :param user_id: The ID of the user.
+    :param key: The key of the setting.
+    :param default_value: The default value of the setting.
+    :return: The value of the setting.
+    """
+    setting_key = (user_id, key)
+    if setting_key in user_settings_cache:
+        return user_settings_cache[setting_key]
+
+    value = await bot.get_data_loader("user_settings", lambda keys: fetch_settings(bot, keys)).load(setting_key)
+
+    if value is None:
+        return default_value
+
+    # A setting set while it was being loaded keeps its new value.
+    user_settings_cache.setdefault(setting_key, value)
+
+    return user_settings_cache[setting_key] or default_value
+
+
 def set_setting(bot, user_id: int, key: str, value: str) -> None:
     """
     Set a setting in the database.
@@ -53,10 +93,10 @@ def set_setting(bot, user_id: int, key: str, value: str) -> None:
 
     if setting is None:
         setting = UserSetting(user_id=user_id, key=key, value=value)
-        bot.session.add(setting)
+        bot.database_session.add(setting)
     else:
         setting.value = value
 
-    bot.session.commit()
+    bot.database_session.commit()
 
     user_settings_cache[(user_id, key)] = value
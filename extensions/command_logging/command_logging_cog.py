@@ -1,18 +1,73 @@
+import time
+from time import perf_counter
+from typing import Any, Dict, List, Optional, Tuple
+
 import discord
+from discord import app_commands
 from discord.ext import commands
+from sqlalchemy import select, update, insert, delete, bindparam, case, func
 
 from base.base_cog import BaseCog
 from core.bot import MyBot
+from core.job_scheduler import CatchUpPolicy
+from entities.command_usage import CommandUsageEvent, CommandUsageMinute, CommandUsageDay
+from entities.setting import Setting, settings_cache
+from utils.checks.is_owner import is_owner
 
 
 class CommandLoggingCog(BaseCog):
     """
     CommandLoggingCog is a cog that logs command usage.
+
+    Every command run is also recorded as a usage event (command, server, user, duration, success). Events are written
+    in batches, and a scheduler job rolls them up into per-minute and per-day totals, continuing from a watermark (the
+    last rolled up event). Usage queries only read the rollups.
     """
 
+    rollup_interval = 60.0
+    """Seconds between rollups."""
+    rollup_batch_size = 10000
+    """Maximum number of events rolled up per transaction."""
+    rollup_watermark_key = "CommandLoggingCog:usage_rollup_watermark"
+
+    usage_periods = {"hour": (CommandUsageMinute, 60 * 60), "day": (CommandUsageMinute, 24 * 60 * 60),
+                     "week": (CommandUsageDay, 7 * 24 * 60 * 60), "month": (CommandUsageDay, 30 * 24 * 60 * 60)}
+    """Rollup table and length in seconds of each period usage can be queried for."""
+
     def __init__(self, bot: MyBot) -> None:
         super().__init__(bot)
 
+        self.usage_writer = self.create_batch_writer("usage_events", self.write_usage_events)
+
+    async def post_init(self):
+        """
+        Schedule the usage rollup.
+        """
+        self.register_job_handler("rollup", self.roll_up_usage)
+        await self.schedule_job("rollup", interval=self.rollup_interval, catch_up=CatchUpPolicy.SKIP, key="rollup")
+
+    def record_usage(self, command_name: str, guild_id: Optional[int], user_id: int, started_at: Optional[float],
+                     success: bool) -> None:
+        """
+        Queue a usage event to be written.
+        :param command_name: Qualified name of the command.
+        :param guild_id: ID of the server, or None in DMs.
+        :param user_id: ID of the user.
+        :param started_at: perf_counter time the command started at, if known.
+        :param success: Whether the command completed successfully.
+        """
+        duration_ms = (perf_counter() - started_at) * 1000 if started_at is not None else 0.0
+        self.usage_writer.add({"occurred_at": time.time(), "command_name": command_name, "guild_id": guild_id or 0,
+                               "user_id": user_id, "duration_ms": duration_ms, "success": success})
+
+    def write_usage_events(self, events: List[Dict[str, Any]]) -> None:
+        """
+        Insert a batch of usage events. Runs in a worker thread.
+        :param events: The usage events.
+        """
+        with self.bot.database_handler.engine.begin() as connection:
+            connection.execute(insert(CommandUsageEvent), events)
+
     @commands.Cog.listener()
     async def on_command_completion(self, ctx: commands.Context) -> None:
         """
@@ -22,7 +77,24 @@ class CommandLoggingCog(BaseCog):
         if ctx.interaction:
             # Called as app command. Prevent logging twice.
             return
-        self.logger.info(f"{ctx.command} called successfully by {ctx.author}.")
+        self.logger.info(f"{ctx.command} called successfully by {ctx.author}.",
+                         extra={"command": ctx.command.qualified_name, "user_id": ctx.author.id,
+                                "guild_id": ctx.guild.id if ctx.guild else None, "channel_id": ctx.channel.id,
+                                "sampled": "command_completion"})
+        self.record_usage(ctx.command.qualified_name, ctx.guild.id if ctx.guild else None, ctx.author.id,
+                          getattr(ctx, "started_at", None), True)
+
+    @commands.Cog.listener()
+    async def on_command_error(self, ctx: commands.Context, error: commands.CommandError) -> None:
+        """
+        Event that triggers when a command fails.
+        :param ctx: Context.
+        :param error: Error.
+        """
+        if ctx.command is None or ctx.interaction:
+            return
+        self.record_usage(ctx.command.qualified_name, ctx.guild.id if ctx.guild else None, ctx.author.id,
+                          getattr(ctx, "started_at", None), False)
 
     @commands.Cog.listener()
     async def on_app_command_completion(self, interaction: discord.Interaction,
@@ -32,7 +104,177 @@ class CommandLoggingCog(BaseCog):
         :param interaction: The interaction object.
         :param command: The command object.
         """
-        self.logger.info(f"{command.name} called successfully by {interaction.user}.")
+        self.logger.info(f"{command.name} called successfully by {interaction.user}.",
+                         extra={"command": command.qualified_name, "user_id": interaction.user.id,
+                                "guild_id": interaction.guild_id, "channel_id": interaction.channel_id,
+                                "sampled": "command_completion"})
+        self.record_usage(command.qualified_name, interaction.guild_id, interaction.user.id,
+                          interaction.extras.get("started_at"), True)
+        self.finish_trace(interaction, True)
+
+    @commands.Cog.listener()
+    async def on_app_command_failure(self, interaction: discord.Interaction,
+                                     error: app_commands.AppCommandError) -> None:
+        """
+        Event that triggers when an app command fails. Dispatched by ErrorCog.
+        :param interaction: The interaction object.
+        :param error: The exception.
+        """
+        if interaction.command is None:
+            return
+        self.record_usage(interaction.command.qualified_name, interaction.guild_id, interaction.user.id,
+                          interaction.extras.get("started_at"), False)
+        self.finish_trace(interaction, False)
+
+    def finish_trace(self, interaction: discord.Interaction, success: bool) -> None:
+        """
+        Finish the trace of an app command, started by the command tree. Prefix command traces are finished by the bot.
+        :param interaction: The interaction object.
+        :param success: Whether the command succeeded.
+        """
+        trace = interaction.extras.pop("trace", None)
+        if trace is not None:
+            self.bot.tracer.finish_trace(trace, success)
+
+    async def roll_up_usage(self, payload: Any) -> None:
+        """
+        Roll up new usage events, and delete events and minutes past the retention period.
+        :param payload: Job payload. Unused.
+        """
+        while await self.run_in_thread(self.roll_up_usage_batch) >= self.rollup_batch_size:
+            pass
+
+        await self.run_in_thread(self.prune_usage)
+
+    def roll_up_usage_batch(self) -> int:
+        """
+        Add the next batch of events after the watermark to the rollups, and move the watermark past them, in one
+        transaction. Events are only inserted by the batch writer, one transaction at a time, so their row ids become
+        visible in order and no event is skipped. Runs in a worker thread.
+        :return: The number of events rolled up.
+        """
+        with self.bot.database_handler.engine.begin() as connection:
+            watermark = int(connection.execute(
+                select(Setting.value).where(Setting.key == self.rollup_watermark_key)).scalar() or 0)
+
+            events = connection.execute(
+                select(CommandUsageEvent).where(CommandUsageEvent.row_id > watermark).order_by(
+                    CommandUsageEvent.row_id).limit(self.rollup_batch_size)).all()
+            if not events:
+                return 0
+
+            minutes, days = {}, {}
+            for event in events:
+                for totals, period in ((minutes, int(event.occurred_at // 60 * 60)),
+                                       (days, int(event.occurred_at // 86400 * 86400))):
+                    key = (period, event.command_name, event.guild_id)
+                    uses, failures, total_duration, max_duration = totals.get(key, (0, 0, 0.0, 0.0))
+                    totals[key] = (uses + 1, failures + (not event.success), total_duration + event.duration_ms,
+                                   max(max_duration, event.duration_ms))
+
+            self.merge_rollup(connection, CommandUsageMinute, CommandUsageMinute.minute, minutes)
+            self.merge_rollup(connection, CommandUsageDay, CommandUsageDay.day, days)
+
+            watermark_value = str(events[-1].row_id)
+            if connection.execute(update(Setting).where(Setting.key == self.rollup_watermark_key).values(
+                    value=watermark_value)).rowcount == 0:
+                connection.execute(insert(Setting).values(key=self.rollup_watermark_key, value=watermark_value))
+
+        settings_cache.pop(self.rollup_watermark_key, None)
+        return len(events)
+
+    @staticmethod
+    def merge_rollup(connection, table, period_column, totals: Dict[Tuple[int, str, int], Tuple]) -> None:
+        """
+        Add totals to a rollup table: existing rows are incremented with one executemany update, new rows inserted.
+        :param connection: Connection, in a transaction.
+        :param table: The rollup table.
+        :param period_column: The table's period column.
+        :param totals: Uses, failures, total and maximum duration, by period, command name and server ID.
+        """
+        existing = set(connection.execute(
+            select(period_column, table.command_name, table.guild_id).where(
+                period_column.in_({period for period, _, _ in totals}))).tuples())
+
+        updates = [{"b_period": period, "b_command_name": command_name, "b_guild_id": guild_id, "b_uses": uses,
+                    "b_failures": failures, "b_total_duration_ms": total_duration, "b_max_duration_ms": max_duration}
+                   for (period, command_name, guild_id), (uses, failures, total_duration, max_duration)
+                   in totals.items() if (period, command_name, guild_id) in existing]
+        if updates:
+            connection.execute(
+                update(table).where(period_column == bindparam("b_period"),
+                                    table.command_name == bindparam("b_command_name"),
+                                    table.guild_id == bindparam("b_guild_id")).values(
+                    uses=table.uses + bindparam("b_uses"), failures=table.failures + bindparam("b_failures"),
+                    total_duration_ms=table.total_duration_ms + bindparam("b_total_duration_ms"),
+                    max_duration_ms=case((table.max_duration_ms < bindparam("b_max_duration_ms"),
+                                          bindparam("b_max_duration_ms")), else_=table.max_duration_ms)),
+                updates)
+
+        inserts = [{period_column.key: period, "command_name": command_name, "guild_id": guild_id, "uses": uses,
+                    "failures": failures, "total_duration_ms": total_duration, "max_duration_ms": max_duration}
+                   for (period, command_name, guild_id), (uses, failures, total_duration, max_duration)
+                   in totals.items() if (period, command_name, guild_id) not in existing]
+        if inserts:
+            connection.execute(insert(table), inserts)
+
+    def prune_usage(self) -> None:
+        """
+        Delete rolled up events and per-minute rollups older than the retention period. Runs in a worker thread.
+        """
+        cutoff = time.time() - self.bot.config.usage_retention_days * 24 * 60 * 60
+
+        with self.bot.database_handler.engine.begin() as connection:
+            watermark = int(connection.execute(
+                select(Setting.value).where(Setting.key == self.rollup_watermark_key)).scalar() or 0)
+            connection.execute(delete(CommandUsageEvent).where(CommandUsageEvent.occurred_at < cutoff,
+                                                               CommandUsageEvent.row_id <= watermark))
+            connection.execute(delete(CommandUsageMinute).where(CommandUsageMinute.minute < cutoff))
+
+    def get_top_commands(self, period: str, guild_id: Optional[int] = None, limit: int = 10) -> List[Any]:
+        """
+        Get the most used commands over a period, from the rollups. Runs in a worker thread.
+        :param period: One of the usage periods.
+        :param guild_id: ID of the server to limit the query to, or None for all servers.
+        :param limit: Maximum number of commands.
+        :return: Rows of command name, uses, failures, total duration and maximum duration.
+        """
+        table, length = self.usage_periods[period]
+        period_column = table.minute if table is CommandUsageMinute else table.day
+        since = time.time() - length
+        # Day rollups are aligned to midnight, so include the day the period starts in.
+        since = since // 60 * 60 if table is CommandUsageMinute else since // 86400 * 86400
+
+        uses = func.sum(table.uses)
+        query = select(table.command_name, uses, func.sum(table.failures), func.sum(table.total_duration_ms),
+                       func.max(table.max_duration_ms)).where(period_column >= since)
+        if guild_id is not None:
+            query = query.where(table.guild_id == guild_id)
+        query = query.group_by(table.command_name).order_by(uses.desc()).limit(limit)
+
+        with self.bot.database_handler.engine.connect() as connection:
+            return connection.execute(query).all()
+
+    @app_commands.command(name="command-usage", description="Show the most used commands.")
+    @app_commands.describe(period="Period to show usage for.", this_server="Only count usage in this server.")
+    @app_commands.choices(period=[app_commands.Choice(name=period, value=period) for period in usage_periods])
+    @app_commands.check(is_owner)
+    async def command_usage(self, interaction: discord.Interaction, period: str = "week",
+                            this_server: bool = False) -> None:
+        """
+        Show the most used commands over a period.
+        :param interaction: Interaction.
+        :param period: Period to show usage for.
+        :param this_server: Whether to only count usage in the server the command is used in.
+        """
+        rows = await self.run_in_thread(self.get_top_commands, period,
+                                        interaction.guild_id if this_server else None)
+
+        lines = [f"`{command_name}`: {uses} use(s), {failures} failed, avg {total_duration / uses:.0f}ms, "
+                 f"max {max_duration:.0f}ms" for command_name, uses, failures, total_duration, max_duration in rows]
+        embed = discord.Embed(title=f"Top commands this {period}", description="\n".join(lines) or "No usage recorded.",
+                              color=0x0000ff)
+        await self.respond(interaction, embed=embed, ephemeral=True)
 
 
 async def setup(bot):
@@ -1,11 +1,20 @@
-from discord import Interaction
+import asyncio
+import io
+import json
+from typing import Dict, Optional, Set
+
+from discord import File, Interaction, Object
 from discord import app_commands
 from discord.app_commands import Choice
 from discord.ext import commands
-from discord.utils import find
 
 from base.base_cog import BaseCog
 from core.bot import MyBot
+from core.command_registry import CommandRegistry
+from entities.setting import Setting, set_setting
+from utils.checks.concurrency_limit import get_concurrency_metrics
+from utils.checks.shared_cooldown import shared_cooldown
+from utils.logging import get_logging_metrics
 
 
 class CoreCog(BaseCog):
@@ -13,37 +22,161 @@ class CoreCog(BaseCog):
     CoreCog is a cog with core commands such as sync and ping.
     """
 
+    command_registry_key = "CoreCog:command_registry:"
+    """Prefix of the settings persisting the command registry, followed by "global" or the server's ID."""
+
+    command_tree_hash_key = "CoreCog:command_tree_hash:"
+    """Prefix of the settings storing the hash of each scope's last synced payload, followed by "global" or the
+    server's ID."""
+
     def __init__(self, bot: MyBot) -> None:
         super().__init__(bot)
-        self.command_tree_cache = None
+        self.command_registry = CommandRegistry()
+        self.fetch_tasks: Dict[Optional[int], asyncio.Task] = {}
+        self.persisted_scopes: Set[Optional[int]] = set()
+        self.sync_task: Optional[asyncio.Task] = None
+
+    async def post_init(self):
+        """
+        Load the persisted command registry, and fetch the global commands in the background if they weren't persisted.
+        """
+        for setting in Setting.query.filter(Setting.key.startswith(self.command_registry_key)):
+            scope = setting.key[len(self.command_registry_key):]
+            guild_id = None if scope == "global" else int(scope)
+            self.command_registry.set_scope(guild_id, CommandRegistry.from_data(json.loads(setting.value or "[]")))
+            self.persisted_scopes.add(guild_id)
+
+        if self.bot.config.sync_commands_on_ready:
+            # Syncs the global scope as well if it changed, which updates the registry.
+            self.sync_task = asyncio.create_task(self.sync_changed_scopes())
+        elif not self.command_registry.has_scope(None):
+            self.fetch_scope_in_background(None)
+
+    async def cog_unload(self) -> None:
+        """
+        This method is called when the cog is unloaded.
+        """
+        for task in self.fetch_tasks.values():
+            task.cancel()
+        if self.sync_task is not None:
+            self.sync_task.cancel()
+
+        await super().cog_unload()
+
+    def update_scope(self, guild_id: Optional[int], synced_commands: list[app_commands.AppCommand]) -> None:
+        """
+        Replace a scope of the command registry with its synced or fetched commands, and persist it. Servers without
+        commands of their own aren't persisted, unless they had some before.
+        :param guild_id: ID of the server, or None for the global scope.
+        :param synced_commands: The commands of the scope.
+        """
+        self.command_registry.set_scope(guild_id, CommandRegistry.from_app_commands(synced_commands))
+        data = CommandRegistry.to_data(self.command_registry.scopes[guild_id])
+        if not data and guild_id not in self.persisted_scopes and guild_id is not None:
+            return
+
+        self.persisted_scopes.add(guild_id)
+        set_setting(self.bot, f"{self.command_registry_key}{guild_id or 'global'}", json.dumps(data))
+
+    async def fetch_scope(self, guild_id: Optional[int]) -> None:
+        """
+        Fetch the commands of a scope into the command registry.
+        :param guild_id: ID of the server, or None for the global scope.
+        """
+        guild = Object(guild_id) if guild_id is not None else None
+        self.update_scope(guild_id, await self.bot.tree.fetch_commands(guild=guild))
+
+    def fetch_scope_in_background(self, guild_id: Optional[int]) -> None:
+        """
+        Fetch the commands of a scope into the command registry in the background, unless already fetching.
+        :param guild_id: ID of the server, or None for the global scope.
+        """
+        if guild_id in self.fetch_tasks:
+            return
+
+        async def fetch():
+            try:
+                await self.fetch_scope(guild_id)
+            except Exception as e:
+                self.logger.warning(f"Failed to fetch the commands of scope {guild_id or 'global'}: {e}")
+            finally:
+                self.fetch_tasks.pop(guild_id, None)
+
+        self.fetch_tasks[guild_id] = asyncio.create_task(fetch())
+
+    async def ensure_scopes(self, guild_id: Optional[int]) -> None:
+        """
+        Make sure the scopes visible in a server are in the command registry, fetching them if needed.
+        :param guild_id: ID of the server, or None outside of servers.
+        """
+        for scope in {guild_id, None}:
+            if not self.command_registry.has_scope(scope):
+                self.fetch_scope_in_background(scope)
+                await asyncio.shield(self.fetch_tasks[scope])
 
-    async def get_command_tree(self) -> list[app_commands.AppCommand]:
+    async def sync_scope(self, guild_id: Optional[int]) -> None:
+        """
+        Sync a scope of the command tree, update the command registry, and store the hash of the synced payload.
+        :param guild_id: ID of the server, or None for the global scope.
         """
-        Get the command tree.
-        :return: Command tree.
+        guild = Object(guild_id) if guild_id is not None else None
+        sync_hash = await self.bot.tree.get_sync_hash(guild)
+
+        self.update_scope(guild_id, await self.bot.tree.sync(guild=guild))
+        set_setting(self.bot, f"{self.command_tree_hash_key}{guild_id or 'global'}", sync_hash)
+
+    async def sync_changed_scopes(self) -> list[Optional[int]]:
         """
-        self.command_tree_cache = self.command_tree_cache or await self.bot.tree.fetch_commands()
-        return self.command_tree_cache
+        Sync the scopes of the command tree whose payload changed since their last sync: the global scope, servers
+        with server-specific commands, and servers that had some at their last sync (to remove them). Scopes are synced
+        one at a time, as syncs share a tight rate limit.
+        :return: The synced scopes.
+        """
+        stored_hashes = {setting.key[len(self.command_tree_hash_key):]: setting.value for setting in
+                         Setting.query.filter(Setting.key.startswith(self.command_tree_hash_key))}
+        guild_ids = self.bot.tree.get_guild_ids() | {int(scope) for scope in stored_hashes if scope != "global"}
+
+        synced = []
+        for guild_id in [None, *sorted(guild_ids)]:
+            guild = Object(guild_id) if guild_id is not None else None
+            if await self.bot.tree.get_sync_hash(guild) == stored_hashes.get(str(guild_id or "global")):
+                continue
+
+            try:
+                await self.sync_scope(guild_id)
+            except Exception as e:
+                self.logger.exception(f"Failed to sync scope {guild_id or 'global'}.", exc_info=e)
+                continue
+
+            synced.append(guild_id)
+
+        self.logger.info(f"Synced {len(synced)} changed scope(s) of {len(guild_ids) + 1}.")
+        return synced
 
     async def autocomplete_command_name(self, interaction: Interaction, current: str) -> list[Choice[str]]:
         """
-        Autocomplete command names.
+        Autocomplete command names from the command registry. Scopes that aren't known yet are fetched in the
+        background, so autocomplete never waits on Discord.
         :param interaction: Interaction.
         :param current: Current string.
         :return: List of command names.
         """
-        return [Choice(name=command.name, value=str(command.id)) for command in await self.get_command_tree() if
-                current.lower() in command.name.lower()][:25]
+        for scope in {interaction.guild_id, None}:
+            if not self.command_registry.has_scope(scope):
+                self.fetch_scope_in_background(scope)
+
+        return [Choice(name=command.name, value=command.name)
+                for command in self.command_registry.search(interaction.guild_id, current)]
 
     @app_commands.command(name="ping", description="Ping the bot.")
-    @app_commands.checks.cooldown(2, 60)
+    @shared_cooldown(2, 60)
     @app_commands.guild_only()
     async def ping(self, interaction: Interaction) -> None:
         """
         Ping the bot.
         :param interaction: Interaction.
         """
-        await interaction.response.send_message(f"Pong! {round(self.bot.latency * 1000)}ms.", ephemeral=True)
+        await self.respond(interaction, f"Pong! {round(self.bot.latency * 1000)}ms.", ephemeral=True)
 
     @commands.command(name="sync", description="Sync the bot's command tree.")
     @commands.is_owner()
@@ -54,13 +187,60 @@ class CoreCog(BaseCog):
         :param current_server: Whether to sync the current server only.
         """
         if current_server:
-            self.command_tree_cache = await self.bot.tree.sync(guild=ctx.guild)
+            if ctx.guild is None:
+                await self.reply(ctx, "There is no current server to sync in direct messages.")
+                return
+
+            await self.sync_scope(ctx.guild.id)
             self.logger.info(f"Sync complete for {ctx.guild}.")
-            await ctx.reply("Sync complete for current server.")
+            await self.reply(ctx, "Sync complete for current server.")
         else:
-            self.command_tree_cache = await self.bot.tree.sync()
+            await self.sync_scope(None)
             self.logger.info(f"Sync complete.")
-            await ctx.reply("Sync complete.")
+            await self.reply(ctx, "Sync complete.")
+
+    @commands.command(name="sync-changed", description="Sync the scopes of the command tree that changed.")
+    @commands.is_owner()
+    async def sync_changed(self, ctx: commands.Context) -> None:
+        """
+        Syncs the global and server commands that changed since their last sync.
+        :param ctx: Context.
+        """
+        synced = await self.sync_changed_scopes()
+        await self.reply(ctx, f"Synced {len(synced)} changed scope(s)." if synced else "No changes to sync.")
+
+    @commands.command(name="metrics", description="Show the bot's internal metrics.")
+    @commands.is_owner()
+    async def metrics(self, ctx: commands.Context) -> None:
+        """
+        Shows the bot's internal metrics.
+        :param ctx: Context.
+        """
+        metrics = {"send_scheduler": self.bot.send_scheduler.get_metrics(),
+                   "job_scheduler": self.bot.job_scheduler.get_metrics(),
+                   "concurrency_limits": get_concurrency_metrics(),
+                   "executors": self.bot.executor_pool.get_metrics(),
+                   "logging": get_logging_metrics(),
+                   "batch_writers": {writer.name: writer.get_metrics() for writer in self.bot.batch_writers},
+                   "tracing": self.bot.tracer.get_metrics(),
+                   "command_registry": self.command_registry.get_metrics(),
+                   "data_loaders": {name: loader.get_metrics() for name, loader in self.bot.data_loaders.items()}}
+        master_log_cog = self.bot.get_cog("MasterLogCog")
+        if master_log_cog is not None:
+            metrics["master_log_spool"] = master_log_cog.spool.get_metrics()
+        error_cog = self.bot.get_cog("ErrorCog")
+        if error_cog is not None:
+            metrics["errors"] = error_cog.error_tracker.get_metrics()
+        if self.bot.loop_monitor:
+            metrics["event_loop"] = self.bot.loop_monitor.get_metrics()
+
+        text = json.dumps(metrics, indent=2)
+        if len(text) <= 1900:
+            await self.reply(ctx, f"```json\n{text}\n```")
+            return
+
+        # Too long for a message: send the whole document as a file rather than cutting it off.
+        await self.reply(ctx, "Metrics attached.", file=File(io.BytesIO(text.encode("utf-8")), "metrics.json"))
 
     @commands.command(name="shutdown", description="Shutdown the bot.")
     @commands.is_owner()
@@ -69,12 +249,12 @@ class CoreCog(BaseCog):
         Shuts down the bot.
         :param ctx: Context.
         """
-        await ctx.reply("Shutting down...", ephemeral=True)
+        await self.reply(ctx, "Shutting down...", ephemeral=True)
 
         await self.bot.close()
 
     @app_commands.command(name="generate_command_link", description="Generate a command link.")
-    @app_commands.checks.cooldown(1, 5, key=lambda i: i.user.id)
+    @shared_cooldown(1, 5, key=lambda i: i.user.id)
     @app_commands.guild_only()
     @app_commands.autocomplete(command_name=autocomplete_command_name)
     async def generate_command_link(self, interaction: Interaction, command_name: str) -> None:
@@ -83,22 +263,14 @@ class CoreCog(BaseCog):
         :param interaction: Interaction.
         :param command_name: Command name.
         """
-        command_name = command_name.lower()
-
-        try:
-            command_id = int(command_name)
-        except ValueError:
-            command_id = None
-
-        command_tree = await self.get_command_tree()
-
-        app_command = find(lambda command: command.id == command_id or command.name == command_name, command_tree)
+        await self.ensure_scopes(interaction.guild_id)
+        app_command = self.command_registry.get(interaction.guild_id, command_name)
 
         if app_command is None:
-            await interaction.response.send_message(f"Command not found: `{command_name}`.", ephemeral=True)
+            await self.respond(interaction, f"Command not found: `{command_name}`.", ephemeral=True)
             return
 
-        await interaction.response.send_message(f"{app_command.mention}")
+        await self.respond(interaction, f"{app_command.mention}")
 
 
 async def setup(bot):
@@ -2,15 +2,40 @@ from discord import Interaction
 from discord import app_commands
 from discord.ext import commands
 
+import json
+import re
+import traceback
+from typing import Any, Dict, List, Optional, Tuple
+
+from sqlalchemy import select, update, insert, bindparam
+
 from base.base_cog import BaseCog
+from base.mixins.using_master_log_mixin import UsingMasterLogMixin
 from core.bot import MyBot
+from core.job_scheduler import CatchUpPolicy
+from core.send_scheduler import SendPriority
+from entities.error_event import ErrorEvent, ErrorEventGroup
+from extensions.error.error_menu import ErrorEventMenu, ErrorGroupMenu
+from utils.checks.concurrency_limit import ConcurrencyLimitReached
+from utils.checks.is_owner import is_owner
+from utils.error_tracker import ErrorTracker, unwrap_error
 
 
-class ErrorCog(BaseCog):
+class ErrorCog(BaseCog, UsingMasterLogMixin):
     """
     ErrorCog is a cog that handles command errors.
+
+    Errors are grouped by fingerprint (exception type, command, and innermost traceback frames). Only the first error of
+    a group since the last digest is logged in full and DM'd to the owner; repeats are counted, and all groups are sent
+    to the master log channel as a periodic digest.
+
+    All errors are stored as ErrorEvents, with totals per group in ErrorEventGroups. Rows are written in batches in the
+    background, so storing an error adds no database latency to the failing command.
     """
 
+    digest_size = 10
+    """Maximum number of error groups listed in a digest."""
+
     command_error_messages = {commands.CommandNotFound: "Command not found: `{}`.",
                               commands.MissingRequiredArgument: "Missing required argument: `{}`.",
                               commands.BadArgument: "Bad argument.",
@@ -30,12 +55,131 @@ class ErrorCog(BaseCog):
                                   app_commands.NoPrivateMessage: "This command can only be used in a server.",
                                   app_commands.CheckFailure: "You do not have permission to use this command."}
 
-    shared_error_messages = {}
+    shared_error_messages = {ConcurrencyLimitReached: "This command is busy. Try again in a moment."}
 
     def __init__(self, bot: MyBot) -> None:
         super().__init__(bot)
 
         self.bot.tree.on_error = self.on_app_command_error
+        self.error_tracker = ErrorTracker()
+        self.error_writer = self.create_batch_writer("error_events", self.write_error_events)
+
+    async def post_init(self):
+        """
+        Schedule the error digest.
+        """
+        self.register_job_handler("digest", self.send_digest)
+
+        digest_interval = self.bot.config.error_digest_minutes * 60
+        if digest_interval > 0:
+            await self.schedule_job("digest", interval=digest_interval, catch_up=CatchUpPolicy.SKIP, key="digest")
+
+    def record_error(self, error: Exception, command_name: Optional[str], context: Dict[str, Any]) -> bool:
+        """
+        Record an error, and log it if it is the first of its group since the last digest.
+        :param error: Error.
+        :param command_name: Qualified name of the command that raised the error.
+        :param context: Sample context of the error.
+        :return: Whether the error was reported.
+        """
+        group, report = self.error_tracker.record(error, command_name, context)
+
+        # Queued as a tuple; the row is built, and the context serialised, in the writer's worker thread.
+        self.error_writer.add((group.fingerprint, group.last_seen, group.error_type, command_name, group.message,
+                               context,
+                               "".join(traceback.format_exception(unwrap_error(error))) if report else None))
+
+        if report:
+            self.logger.error(f"{command_name} raised an exception [{group.fingerprint}]: {error}. ({context})",
+                              exc_info=unwrap_error(error))
+        else:
+            self.logger.debug(f"{command_name} raised a repeated exception [{group.fingerprint}], {group.count} total.")
+
+        return report
+
+    def write_error_events(self, rows: List[Tuple]) -> None:
+        """
+        Insert a batch of error events, and add them to their groups' totals. Runs in a worker thread.
+        :param rows: The error events, as queued by record_error.
+        """
+        events = [{"fingerprint": fingerprint, "occurred_at": occurred_at, "error_type": error_type,
+                   "command_name": command_name, "message": message[:2000], "user_id": context.get("user"),
+                   "guild_id": context.get("guild"), "channel_id": context.get("channel"),
+                   "context": json.dumps(context, default=str), "traceback": traceback_text}
+                  for fingerprint, occurred_at, error_type, command_name, message, context, traceback_text in rows]
+
+        groups = {}
+        for event in events:
+            group = groups.setdefault(event["fingerprint"], {
+                "b_fingerprint": event["fingerprint"], "error_type": event["error_type"],
+                "command_name": event["command_name"], "first_seen": event["occurred_at"], "b_count": 0})
+            group["b_count"] += 1
+            group["b_last_seen"] = event["occurred_at"]
+            group["b_message"] = event["message"]
+
+        with self.bot.database_handler.engine.begin() as connection:
+            connection.execute(insert(ErrorEvent), events)
+
+            existing = set(connection.execute(select(ErrorEventGroup.fingerprint).where(
+                ErrorEventGroup.fingerprint.in_(groups))).scalars())
+            if existing:
+                connection.execute(
+                    update(ErrorEventGroup).where(ErrorEventGroup.fingerprint == bindparam("b_fingerprint")).values(
+                        count=ErrorEventGroup.count + bindparam("b_count"), last_seen=bindparam("b_last_seen"),
+                        message=bindparam("b_message")),
+                    [{key: value for key, value in group.items() if key.startswith("b_")}
+                     for fingerprint, group in groups.items() if fingerprint in existing])
+
+            new_groups = [{"fingerprint": group["b_fingerprint"], "error_type": group["error_type"],
+                           "command_name": group["command_name"], "message": group["b_message"],
+                           "count": group["b_count"], "first_seen": group["first_seen"],
+                           "last_seen": group["b_last_seen"]}
+                          for fingerprint, group in groups.items() if fingerprint not in existing]
+            if new_groups:
+                connection.execute(insert(ErrorEventGroup), new_groups)
+
+    @app_commands.command(name="errors", description="Browse recorded errors.")
+    @app_commands.describe(grouped="Show error groups instead of single errors.",
+                           fingerprint="Only show errors of this group.")
+    @app_commands.check(is_owner)
+    async def errors(self, interaction: Interaction, grouped: bool = False, fingerprint: Optional[str] = None) -> None:
+        """
+        Browse recorded errors, newest first.
+        :param interaction: Interaction.
+        :param grouped: Whether to show error groups instead of single errors.
+        :param fingerprint: Fingerprint of the group to show errors of.
+        """
+        if fingerprint is not None:
+            fingerprint = fingerprint.strip().strip("`").lower()
+            # The fingerprint goes into the menu's buttons, so only accept real ones.
+            if not re.fullmatch(r"[0-9a-f]{16}", fingerprint):
+                await self.respond(interaction, "Invalid fingerprint: fingerprints are 16 hexadecimal characters, as "
+                                                "shown in `/errors`.", ephemeral=True)
+                return
+
+        if grouped:
+            menu = ErrorGroupMenu(self.bot)
+        else:
+            menu = await ErrorEventMenu.open(self.bot, fingerprint)
+
+        await menu.send(interaction, ephemeral=True)
+
+    async def send_digest(self, payload: Any) -> None:
+        """
+        Send the error groups since the last digest to the master log channel.
+        :param payload: Job payload. Unused.
+        """
+        digest = self.error_tracker.take_digest()
+        if not digest:
+            return
+
+        lines = [group.format(count) for group, count in digest[:self.digest_size]]
+        if len(digest) > self.digest_size:
+            lines.append(f"...and {len(digest) - self.digest_size} more group(s).")
+
+        total = sum(count for _, count in digest)
+        await self.master_error_log(f"{total} error(s) in {len(digest)} group(s) since the last digest:\n"
+                                    + "\n".join(lines))
 
     def get_command_error_message(self, error: commands.CommandError) -> str:
         """
@@ -68,7 +212,9 @@ class ErrorCog(BaseCog):
         :param ctx: Context.
         :param error: Error.
         """
-        self.logger.error(f"{ctx.command} called by {ctx.author} raised an exception: {error}. ({ctx.message})")
+        command_name = ctx.command.qualified_name if ctx.command is not None else None
+        report = self.record_error(error, command_name, {"user": ctx.author.id, "guild": ctx.guild and ctx.guild.id,
+                                                         "channel": ctx.channel.id, "message": ctx.message.content})
 
         error_message = self.get_command_error_message(error)
 
@@ -81,10 +227,12 @@ class ErrorCog(BaseCog):
         elif isinstance(error, commands.CommandOnCooldown):
             error_message = error_message.format(error.retry_after)
 
-        await ctx.reply(error_message)
+        await self.bot.send_scheduler.run(SendPriority.USER, lambda: ctx.reply(error_message))
 
-        if await self.bot.is_owner(ctx.author):
-            await ctx.author.send(f"An error occurred while running the command `{ctx.command.name}`: {error}")
+        if report and await self.bot.is_owner(ctx.author):
+            self.bot.send_scheduler.send(
+                ctx.author, SendPriority.LOG,
+                content=f"An error occurred while running the command `{command_name}`: {error}")
 
     @commands.Cog.listener()
     async def on_app_command_error(self, interaction: Interaction, error: app_commands.AppCommandError) -> None:
@@ -95,11 +243,13 @@ class ErrorCog(BaseCog):
         """
         if interaction.command is None:
             self.logger.error(f"Command not found: {interaction.data}.")
-            await interaction.response.send_message(f"Command not found: `{interaction.data.get('name')}`.",
-                                                    ephemeral=True)
+            await self.send_error_response(interaction, f"Command not found: `{interaction.data.get('name')}`.")
             return
 
-        self.logger.error(f"{interaction.command.name} called by {interaction.user} raised an exception: {error}.")
+        command_name = interaction.command.qualified_name
+        report = self.record_error(error, command_name, {"user": interaction.user.id, "guild": interaction.guild_id,
+                                                         "channel": interaction.channel_id,
+                                                         "options": interaction.data.get("options")})
 
         error_message = self.get_app_command_error_message(error)
 
@@ -110,13 +260,31 @@ class ErrorCog(BaseCog):
             error_message = error_message.format(error.retry_after)
 
         try:
-            await interaction.response.send_message(error_message, ephemeral=True)
-        except:
-            await interaction.followup.send(error_message, ephemeral=True)
+            await self.send_error_response(interaction, error_message)
+        finally:
+            # The tree's error handler isn't an event, so let other cogs know about the failure, even if the response
+            # couldn't be sent.
+            self.bot.dispatch("app_command_failure", interaction, error)
+
+        if report and await self.bot.is_owner(interaction.user):
+            self.bot.send_scheduler.send(
+                interaction.user, SendPriority.LOG,
+                content=f"An error occurred while running the command `{command_name}`: {error}")
+
+    async def send_error_response(self, interaction: Interaction, error_message: str) -> None:
+        """
+        Send an error message in response to an interaction, at interaction priority.
+        :param interaction: The interaction object.
+        :param error_message: Error message.
+        """
+
+        async def respond():
+            try:
+                await interaction.response.send_message(error_message, ephemeral=True)
+            except:
+                await interaction.followup.send(error_message, ephemeral=True)
 
-        if await self.bot.is_owner(interaction.user):
-            await interaction.user.send(
-                f"An error occurred while running the command `{interaction.command.name}`: {error}")
+        await self.bot.send_scheduler.run(SendPriority.INTERACTION, respond)
 
 
 async def setup(bot):
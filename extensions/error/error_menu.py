@@ -0,0 +1,147 @@
+import json
+from typing import Any, List, Optional, Tuple
+
+import discord
+from sqlalchemy import select, func
+
+from base.keyset_query_page_source import KeysetQueryPageSource
+from base.persistent_menu import PersistentMenu
+from entities.error_event import ErrorEvent, ErrorEventGroup
+
+
+class KeysetErrorMenu(PersistentMenu):
+    """
+    Persistent, owner-only menu over an error table, paged with a KeysetQueryPageSource. Totals are counted at most
+    once a minute, so pressing through the pages is one indexed query per press.
+
+    Subclasses define the query, its order, and how to show a row.
+    """
+
+    page_size = 5
+
+    def __init__(self, bot, params: str = ""):
+        super().__init__(bot, params)
+        self.page_source: Optional[KeysetQueryPageSource] = None
+
+    def get_query(self):
+        """
+        Get the query for all rows of the menu, without order.
+        """
+        raise NotImplementedError
+
+    def get_order(self) -> List[Any]:
+        """
+        Get the order of the rows. Must match an index, and be unique.
+        """
+        raise NotImplementedError
+
+    @property
+    def total(self) -> int:
+        return self.page_source.total if self.page_source is not None else 0
+
+    def get_page_source(self) -> KeysetQueryPageSource:
+        self.page_source = KeysetQueryPageSource(self.bot.database_handler, self.bot.executor_pool.run_in_thread,
+                                                 self.get_query(), self.get_order(), page_size=self.page_size)
+        return self.page_source
+
+    async def interaction_check(self, interaction: discord.Interaction) -> bool:
+        return await self.bot.is_owner(interaction.user)
+
+    async def format_page(self, page: int, rows: List[Any]) -> Tuple[str, discord.Embed]:
+        embed = discord.Embed(title=self.get_title(), color=0xff0000)
+        if not rows:
+            embed.description = "No errors recorded."
+        for row in rows:
+            self.add_row_field(embed, row)
+
+        return "", embed
+
+    def get_title(self) -> str:
+        """
+        Get the title of the menu.
+        """
+        return f"Errors ({self.total})"
+
+    def add_row_field(self, embed: discord.Embed, row) -> None:
+        """
+        Add a row to the embed.
+        """
+        raise NotImplementedError
+
+
+class ErrorEventMenu(KeysetErrorMenu, menu_id="errors"):
+    """
+    Browses recorded errors, newest first, optionally of one group only.
+
+    The parameters are the highest row ID when the menu was opened, which pins the menu to the errors recorded until
+    then, so pages don't shift while browsing, and the fingerprint of the group, if any: `<max row id>,<fingerprint>`.
+    """
+
+    def __init__(self, bot, params: str = ""):
+        super().__init__(bot, params)
+
+        max_row_id, _, fingerprint = params.partition(",")
+        self.max_row_id = int(max_row_id or 0)
+        self.fingerprint = fingerprint or None
+
+    @classmethod
+    async def open(cls, bot, fingerprint: Optional[str] = None) -> "ErrorEventMenu":
+        """
+        Create a menu over the errors recorded so far.
+        :param bot: The bot.
+        :param fingerprint: Fingerprint of the group to show errors of, or None for all errors.
+        :return: The menu.
+        """
+        def get_max_row_id() -> int:
+            with bot.database_handler.engine.connect() as connection:
+                return connection.execute(select(func.max(ErrorEvent.row_id))).scalar() or 0
+
+        max_row_id = await bot.executor_pool.run_in_thread(get_max_row_id)
+        return cls(bot, f"{max_row_id},{fingerprint or ''}")
+
+    def get_query(self):
+        query = select(ErrorEvent).where(ErrorEvent.row_id <= self.max_row_id)
+        if self.fingerprint is not None:
+            query = query.where(ErrorEvent.fingerprint == self.fingerprint)
+        return query
+
+    def get_order(self) -> List[Any]:
+        return [ErrorEvent.row_id.desc()]
+
+    def get_title(self) -> str:
+        if self.fingerprint is not None:
+            return f"Errors in group {self.fingerprint} ({self.total})"
+        return super().get_title()
+
+    def add_row_field(self, embed: discord.Embed, row) -> None:
+        context = json.loads(row.context)
+        where = f"guild {row.guild_id}" if row.guild_id else "DM"
+        user = f"<@{row.user_id}>" if row.user_id else "unknown user"
+        details = ", ".join(f"{key}: {value}" for key, value in context.items()
+                            if key not in ("user", "guild", "channel"))[:200]
+
+        embed.add_field(name=f"#{row.row_id} {row.error_type} in {row.command_name}",
+                        value=f"<t:{int(row.occurred_at)}:f> by {user} in {where}\n"
+                              f"{row.message[:300]}\n`{row.fingerprint}` {details}"[:1024],
+                        inline=False)
+
+
+class ErrorGroupMenu(KeysetErrorMenu, menu_id="error_groups"):
+    """
+    Browses error groups, most recently seen first.
+    """
+
+    def get_query(self):
+        return select(ErrorEventGroup)
+
+    def get_order(self) -> List[Any]:
+        return [ErrorEventGroup.last_seen.desc(), ErrorEventGroup.fingerprint.desc()]
+
+    def get_title(self) -> str:
+        return f"Error groups ({self.total})"
+
+    def add_row_field(self, embed: discord.Embed, row) -> None:
+        embed.add_field(name=f"{row.count}x {row.error_type} in {row.command_name}",
+                        value=f"First <t:{int(row.first_seen)}:R>, last <t:{int(row.last_seen)}:R>\n"
+                              f"{row.message[:300]}\n`{row.fingerprint}`"[:1024],
+                        inline=False)
@@ -1,22 +1,93 @@
+import asyncio
+import time
+from collections import deque
+from itertools import takewhile
+from pathlib import Path
+from typing import Optional, List, Tuple, Dict, Set
+
 import discord
 from discord import app_commands
 
 from base.base_cog import BaseCog
 from core.bot import MyBot
-from entities.setting import set_setting, get_setting
+from core.send_scheduler import SendPriority, MAX_MESSAGE_LENGTH, MAX_MESSAGE_EMBEDS, MAX_EMBEDS_LENGTH, \
+    MAX_EMBED_DESCRIPTION_LENGTH
+from entities.server_setting import set_setting as set_server_setting, load_setting as load_server_setting
+from entities.setting import set_setting, get_setting, load_setting
 from utils.checks.is_owner import is_owner
+from utils.rate_limit import take_tokens, get_retry_after
+from utils.spool import Spool
 
 
 class MasterLogCog(BaseCog):
     """
     MasterLogCog is a cog that allows for logging to a master log channel.
+
+    Logs are queued and sent in batches: after the first log arrives, logs are collected for a short debounce (or until
+    a full message's worth is queued), and then sent as combined messages within Discord's limits (10 embeds, 6000
+    characters of embeds). Sends stay within the channel's message rate limit, so bursts of logs are spread out instead
+    of running into 429s. If Discord rejects a combined message, its logs are sent one by one, and only the ones that
+    are rejected on their own are dropped.
+
+    If logs can't be delivered (Discord is unreachable, or the channel is missing), they are written to an on-disk
+    spool, and delivery is retried with backoff. While the spool holds logs, new logs are added to it as well, and it is
+    replayed in order once delivery works again.
+
+    Servers can route their own logs to a channel of their choice, stored as a server setting; logs without a server,
+    or whose server has no (reachable) log channel, go to the global master log channel. A server's log channel is
+    loaded when it first logs (logs of several servers arriving together are looked up in one query) and kept in
+    memory, so routing queued logs costs no database or API calls.
     """
 
     master_log_channel_key = "CommandLoggingCog:master_log_channel_id"
+    guild_log_channel_key = "MasterLogCog:log_channel_id"
+
+    flush_delay = 1.0
+    """Seconds to collect logs for before sending them."""
+    channel_rate = 5
+    channel_per = 5.0
+    """Discord allows 5 messages per 5 seconds per channel."""
+    retry_delay = 5.0
+    max_retry_delay = 300.0
+    """Backoff between delivery attempts while logs can't be delivered."""
+    batch_read_size = 50
+    """Maximum number of queued logs considered for one message."""
 
     def __init__(self, bot: MyBot) -> None:
         super().__init__(bot)
 
+        self.master_log_channel: Optional[discord.abc.Messageable] = None
+
+        self.pending: deque = deque()
+        self.pending_embeds = 0
+        self.wakeup = asyncio.Event()
+        self.flush_task: Optional[asyncio.Task] = None
+        self.current_retry_delay = self.retry_delay
+        self.isolated_logs = 0
+        """Number of logs to send one by one, after Discord rejected the message combining them."""
+
+        self.guild_channel_ids: Dict[int, Optional[int]] = {}
+        """Log channel IDs of the servers loaded so far, or None for servers without one."""
+        self.guild_channels: Dict[int, discord.abc.Messageable] = {}
+        self.unreachable_channel_ids: Set[int] = set()
+
+        self.channel_buckets: Dict[Optional[int], Tuple[Optional[float], Optional[float]]] = {}
+
+        self.spool = Spool(str(Path(bot.config.spool_path) / "master_log"), bot.executor_pool.run_in_thread)
+
+    async def cog_unload(self) -> None:
+        """
+        This method is called when the cog is unloaded.
+        """
+        if self.flush_task is not None:
+            self.flush_task.cancel()
+
+        # Unsent logs are kept in the spool, and sent once the cog is loaded again.
+        self.spool_pending()
+        await self.spool.close()
+
+        await super().cog_unload()
+
     @app_commands.command(name="set-master-log-channel", description="Set the master log channel.")
     @app_commands.check(is_owner)
     async def set_master_log_channel(self, interaction: discord.Interaction, channel: discord.TextChannel) -> None:
@@ -26,28 +97,332 @@ class MasterLogCog(BaseCog):
         :param interaction: Interaction.
         """
         set_setting(self.bot, self.master_log_channel_key, str(channel.id))
-        await interaction.response.send_message(f"Master log channel set to {channel.mention}.", ephemeral=True)
+        self.master_log_channel = channel
+        await self.respond(interaction, f"Master log channel set to {channel.mention}.", ephemeral=True)
 
-    async def send_master_log(self, log: str = "", embed: discord.Embed = None):
+        # Retry spooled logs right away.
+        self.current_retry_delay = self.retry_delay
+        self.wakeup.set()
+
+    @app_commands.command(name="set-log-channel", description="Set this server's log channel. Leave empty to unset.")
+    @app_commands.guild_only()
+    @app_commands.default_permissions(manage_guild=True)
+    async def set_log_channel(self, interaction: discord.Interaction,
+                              channel: Optional[discord.TextChannel] = None) -> None:
         """
-        Send a log.
-        :param log: The log.
-        :param embed: The embed.
+        Set the log channel of a server.
+        :param interaction: Interaction.
+        :param channel: The channel to send the server's logs to, or None to send them to the master log channel.
+        """
+        guild_id = interaction.guild_id
+        set_server_setting(self.bot, guild_id, self.guild_log_channel_key, str(channel.id) if channel else "")
+
+        old_channel_id = self.guild_channel_ids.pop(guild_id, None)
+        self.guild_channels.pop(guild_id, None)
+        self.unreachable_channel_ids.discard(old_channel_id)
+
+        if channel is None:
+            self.guild_channel_ids[guild_id] = None
+            await self.respond(interaction, "Log channel unset.", ephemeral=True)
+            return
+
+        self.guild_channel_ids[guild_id] = channel.id
+        self.guild_channels[guild_id] = channel
+        self.unreachable_channel_ids.discard(channel.id)
+        await self.respond(interaction, f"Log channel set to {channel.mention}.", ephemeral=True)
+
+    async def load_log_channels(self, guild_ids: Set[Optional[int]]) -> None:
+        """
+        Load the log channels of servers that aren't loaded yet, and the master log channel setting if it isn't either,
+        without blocking the event loop. Concurrent lookups are fetched together.
+        :param guild_ids: IDs of the servers. None is ignored.
+        """
+        guild_ids = [guild_id for guild_id in guild_ids
+                     if guild_id is not None and guild_id not in self.guild_channel_ids]
+        values = await asyncio.gather(*(load_server_setting(self.bot, guild_id, self.guild_log_channel_key)
+                                        for guild_id in guild_ids))
+        for guild_id, value in zip(guild_ids, values):
+            # A channel set while loading is kept.
+            self.guild_channel_ids.setdefault(guild_id, int(value) if value else None)
+
+        if self.master_log_channel is None:
+            # Fills the settings cache, so get_master_log_channel doesn't query the database.
+            await load_setting(self.bot, self.master_log_channel_key)
+
+    def get_master_log_channel(self) -> Optional[discord.abc.Messageable]:
+        """
+        Get the master log channel. The channel is resolved once, and cached until the setting changes.
+        :return: The channel, or None if it is not set or not found.
         """
+        if self.master_log_channel is not None:
+            return self.master_log_channel
+
         master_log_channel_id = get_setting(self.master_log_channel_key)
         if master_log_channel_id is None:
             self.logger.error("Master log channel not set.")
-            return
-        master_log_channel = self.bot.get_channel(int(master_log_channel_id))
-        if master_log_channel is None:
+            return None
+
+        self.master_log_channel = self.bot.get_channel(int(master_log_channel_id))
+        if self.master_log_channel is None:
             self.logger.error("Master log channel not found.")
-            return
 
-        if embed is None:
-            await master_log_channel.send(log)
+        return self.master_log_channel
+
+    def get_log_channel(self, guild_id: Optional[int]) -> Optional[discord.abc.Messageable]:
+        """
+        Get the channel a server's logs go to: its own log channel if it has a reachable one, otherwise the master log
+        channel. Only in-memory state is used: servers whose log channel isn't loaded yet use the master log channel.
+        :param guild_id: ID of the server, or None.
+        :return: The channel, or None if there is none.
+        """
+        channel_id = self.guild_channel_ids.get(guild_id)
+        if channel_id is None or channel_id in self.unreachable_channel_ids:
+            return self.get_master_log_channel()
+
+        channel = self.guild_channels.get(guild_id)
+        if channel is None:
+            channel = self.bot.get_channel(channel_id)
+            if channel is None:
+                self.logger.warning(f"Log channel {channel_id} of server {guild_id} not found.")
+                self.unreachable_channel_ids.add(channel_id)
+                return self.get_master_log_channel()
+            self.guild_channels[guild_id] = channel
+
+        return channel
+
+    def mark_unreachable(self, channel: discord.abc.Messageable) -> bool:
+        """
+        Stop routing logs to a server log channel the bot can't send to. Its logs go to the master log channel instead,
+        until the server sets its log channel again.
+        :param channel: The channel.
+        :return: Whether the channel was a server log channel.
+        """
+        if channel is self.master_log_channel:
+            return False
+
+        channel_id = getattr(channel, "id", None)
+        if channel_id not in self.guild_channel_ids.values():
+            return False
+
+        self.unreachable_channel_ids.add(channel_id)
+        self.guild_channels = {guild_id: guild_channel for guild_id, guild_channel in self.guild_channels.items()
+                               if guild_channel is not channel}
+        return True
+
+    async def send_master_log(self, log: str = "", embed: discord.Embed = None, guild_id: Optional[int] = None):
+        """
+        Queue a log to be sent.
+        :param log: The log.
+        :param embed: The embed.
+        :param guild_id: ID of the server the log is about, to send it to the server's log channel if it has one.
+        """
+        log = log[:MAX_MESSAGE_LENGTH]
+        await self.load_log_channels({guild_id})
+        if embed is not None and embed.description and len(embed.description) > MAX_EMBED_DESCRIPTION_LENGTH:
+            embed.description = embed.description[:MAX_EMBED_DESCRIPTION_LENGTH - 1] + "…"
+
+        if self.spool.pending:
+            # Delivery is failing; keep the log on disk, behind the logs that are already waiting.
+            self.spool.append(self.to_spool_entry(guild_id, log, embed))
         else:
-            await master_log_channel.send(embed=embed)
+            self.pending.append((guild_id, log, embed))
+            if embed is not None:
+                self.pending_embeds += 1
+                if self.pending_embeds >= MAX_MESSAGE_EMBEDS:
+                    self.wakeup.set()
+
+        if self.flush_task is None or self.flush_task.done():
+            self.flush_task = asyncio.create_task(self.flush_loop())
+
+    def spool_pending(self) -> None:
+        """
+        Move the queued logs to the spool.
+        """
+        for guild_id, log, embed in self.pending:
+            self.spool.append(self.to_spool_entry(guild_id, log, embed))
+
+        self.pending.clear()
+        self.pending_embeds = 0
+
+    @staticmethod
+    def to_spool_entry(guild_id: Optional[int], log: str, embed: Optional[discord.Embed]) -> dict:
+        """
+        Convert a log to its spooled form.
+        """
+        return {"guild_id": guild_id, "log": log, "embed": embed.to_dict() if embed is not None else None}
+
+    @staticmethod
+    def from_spool_entry(entry: Optional[dict]) -> Tuple[Optional[int], str, Optional[discord.Embed]]:
+        """
+        Convert a spooled log back. Corrupt entries become empty logs.
+        """
+        if entry is None:
+            return None, "", None
+
+        return (entry.get("guild_id"), entry["log"],
+                discord.Embed.from_dict(entry["embed"]) if entry["embed"] else None)
+
+    @staticmethod
+    def build_batch(entries: List[Tuple[str, Optional[discord.Embed]]]) -> Tuple[int, str, List[discord.Embed]]:
+        """
+        Combine as many logs as fit into one message. The first log is always used, so a log over the limits on its
+        own is sent (and rejected) alone.
+        :param entries: The logs, oldest first.
+        :return: The number of logs used, and the content and embeds of the message.
+        """
+        count, lines, embeds, length, embeds_length = 0, [], [], 0, 0
+        for log, embed in entries:
+            if count and embed is not None and (len(embeds) >= MAX_MESSAGE_EMBEDS
+                                                or embeds_length + len(embed) > MAX_EMBEDS_LENGTH):
+                break
+            if count and log and length + len(log) > MAX_MESSAGE_LENGTH:
+                break
+
+            count += 1
+            if log:
+                lines.append(log)
+                length += len(log) + 1
+            if embed is not None:
+                embeds.append(embed)
+                embeds_length += len(embed)
+
+        return count, "\n".join(lines), embeds
+
+    def take_channel_token(self, channel: discord.abc.Messageable) -> float:
+        """
+        Take a token from a channel's message rate limit bucket.
+        :param channel: The channel.
+        :return: 0 if a message may be sent now, otherwise the time in seconds until one may be.
+        """
+        now = time.monotonic()
+        channel_id = getattr(channel, "id", None)
+        tokens, updated_at = self.channel_buckets.get(channel_id, (None, None))
+        tokens, allowed = take_tokens(tokens, updated_at, now, self.channel_rate, self.channel_per)
+        self.channel_buckets[channel_id] = (tokens, now)
+
+        return 0.0 if allowed else get_retry_after(tokens, self.channel_rate, self.channel_per)
+
+    def select_pending(self, channel: discord.abc.Messageable) -> List[int]:
+        """
+        Find the queued logs that go to a channel.
+        :param channel: The channel.
+        :return: Positions of the logs in the queue, oldest first.
+        """
+        positions = []
+        for position, (guild_id, _, _) in enumerate(self.pending):
+            if self.get_log_channel(guild_id) is channel:
+                positions.append(position)
+                if len(positions) >= self.batch_read_size:
+                    break
+
+        return positions
+
+    def remove_pending(self, positions: List[int]) -> None:
+        """
+        Remove logs from the queue.
+        :param positions: Positions of the logs in the queue.
+        """
+        removed = set(positions)
+        remaining = deque()
+        for position, entry in enumerate(self.pending):
+            if position in removed:
+                if entry[2] is not None:
+                    self.pending_embeds -= 1
+            else:
+                remaining.append(entry)
+
+        self.pending = remaining
+
+    async def wait(self, delay: float) -> None:
+        """
+        Wait for a delay, or until woken up.
+        """
+        try:
+            await asyncio.wait_for(self.wakeup.wait(), timeout=delay)
+        except asyncio.TimeoutError:
+            pass
+        finally:
+            self.wakeup.clear()
+
+    async def wait_for_retry(self) -> None:
+        """
+        Keep the queued logs in the spool, and back off before the next delivery attempt.
+        """
+        self.spool_pending()
+        self.logger.warning(f"{self.spool.pending} master log(s) spooled. Retrying in {self.current_retry_delay:.0f}s.")
+
+        await self.wait(self.current_retry_delay)
+        self.current_retry_delay = min(self.current_retry_delay * 2, self.max_retry_delay)
+
+    async def flush_loop(self) -> None:
+        """
+        Wait for the debounce, then send the spooled and queued logs in batches.
+        """
+        await self.wait(self.flush_delay)
+
+        while self.pending or self.spool.pending:
+            from_spool = bool(self.spool.pending)
+            if from_spool:
+                # Spooled logs are removed from the front only, so send the leading run going to the same channel.
+                spooled = [self.from_spool_entry(entry) for entry in await self.spool.peek(self.batch_read_size)]
+                # Spooled logs may be from before a restart, so their servers may not be loaded yet.
+                await self.load_log_channels({guild_id for guild_id, _, _ in spooled})
+                channel = self.get_log_channel(spooled[0][0]) if spooled else self.get_master_log_channel()
+                entries = [(log, embed) for _, log, embed in
+                           takewhile(lambda entry: self.get_log_channel(entry[0]) is channel, spooled)]
+            else:
+                channel = self.get_log_channel(self.pending[0][0])
+                positions = self.select_pending(channel) if channel is not None else []
+                entries = [self.pending[position][1:] for position in positions]
+
+            if channel is None:
+                await self.wait_for_retry()
+                continue
+
+            retry_after = self.take_channel_token(channel)
+            if retry_after > 0:
+                await asyncio.sleep(retry_after)
+                continue
+
+            count, content, embeds = self.build_batch(entries[:1] if self.isolated_logs else entries)
+            if content or embeds:
+                try:
+                    # Logs are sent at low priority, so they don't hold up replies to users.
+                    await self.bot.send_scheduler.run(SendPriority.LOG,
+                                                      lambda: channel.send(content=content or None, embeds=embeds))
+                except discord.HTTPException as e:
+                    if e.status in (403, 404) and self.mark_unreachable(channel):
+                        # Try again with the logs routed to the master log channel.
+                        self.logger.warning(f"Server log channel {getattr(channel, 'id', None)} is unreachable: {e}")
+                        continue
+
+                    if e.status in (403, 404, 429) or e.status >= 500:
+                        if e.status == 404:
+                            self.master_log_channel = None
+                        self.logger.error(f"Failed to deliver master logs: {e}")
+                        await self.wait_for_retry()
+                        continue
+
+                    if count > 1:
+                        # One of the logs is invalid: send them one by one, to only drop the invalid ones.
+                        self.logger.warning(f"Discord rejected {count} combined master logs, sending them one by one: "
+                                            f"{e}")
+                        self.isolated_logs = count
+                        continue
+
+                    # The log itself is invalid, so retrying won't help.
+                    self.logger.error(f"Dropped an undeliverable master log: {e}")
+                except Exception as e:
+                    self.logger.error(f"Failed to deliver master logs: {e}")
+                    await self.wait_for_retry()
+                    continue
 
+            self.current_retry_delay = self.retry_delay
+            self.isolated_logs = max(0, self.isolated_logs - count)
+            if from_spool:
+                await self.spool.ack(count)
+            else:
+                self.remove_pending(positions[:count])
 
 async def setup(bot):
     await bot.add_cog(MasterLogCog(bot))
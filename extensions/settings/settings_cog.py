@@ -7,7 +7,7 @@ from discord import app_commands
 from base.base_cog import BaseCog
 from base.mixins.using_master_log_mixin import UsingMasterLogMixin
 from core.bot import MyBot
-from entities.setting import set_setting, get_setting, get_all_settings
+from entities.setting import set_setting, get_setting, get_all_settings, load_setting
 from utils.checks.is_owner import is_owner
 
 
@@ -53,10 +53,12 @@ class SettingsCog(BaseCog, UsingMasterLogMixin):
         :param key: key of the setting.
         :return: None.
         """
-        await self.master_log_user_action(interaction.user, f"Viewed setting: {key}")
+        await self.master_log_user_action(interaction.user, f"Viewed setting: {key}", guild=interaction.guild)
 
-        await interaction.response.send_message(
-            embed=Embed(title=f"{key}", description=f"{get_setting(key) or 'Setting is not set'}", color=0x0000ff), ephemeral=True)
+        value = await load_setting(self.bot, key)
+
+        await self.respond(interaction, embed=Embed(title=f"{key}", description=f"{value or 'Setting is not set'}",
+                                                    color=0x0000ff), ephemeral=True)
 
     @settings_group.command(name="set", description="Set a setting.")
     @app_commands.default_permissions(administrator=True)
@@ -71,10 +73,11 @@ class SettingsCog(BaseCog, UsingMasterLogMixin):
         """
         set_setting(self.bot, key, value)
 
-        await self.master_log_user_action(interaction.user, f"Set setting: {key} to {value}")
+        await self.master_log_user_action(interaction.user, f"Set setting: {key} to {value}", guild=interaction.guild)
 
-        await interaction.response.send_message(
-            embed=Embed(title=f"{key}", description=f"{get_setting(key) or 'Setting is not set'}", color=0x0000ff))
+        await self.respond(interaction, embed=Embed(title=f"{key}",
+                                                    description=f"{get_setting(key) or 'Setting is not set'}",
+                                                    color=0x0000ff))
 
 
 async def setup(bot):
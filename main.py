@@ -2,9 +2,12 @@ import argparse
 
 from core.bot import MyBot
 from core.config import BotConfig
-from utils.logging import init_logging
+from utils.boot_profiler import BootProfiler
+from utils.logging import init_logging, shutdown_logging
 
 if __name__ == '__main__':
+    boot_profiler = BootProfiler()
+
     parser = argparse.ArgumentParser(description='Run the bot.')
     parser.add_argument('--config', type=str, help='The path to the config file.', default='./config.yaml',
                         required=False, nargs='?')
@@ -16,10 +19,16 @@ if __name__ == '__main__':
                         nargs='?', type=bool)
     parser.add_argument('--logs_path', type=str, help='The path to the logs directory.', default=None, required=False,
                         nargs='?')
+    parser.add_argument('--log_format', type=str, help='The log format.', default=None, required=False, nargs='?',
+                        choices=['text', 'json'])
     parser.add_argument('--extensions_path', type=str, help='The path to the extensions directory.', default=None,
                         required=False, nargs='?')
     parser.add_argument('--extensions', type=str, help='The extensions to load.', default=None, required=False,
                         nargs='*')
+    parser.add_argument('--gateway_record_path', type=str, help='The path to record raw gateway events to.',
+                        default=None, required=False, nargs='?')
+    parser.add_argument('--boot_profile_path', type=str, help='The path to dump the boot timeline to as JSON.',
+                        default=None, required=False, nargs='?')
 
     args = parser.parse_args()
 
@@ -28,9 +37,18 @@ if __name__ == '__main__':
         if value is not None:
             cli_args[key] = value
 
-    config = BotConfig.from_hierarchy(cli_args['config'], cli_args['dotenv'], cli_args)
+    with boot_profiler.phase("config"):
+        config = BotConfig.from_hierarchy(cli_args['config'], cli_args['dotenv'], cli_args)
 
-    init_logging(config.logs_path, config.debug)
+    with boot_profiler.phase("logging"):
+        init_logging(config.logs_path, config.debug, config.log_queue_size, config.log_format, config.log_sampling,
+                     max_bytes=int(config.log_max_mb * 1024 * 1024),
+                     rotation_interval=config.log_rotation_hours * 3600,
+                     compression=config.log_compression,
+                     retention_bytes=int(config.log_retention_mb * 1024 * 1024),
+                     retention_age=config.log_retention_days * 24 * 3600)
 
-    bot = MyBot(config)
+    bot = MyBot(config, boot_profiler=boot_profiler)
     bot.run(config.token, log_handler=None) # log_handler=None to prevent double logging
+
+    shutdown_logging()
@@ -0,0 +1,142 @@
+"""
+Buffered writer that collects rows and writes them in batches, off the event loop.
+"""
+
+import asyncio
+from collections import deque
+from time import monotonic
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+from utils.logging import get_logger_for
+from utils.tracing import current_trace
+
+
+class BatchWriter:
+    """
+    Collects rows and writes them in batches.
+
+    Adding a row never blocks: rows are queued, and written by a background task once the flush interval has passed
+    since the first queued row, or as soon as a full batch is queued. Writes run in a worker thread. Failed batches are
+    put back in the queue and retried after the next interval. When the queue is full, the oldest rows are dropped.
+    """
+
+    def __init__(self, name: str, write: Callable[[List[Any]], None],
+                 run_in_thread: Callable[..., Awaitable[Any]], flush_interval: float = 1.0, batch_size: int = 500,
+                 max_queued: int = 10000):
+        """
+        :param name: Name of the writer, for logs and metrics.
+        :param write: Blocking function writing a batch of rows, e.g. with one executemany insert.
+        :param run_in_thread: Coroutine function running a blocking function in a worker thread.
+        :param flush_interval: Maximum number of seconds a row waits before being written.
+        :param batch_size: Maximum number of rows per write.
+        :param max_queued: Maximum number of rows waiting to be written.
+        """
+        self.logger = get_logger_for(self)
+
+        self.name = name
+        self.write = write
+        self.run_in_thread = run_in_thread
+        self.flush_interval = flush_interval
+        self.batch_size = batch_size
+        self.max_queued = max_queued
+
+        self.queue: deque = deque()
+        self.wakeup = asyncio.Event()
+        self.task: Optional[asyncio.Task] = None
+        self.closing = False
+
+        self.written = 0
+        self.batches = 0
+        self.failed = 0
+        self.dropped = 0
+        self.max_batch = 0
+        self.total_write_time = 0.0
+
+    def add(self, row: Any) -> None:
+        """
+        Queue a row to be written.
+        :param row: The row.
+        """
+        self.queue.append(row)
+        if len(self.queue) > self.max_queued:
+            self.queue.popleft()
+            self.dropped += 1
+
+        if len(self.queue) >= self.batch_size:
+            self.wakeup.set()
+
+        if self.task is None or self.task.done():
+            self.task = asyncio.create_task(self.flush_loop(), name=f"BatchWriter:{self.name}")
+
+    async def flush_loop(self) -> None:
+        """
+        Write queued rows until the queue is empty.
+        """
+        # The task inherits the context of the command that added the first row; batches aren't part of its trace.
+        current_trace.set(None)
+
+        while self.queue:
+            if not self.closing:
+                try:
+                    await asyncio.wait_for(self.wakeup.wait(), timeout=self.flush_interval)
+                except asyncio.TimeoutError:
+                    pass
+                finally:
+                    self.wakeup.clear()
+
+            if not await self.flush() and self.closing:
+                return
+
+    async def flush(self) -> bool:
+        """
+        Write all queued rows.
+        :return: Whether all rows were written.
+        """
+        while self.queue:
+            batch = [self.queue.popleft() for _ in range(min(self.batch_size, len(self.queue)))]
+
+            start = monotonic()
+            try:
+                await self.run_in_thread(self.write, batch)
+            except Exception as e:
+                self.failed += 1
+                self.logger.error(f"Failed to write {len(batch)} row(s) for {self.name}: {e}")
+
+                # Retry the batch first, but keep the queue within its limit.
+                self.queue.extendleft(reversed(batch))
+                while len(self.queue) > self.max_queued:
+                    self.queue.popleft()
+                    self.dropped += 1
+                return False
+
+            self.total_write_time += monotonic() - start
+            self.written += len(batch)
+            self.batches += 1
+            self.max_batch = max(self.max_batch, len(batch))
+
+        return True
+
+    async def close(self) -> None:
+        """
+        Write the remaining rows, without waiting for the flush interval.
+        """
+        self.closing = True
+        self.wakeup.set()
+
+        # Writes in progress aren't cancelled, so rows are never written twice or lost halfway.
+        if self.task is not None and not self.task.done():
+            await self.task
+        elif self.queue:
+            await self.flush()
+
+        if self.queue:
+            self.logger.error(f"Lost {len(self.queue)} unwritten row(s) for {self.name}.")
+
+    def get_metrics(self) -> Dict[str, Any]:
+        """
+        Get the writer's metrics.
+        :return: The metrics.
+        """
+        return {"queued": len(self.queue), "written": self.written, "batches": self.batches,
+                "max_batch": self.max_batch, "failed": self.failed, "dropped": self.dropped,
+                "mean_write_time": round(self.total_write_time / self.batches, 4) if self.batches else 0.0}
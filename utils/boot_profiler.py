@@ -0,0 +1,139 @@
+"""
+Startup profiler recording a timeline of the bot's boot phases.
+"""
+
+import json
+from contextlib import contextmanager
+from pathlib import Path
+from time import monotonic
+from typing import Optional, List, Dict, Any, Iterator
+
+
+class BootPhase:
+    """
+    A single named phase of the boot process. Timestamps are monotonic seconds relative to the profiler's origin.
+    """
+
+    def __init__(self, name: str, start: float, depth: int = 0):
+        """
+        :param name: Name of the phase.
+        :param start: Start of the phase, relative to the profiler's origin.
+        :param depth: Nesting depth of the phase.
+        """
+        self.name = name
+        self.start = start
+        self.end: Optional[float] = None
+        self.depth = depth
+
+    @property
+    def duration(self) -> float:
+        """
+        Returns the duration of the phase, or 0 if it has not finished yet.
+        """
+        return 0.0 if self.end is None else self.end - self.start
+
+    def to_dict(self) -> Dict[str, Any]:
+        """
+        Convert the phase to a JSON-serialisable dictionary.
+        :return: The phase as a dictionary.
+        """
+        return {"name": self.name, "start": round(self.start, 6), "end": None if self.end is None else round(self.end, 6),
+                "duration": round(self.duration, 6), "depth": self.depth}
+
+
+class BootProfiler:
+    """
+    Records monotonic timestamps for each phase of the boot process, so startup can be broken down and compared.
+
+    Phases can be nested; a phase started while another one is open is considered part of it.
+    """
+
+    def __init__(self):
+        self.origin = monotonic()
+        self.phases: List[BootPhase] = []
+        self._open_phases: Dict[str, BootPhase] = {}
+
+    def _now(self) -> float:
+        """
+        Get the current time relative to the origin.
+        :return: Seconds since the origin.
+        """
+        return monotonic() - self.origin
+
+    def start_phase(self, name: str) -> BootPhase:
+        """
+        Start a phase. Has to be ended with end_phase.
+        :param name: Name of the phase.
+        :return: The started phase.
+        """
+        phase = BootPhase(name, self._now(), depth=len(self._open_phases))
+        self.phases.append(phase)
+        self._open_phases[name] = phase
+        return phase
+
+    def end_phase(self, name: str) -> Optional[BootPhase]:
+        """
+        End a phase. Ending a phase that was not started is a no-op.
+        :param name: Name of the phase.
+        :return: The ended phase, if any.
+        """
+        phase = self._open_phases.pop(name, None)
+        if phase is not None:
+            phase.end = self._now()
+        return phase
+
+    @contextmanager
+    def phase(self, name: str) -> Iterator[BootPhase]:
+        """
+        Context manager recording a phase for the duration of the block.
+        :param name: Name of the phase.
+        """
+        phase = self.start_phase(name)
+        try:
+            yield phase
+        finally:
+            self.end_phase(name)
+
+    @property
+    def total(self) -> float:
+        """
+        Returns the time between the origin and the end of the last finished phase.
+        """
+        return max((phase.end for phase in self.phases if phase.end is not None), default=0.0)
+
+    def format_waterfall(self, width: int = 40) -> str:
+        """
+        Format the recorded phases as a text waterfall.
+        :param width: Width of the bar column in characters.
+        :return: The waterfall.
+        """
+        total = self.total or 1.0
+        name_width = max((len(phase.name) + 2 * phase.depth for phase in self.phases), default=0)
+
+        lines = [f"Boot timeline (total {self.total:.3f}s):"]
+        for phase in self.phases:
+            offset = int(phase.start / total * width)
+            length = max(1, int(phase.duration / total * width))
+            bar = (" " * offset + "#" * length)[:width].ljust(width)
+            name = ("  " * phase.depth + phase.name).ljust(name_width)
+            lines.append(f"  {name} {phase.start:8.3f}s {phase.duration:8.3f}s |{bar}|")
+
+        return "\n".join(lines)
+
+    def to_dict(self) -> Dict[str, Any]:
+        """
+        Convert the timeline to a JSON-serialisable dictionary.
+        :return: The timeline as a dictionary.
+        """
+        return {"total": round(self.total, 6), "phases": [phase.to_dict() for phase in self.phases]}
+
+    def dump_json(self, path: str) -> None:
+        """
+        Dump the timeline to a JSON file, e.g. to compare boot times between commits in CI.
+        :param path: The path to the JSON file.
+        """
+        file_path = Path(path)
+        file_path.parent.mkdir(parents=True, exist_ok=True)
+
+        with open(file_path, "w") as file:
+            json.dump(self.to_dict(), file, indent=2)
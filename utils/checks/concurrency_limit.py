@@ -0,0 +1,216 @@
+import asyncio
+import functools
+from collections import deque
+from enum import Enum
+from time import monotonic
+from typing import Any, Dict, Hashable, List, Optional, Union
+
+from discord import Interaction, app_commands
+from discord.ext import commands
+
+concurrency_limiters: List["ConcurrencyLimiter"] = []
+
+
+class ConcurrencyScope(Enum):
+    """
+    What a concurrency limit applies to.
+    """
+    GLOBAL = "global"
+    """One limit shared by all invocations."""
+    GUILD = "guild"
+    """One limit per guild. Invocations in DMs are limited per user."""
+    USER = "user"
+    """One limit per user."""
+
+    def get_key(self, source: Union[Interaction, commands.Context]) -> Optional[Hashable]:
+        """
+        Get the key of the limit an invocation falls under.
+        :param source: The interaction or context of the invocation.
+        :return: The key.
+        """
+        user = source.user if isinstance(source, Interaction) else source.author
+
+        if self is ConcurrencyScope.GUILD and source.guild is not None:
+            return source.guild.id
+        if self is ConcurrencyScope.GLOBAL:
+            return None
+
+        return user.id
+
+
+class ConcurrencyLimitReached(commands.CommandError, app_commands.AppCommandError):
+    """
+    Raised when a command is invoked while its concurrency limit is reached, and the invocation can't wait for a slot.
+    Usable with both prefix and app commands.
+    """
+
+    def __init__(self, limiter: "ConcurrencyLimiter"):
+        self.limiter = limiter
+        super().__init__(f"Too many concurrent invocations of {limiter.name} ({limiter.scope.value} limit: "
+                         f"{limiter.number}).")
+
+
+class ConcurrencyLimiter:
+    """
+    Limits the number of concurrent invocations of a command, per key. Waiting invocations get slots in arrival order.
+    """
+
+    def __init__(self, name: str, number: int, scope: ConcurrencyScope, wait: bool, timeout: Optional[float]):
+        """
+        :param name: Name of the limit, for metrics.
+        :param number: Maximum number of concurrent invocations per key.
+        :param scope: What the limit applies to.
+        :param wait: Whether invocations over the limit wait for a slot, instead of being rejected.
+        :param timeout: Maximum time in seconds to wait for a slot. None to wait indefinitely.
+        """
+        self.name = name
+        self.number = number
+        self.scope = scope
+        self.wait = wait
+        self.timeout = timeout
+
+        self.active: Dict[Hashable, int] = {}
+        self.waiters: Dict[Hashable, deque] = {}
+
+        self.acquired = 0
+        self.rejected = 0
+        self.timed_out = 0
+        self.max_queue_length = 0
+        self.total_wait_time = 0.0
+        self.max_wait_time = 0.0
+
+    @property
+    def queue_length(self) -> int:
+        """
+        Returns the number of invocations waiting for a slot.
+        """
+        return sum(len(waiters) for waiters in self.waiters.values())
+
+    async def acquire(self, key: Hashable) -> None:
+        """
+        Take a slot, waiting for one if allowed.
+        :param key: The key of the limit.
+        :raises ConcurrencyLimitReached: If no slot could be taken.
+        """
+        if self.active.get(key, 0) < self.number and not self.waiters.get(key):
+            self.active[key] = self.active.get(key, 0) + 1
+            self.acquired += 1
+            return
+
+        if not self.wait:
+            self.rejected += 1
+            raise ConcurrencyLimitReached(self)
+
+        future = asyncio.get_running_loop().create_future()
+        waiters = self.waiters.setdefault(key, deque())
+        waiters.append(future)
+        self.max_queue_length = max(self.max_queue_length, self.queue_length)
+
+        start = monotonic()
+        try:
+            await asyncio.wait_for(asyncio.shield(future), timeout=self.timeout)
+        except (asyncio.TimeoutError, asyncio.CancelledError) as e:
+            if future.done() and not future.cancelled():
+                # The slot was handed over just as we gave up, so pass it on.
+                self.release(key)
+            else:
+                future.cancel()
+                self._remove_waiter(key, future)
+
+            if isinstance(e, asyncio.TimeoutError):
+                self.timed_out += 1
+                raise ConcurrencyLimitReached(self) from None
+            raise
+        finally:
+            waited = monotonic() - start
+            self.total_wait_time += waited
+            self.max_wait_time = max(self.max_wait_time, waited)
+
+        self.acquired += 1
+
+    def release(self, key: Hashable) -> None:
+        """
+        Release a slot, handing it to the first waiting invocation if there is one.
+        :param key: The key of the limit.
+        """
+        waiters = self.waiters.get(key)
+        while waiters:
+            future = waiters.popleft()
+            if not future.done():
+                future.set_result(None)
+                if not waiters:
+                    del self.waiters[key]
+                return
+
+        self.waiters.pop(key, None)
+
+        self.active[key] -= 1
+        if not self.active[key]:
+            del self.active[key]
+
+    def _remove_waiter(self, key: Hashable, future: asyncio.Future) -> None:
+        """
+        Remove a waiter that gave up.
+        """
+        waiters = self.waiters.get(key)
+        if waiters is None:
+            return
+
+        try:
+            waiters.remove(future)
+        except ValueError:
+            pass
+
+        if not waiters:
+            del self.waiters[key]
+
+    def get_metrics(self) -> Dict[str, Any]:
+        """
+        Get the limiter's metrics.
+        :return: The metrics.
+        """
+        return {"active": sum(self.active.values()), "queue_length": self.queue_length,
+                "max_queue_length": self.max_queue_length, "acquired": self.acquired, "rejected": self.rejected,
+                "timed_out": self.timed_out, "total_wait_time": round(self.total_wait_time, 3),
+                "max_wait_time": round(self.max_wait_time, 3)}
+
+
+def get_concurrency_metrics() -> Dict[str, Dict[str, Any]]:
+    """
+    Get the metrics of all concurrency limits.
+    :return: The metrics, by limit name.
+    """
+    return {limiter.name: limiter.get_metrics() for limiter in concurrency_limiters}
+
+
+def concurrency_limit(number: int, scope: ConcurrencyScope = ConcurrencyScope.GLOBAL, wait: bool = False,
+                      timeout: Optional[float] = None, name: Optional[str] = None):
+    """
+    Limit how many invocations of a command run at once. Works for both prefix and app commands; place it below the
+    command decorator. Raises ConcurrencyLimitReached when an invocation is rejected or times out waiting.
+    Interactions must be responded to within 3 seconds, so keep timeouts of waiting app commands short.
+    :param number: Maximum number of concurrent invocations per scope.
+    :param scope: What the limit applies to.
+    :param wait: Whether invocations over the limit wait for a slot, instead of being rejected.
+    :param timeout: Maximum time in seconds to wait for a slot. None to wait indefinitely.
+    :param name: Name of the limit, for metrics. Defaults to the callback's qualified name.
+    """
+
+    def decorator(func):
+        limiter = ConcurrencyLimiter(name or func.__qualname__, number, scope, wait, timeout)
+        concurrency_limiters.append(limiter)
+
+        @functools.wraps(func)
+        async def wrapper(*args, **kwargs):
+            source = next(arg for arg in args if isinstance(arg, (Interaction, commands.Context)))
+            key = scope.get_key(source)
+
+            await limiter.acquire(key)
+            try:
+                return await func(*args, **kwargs)
+            finally:
+                limiter.release(key)
+
+        return wrapper
+
+    return decorator
@@ -0,0 +1,55 @@
+from typing import Callable, Hashable, Optional, Union, Awaitable
+
+from discord import Interaction, app_commands
+from discord.ext import commands
+from discord.utils import maybe_coroutine
+
+
+def shared_cooldown(rate: int, per: float,
+                    key: Optional[Callable[[Interaction], Union[Hashable, Awaitable[Hashable]]]] = None,
+                    name: Optional[str] = None):
+    """
+    App command cooldown stored in the bot's shared rate limit store, so it holds across processes and restarts.
+    Drop-in replacement for app_commands.checks.cooldown; raises app_commands.CommandOnCooldown.
+    :param rate: Number of uses allowed per period.
+    :param per: Length of the period in seconds.
+    :param key: Function returning the bucket key for an interaction. Can be a coroutine. Defaults to the user.
+    :param name: Name of the bucket. Defaults to the command's qualified name.
+    """
+    cooldown = app_commands.Cooldown(rate, per)
+
+    async def predicate(interaction: Interaction) -> bool:
+        bucket = await maybe_coroutine(key, interaction) if key is not None else interaction.user.id
+        retry_after = await interaction.client.rate_limit_store.acquire(
+            f"{name or interaction.command.qualified_name}:{bucket}", rate, per)
+
+        if retry_after > 0:
+            raise app_commands.CommandOnCooldown(cooldown, retry_after)
+
+        return True
+
+    return app_commands.check(predicate)
+
+
+def shared_command_cooldown(rate: int, per: float, type: commands.BucketType = commands.BucketType.user,
+                            name: Optional[str] = None):
+    """
+    Prefix command cooldown stored in the bot's shared rate limit store, so it holds across processes and restarts.
+    Drop-in replacement for commands.cooldown; raises commands.CommandOnCooldown.
+    :param rate: Number of uses allowed per period.
+    :param per: Length of the period in seconds.
+    :param type: The type of cooldown bucket.
+    :param name: Name of the bucket. Defaults to the command's qualified name.
+    """
+    cooldown = commands.Cooldown(rate, per)
+
+    async def predicate(ctx: commands.Context) -> bool:
+        retry_after = await ctx.bot.rate_limit_store.acquire(
+            f"{name or ctx.command.qualified_name}:{type.name}:{type.get_key(ctx)}", rate, per)
+
+        if retry_after > 0:
+            raise commands.CommandOnCooldown(cooldown, retry_after, type)
+
+        return True
+
+    return commands.check(predicate)
@@ -0,0 +1,122 @@
+import asyncio
+import bisect
+from typing import Any, Awaitable, Callable, Dict, Generic, Hashable, List, Optional, TypeVar
+
+from utils.logging import get_logger_for
+
+K = TypeVar("K", bound=Hashable)
+V = TypeVar("V")
+
+
+class DataLoader(Generic[K, V]):
+    """
+    Coalesces concurrent lookups into batches.
+
+    Keys requested within one event loop iteration are collected, and loaded together with one call to the batch
+    function (e.g. one `WHERE key IN (...)` query) in a worker thread, once the iteration's other callbacks have run.
+    Callers waiting on a key that is already queued or being loaded share its lookup.
+
+    Nothing is cached once a batch completes; callers keep their own caches, and prime them with the results.
+    """
+
+    batch_size_bounds = [1, 2, 5, 10, 20, 50, 100, 200, 500]
+    """Upper bounds of the reported batch size buckets. The last bucket holds everything above."""
+
+    def __init__(self, name: str, batch_load: Callable[[List[K]], Dict[K, V]],
+                 run_in_thread: Callable[..., Awaitable[Any]], max_batch_size: int = 500):
+        """
+        :param name: Name of the loader, for logging and metrics.
+        :param batch_load: Blocking function loading the values of a list of keys. Keys without a value are left out.
+        :param run_in_thread: Coroutine function running a blocking function in a worker thread.
+        :param max_batch_size: Maximum number of keys per batch, e.g. to stay below the database's parameter limit.
+        """
+        self.logger = get_logger_for(self)
+
+        self.name = name
+        self.batch_load = batch_load
+        self.run_in_thread = run_in_thread
+        self.max_batch_size = max_batch_size
+
+        self.futures: Dict[K, asyncio.Future] = {}
+        self.queue: List[K] = []
+        self.dispatch_scheduled = False
+
+        self.loads = 0
+        self.shared_loads = 0
+        self.batches = 0
+        self.failed_batches = 0
+        self.keys_loaded = 0
+        self.largest_batch = 0
+        self.batch_size_counts = [0] * (len(self.batch_size_bounds) + 1)
+
+    async def load(self, key: K) -> Optional[V]:
+        """
+        Load the value of a key, batched with the other keys requested in the same event loop iteration.
+        :param key: The key.
+        :return: The value, or None if there is none.
+        """
+        self.loads += 1
+
+        future = self.futures.get(key)
+        if future is not None:
+            self.shared_loads += 1
+        else:
+            loop = asyncio.get_running_loop()
+            future = self.futures[key] = loop.create_future()
+            self.queue.append(key)
+            if not self.dispatch_scheduled:
+                self.dispatch_scheduled = True
+                loop.call_soon(self.dispatch)
+
+        # Shielded, so a cancelled caller doesn't cancel the lookup for the others.
+        return await asyncio.shield(future)
+
+    def dispatch(self) -> None:
+        """
+        Start loading the queued keys, in batches of at most `max_batch_size`.
+        """
+        keys, self.queue = self.queue, []
+        self.dispatch_scheduled = False
+
+        for start in range(0, len(keys), self.max_batch_size):
+            asyncio.create_task(self.load_batch(keys[start:start + self.max_batch_size]))
+
+    async def load_batch(self, keys: List[K]) -> None:
+        """
+        Load a batch of keys, and resolve their futures.
+        :param keys: The keys.
+        """
+        self.batches += 1
+        self.keys_loaded += len(keys)
+        self.largest_batch = max(self.largest_batch, len(keys))
+        self.batch_size_counts[bisect.bisect_left(self.batch_size_bounds, len(keys))] += 1
+
+        try:
+            values = await self.run_in_thread(self.batch_load, keys)
+        except Exception as e:
+            self.failed_batches += 1
+            self.logger.warning(f"Failed to load a batch of {len(keys)} key(s) for {self.name}: {e}")
+            for key in keys:
+                future = self.futures.pop(key)
+                if not future.done():
+                    future.set_exception(e)
+                    # Retrieved here, so futures without waiters left don't log "exception was never retrieved".
+                    future.exception()
+            return
+
+        for key in keys:
+            future = self.futures.pop(key)
+            if not future.done():
+                future.set_result(values.get(key))
+
+    def get_metrics(self) -> Dict[str, Any]:
+        """
+        Get the loader's metrics: lookups, how many shared a queued or in-flight lookup, and the batch sizes.
+        :return: The metrics.
+        """
+        labels = [f"<={bound}" for bound in self.batch_size_bounds] + [f">{self.batch_size_bounds[-1]}"]
+        return {"loads": self.loads, "shared_loads": self.shared_loads, "batches": self.batches,
+                "failed_batches": self.failed_batches,
+                "mean_batch_size": round(self.keys_loaded / self.batches, 2) if self.batches else 0.0,
+                "largest_batch": self.largest_batch,
+                "batch_sizes": {label: count for label, count in zip(labels, self.batch_size_counts) if count}}
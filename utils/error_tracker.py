@@ -0,0 +1,146 @@
+"""
+Groups errors by fingerprint, so repeated errors are counted instead of reported every time.
+"""
+
+import hashlib
+import time
+import traceback
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+from discord import app_commands
+from discord.ext import commands
+
+
+def unwrap_error(error: BaseException) -> BaseException:
+    """
+    Get the exception a command raised, from the error discord.py wraps it in.
+    :param error: The error.
+    :return: The original exception, or the error itself if it doesn't wrap one.
+    """
+    while isinstance(error, (commands.CommandInvokeError, app_commands.CommandInvokeError)) and error.original:
+        error = error.original
+
+    return error
+
+
+def get_error_fingerprint(error: BaseException, command_name: Optional[str], frame_count: int = 3) -> str:
+    """
+    Get a fingerprint identifying errors of the same kind: the exception type, the command, and the innermost frames
+    of the traceback. Line numbers are left out, so the fingerprint stays the same across unrelated code changes.
+    :param error: The (unwrapped) error.
+    :param command_name: Qualified name of the command that raised the error.
+    :param frame_count: Number of innermost frames to include.
+    :return: The fingerprint.
+    """
+    frames = traceback.extract_tb(error.__traceback__)[-frame_count:] if frame_count > 0 else []
+    parts = [f"{type(error).__module__}.{type(error).__qualname__}", command_name or ""]
+    parts.extend(f"{Path(frame.filename).name}:{frame.name}" for frame in frames)
+
+    return hashlib.sha1("|".join(parts).encode("utf-8")).hexdigest()[:16]
+
+
+class ErrorGroup:
+    """
+    Errors sharing a fingerprint.
+    """
+
+    def __init__(self, fingerprint: str, error_type: str, command_name: Optional[str], now: float):
+        self.fingerprint = fingerprint
+        self.error_type = error_type
+        self.command_name = command_name
+        self.count = 0
+        self.digest_count = 0
+        self.first_seen = now
+        self.last_seen = now
+        self.message = ""
+        self.context: Dict[str, Any] = {}
+
+    def format(self, count: int) -> str:
+        """
+        Format the group as one line for a digest.
+        :param count: Number of errors to show.
+        """
+        return (f"`{self.fingerprint}` {count}x {self.error_type} in `{self.command_name}` "
+                f"(first <t:{int(self.first_seen)}:R>, last <t:{int(self.last_seen)}:R>): {self.message[:200]}")
+
+
+class ErrorTracker:
+    """
+    Keeps the most recently seen error groups, up to a maximum number.
+
+    An error is reported (returned as such by record) when it is the first of its group since the last digest; other
+    errors are only counted, and show up in the next digest instead.
+    """
+
+    def __init__(self, max_groups: int = 1000, frame_count: int = 3):
+        """
+        :param max_groups: Maximum number of groups kept. The least recently seen group is evicted beyond this.
+        :param frame_count: Number of innermost traceback frames included in fingerprints.
+        """
+        self.max_groups = max_groups
+        self.frame_count = frame_count
+
+        self.groups: OrderedDict[str, ErrorGroup] = OrderedDict()
+
+        self.recorded = 0
+        self.suppressed = 0
+        self.evicted = 0
+
+    def record(self, error: BaseException, command_name: Optional[str],
+               context: Optional[Dict[str, Any]] = None) -> Tuple[ErrorGroup, bool]:
+        """
+        Record an error.
+        :param error: The error, as passed to the error handler.
+        :param command_name: Qualified name of the command that raised the error.
+        :param context: Sample context of the error, e.g. the user and the command's arguments.
+        :return: The error's group, and whether the error should be reported.
+        """
+        error = unwrap_error(error)
+        fingerprint = get_error_fingerprint(error, command_name, self.frame_count)
+        now = time.time()
+
+        group = self.groups.get(fingerprint)
+        if group is None:
+            group = ErrorGroup(fingerprint, type(error).__qualname__, command_name, now)
+            self.groups[fingerprint] = group
+            if len(self.groups) > self.max_groups:
+                self.groups.popitem(last=False)
+                self.evicted += 1
+        else:
+            self.groups.move_to_end(fingerprint)
+
+        group.count += 1
+        group.digest_count += 1
+        group.last_seen = now
+        group.message = str(error)
+        group.context = context or {}
+
+        self.recorded += 1
+        if group.digest_count > 1:
+            self.suppressed += 1
+            return group, False
+
+        return group, True
+
+    def take_digest(self) -> List[Tuple[ErrorGroup, int]]:
+        """
+        Get the groups with errors since the last digest, most frequent first, and start a new digest.
+        :return: The groups, with their number of errors since the last digest.
+        """
+        digest = sorted(((group, group.digest_count) for group in self.groups.values() if group.digest_count),
+                        key=lambda entry: entry[1], reverse=True)
+
+        for group, _ in digest:
+            group.digest_count = 0
+
+        return digest
+
+    def get_metrics(self) -> Dict[str, Any]:
+        """
+        Get the tracker's metrics.
+        :return: The metrics.
+        """
+        return {"groups": len(self.groups), "recorded": self.recorded, "suppressed": self.suppressed,
+                "evicted": self.evicted}
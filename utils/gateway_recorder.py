@@ -0,0 +1,112 @@
+"""
+Recording of raw gateway dispatch payloads, for replaying production traffic offline.
+
+Recordings are gzip-compressed JSON lines. Each line is a compact `[offset, event, data]` array, where `offset` is the
+number of seconds since the recorder was started. Every session is written to its own file, so offsets always increase
+within a recording.
+"""
+
+import gzip
+import json
+from datetime import datetime
+from pathlib import Path
+from time import monotonic
+from typing import Iterator, Tuple, Any, Optional
+
+from utils.logging import get_logger_for
+
+DISPATCH_OPCODE = 0
+
+
+class GatewayRecorder:
+    """
+    Writes raw gateway dispatch payloads to a compressed recording file.
+    """
+
+    def __init__(self, path: str, compression_level: int = 6):
+        """
+        :param path: The path to the recording file. The session's start time is added to the file name, e.g.
+        `gateway.jsonl.gz` records to `gateway.20240101-120000.jsonl.gz`.
+        :param compression_level: The gzip compression level.
+        """
+        self.logger = get_logger_for(self)
+
+        self.path = self.get_session_path(Path(path), datetime.now())
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+
+        self.file = gzip.open(self.path, "wt", encoding="utf-8", compresslevel=compression_level)
+        self.start_time = monotonic()
+        self.recorded = 0
+
+        self.logger.info(f"Recording gateway events to {self.path}.")
+
+    @staticmethod
+    def get_session_path(path: Path, started_at: datetime) -> Path:
+        """
+        Get the path of a session's recording: the configured path, with the start time before its suffixes.
+        :param path: The configured path.
+        :param started_at: The start time of the session.
+        :return: The session's path.
+        """
+        suffixes = "".join(path.suffixes)
+        stem = path.name[:-len(suffixes)] if suffixes else path.name
+        return path.with_name(f"{stem}.{started_at:%Y%m%d-%H%M%S}{suffixes}")
+
+    def record_raw(self, message: Any) -> None:
+        """
+        Record a raw gateway message. Non-dispatch messages (heartbeats, hellos, etc.) are ignored.
+        :param message: The raw gateway message, as received through the socket_raw_receive event.
+        """
+        if self.file is None:
+            return
+
+        payload = json.loads(message) if isinstance(message, (str, bytes)) else message
+        if payload.get("op") != DISPATCH_OPCODE:
+            return
+
+        self.record(payload["t"], payload["d"])
+
+    def record(self, event: str, data: Any) -> None:
+        """
+        Record a single dispatch event.
+        :param event: The event name. (e.g. MESSAGE_CREATE)
+        :param data: The event data.
+        """
+        if self.file is None:
+            return
+
+        offset = round(monotonic() - self.start_time, 4)
+        self.file.write(json.dumps([offset, event, data], separators=(",", ":")))
+        self.file.write("\n")
+        self.recorded += 1
+
+    def close(self) -> None:
+        """
+        Flush and close the recording file.
+        """
+        if self.file is None:
+            return
+
+        self.file.close()
+        self.file = None
+
+        self.logger.info(f"Recorded {self.recorded} gateway events to {self.path}.")
+
+
+def read_gateway_recording(path: str, events: Optional[set] = None) -> Iterator[Tuple[float, str, Any]]:
+    """
+    Read a gateway recording.
+    :param path: The path to the recording file.
+    :param events: Optional set of event names to filter on.
+    :return: Iterator over (offset, event, data) tuples.
+    """
+    with gzip.open(path, "rt", encoding="utf-8") as file:
+        for line in file:
+            if not line.strip():
+                continue
+
+            offset, event, data = json.loads(line)
+            if events is not None and event not in events:
+                continue
+
+            yield offset, event, data
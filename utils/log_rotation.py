@@ -0,0 +1,219 @@
+"""
+Log file handler rotating by size and time, with background compression and retention limits for rotated files.
+"""
+
+import calendar
+import gzip
+import math
+import os
+import re
+import shutil
+import sys
+import time
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+from logging import handlers, LogRecord
+from pathlib import Path
+from typing import Optional
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+COMPRESSION_SUFFIXES = {"gzip": ".gz", "zstd": ".zst"}
+ROTATION_TIME_FORMAT = "%Y-%m-%dT%H-%M-%S"
+ROTATION_TIME_PATTERN = re.compile(r"\.(\d{4}-\d{2}-\d{2}T\d{2}-\d{2}-\d{2})(?:_\d+)?(?:\.gz|\.zst)?$")
+
+
+def compress_file(source: Path, compression: str) -> Path:
+    """
+    Compress a file and delete the original. The compressed file only appears once it is complete.
+    :param source: The file.
+    :param compression: "gzip" or "zstd".
+    :return: The compressed file.
+    """
+    target = source.with_name(source.name + COMPRESSION_SUFFIXES[compression])
+    partial = target.with_name(target.name + ".partial")
+
+    with open(source, "rb") as file_in:
+        if compression == "zstd":
+            with open(partial, "wb") as file_out:
+                zstandard.ZstdCompressor(level=6).copy_stream(file_in, file_out)
+        else:
+            with gzip.open(partial, "wb", compresslevel=6) as file_out:
+                shutil.copyfileobj(file_in, file_out, 1024 * 1024)
+
+    os.replace(partial, target)
+    source.unlink()
+    return target
+
+
+class CompressingRotatingFileHandler(handlers.RotatingFileHandler):
+    """
+    Rotates the log file once it reaches a maximum size, and at fixed time intervals (aligned to UTC, so daily rotation
+    happens at midnight regardless of restarts).
+
+    Rotated files are named after the time of rotation and compressed by a background thread, which also enforces the
+    retention limits: rotated files older than the maximum age are deleted, and then the oldest ones until the total
+    size of rotated files is within the limit. Ages are taken from the time in the name, as compressing a file gives it
+    a new modification time.
+    """
+
+    def __init__(self, filename: str, max_bytes: int = 32 * 1024 * 1024, interval: float = 24 * 60 * 60,
+                 compression: Optional[str] = "gzip", retention_bytes: int = 0, retention_age: float = 0,
+                 encoding: Optional[str] = "utf-8"):
+        """
+        :param filename: Path of the log file.
+        :param max_bytes: Size in bytes at which to rotate. 0 to disable size-based rotation.
+        :param interval: Seconds between time-based rotations. 0 to disable time-based rotation.
+        :param compression: "gzip", "zstd" or None. zstd requires the zstandard package, and falls back to gzip.
+        :param retention_bytes: Maximum total size of rotated files. 0 for no limit.
+        :param retention_age: Maximum age in seconds of rotated files. 0 for no limit.
+        :param encoding: Encoding of the log file.
+        """
+        super().__init__(filename, maxBytes=max_bytes, encoding=encoding)
+
+        if compression == "zstd" and zstandard is None:
+            compression = "gzip"
+        if compression not in COMPRESSION_SUFFIXES:
+            compression = None
+
+        self.interval = interval
+        self.compression = compression
+        self.retention_bytes = retention_bytes
+        self.retention_age = retention_age
+        self.rollover_at = self.compute_rollover_at(time.time())
+
+        self.worker = ThreadPoolExecutor(max_workers=1, thread_name_prefix="LogCompression")
+        # Rotated files left uncompressed by an earlier run (e.g. after a crash) are picked up here, and compressions it
+        # left unfinished are discarded, to be redone from their source files.
+        self.worker.submit(self.remove_partial_files)
+        self.worker.submit(self.process_rotated_files)
+
+    @property
+    def base_path(self) -> Path:
+        """
+        Returns the path of the log file.
+        """
+        return Path(self.baseFilename)
+
+    def compute_rollover_at(self, now: float) -> float:
+        """
+        Get the time of the next time-based rotation.
+        :param now: The current time.
+        :return: The time of the next rotation, or infinity if time-based rotation is disabled.
+        """
+        if self.interval <= 0:
+            return math.inf
+
+        return (now // self.interval + 1) * self.interval
+
+    def shouldRollover(self, record: LogRecord) -> bool:
+        if record.created >= self.rollover_at:
+            return True
+
+        return bool(super().shouldRollover(record))
+
+    def doRollover(self) -> None:
+        if self.stream:
+            self.stream.close()
+            self.stream = None
+
+        now = time.time()
+        self.rollover_at = self.compute_rollover_at(now)
+
+        if self.base_path.exists() and self.base_path.stat().st_size > 0:
+            name = f"{self.base_path.name}.{time.strftime(ROTATION_TIME_FORMAT, time.gmtime(now))}"
+            rotated = self.base_path.with_name(name)
+            suffix = 0
+            while any(rotated.with_name(rotated.name + extension).exists() for extension in ("", ".gz", ".zst")):
+                suffix += 1
+                rotated = self.base_path.with_name(f"{name}_{suffix}")
+            os.rename(self.base_path, rotated)
+
+        if not self.delay:
+            self.stream = self._open()
+
+        try:
+            self.worker.submit(self.process_rotated_files)
+        except RuntimeError:
+            # The handler is closing; the rotated file is compressed on the next start.
+            pass
+
+    @staticmethod
+    def get_rotation_time(file: Path) -> float:
+        """
+        Get the time a file was rotated at, from its name.
+        :param file: The rotated file.
+        :return: The time of rotation, or the file's modification time if its name has none.
+        """
+        match = ROTATION_TIME_PATTERN.search(file.name)
+        if match is None:
+            return file.stat().st_mtime
+
+        return calendar.timegm(time.strptime(match.group(1), ROTATION_TIME_FORMAT))
+
+    def get_rotated_files(self):
+        """
+        Get the rotated log files, oldest first.
+        :return: The rotated files.
+        """
+        files = [file for file in self.base_path.parent.glob(f"{self.base_path.name}.*")
+                 if not file.name.endswith(".partial")]
+        return sorted(files, key=self.get_rotation_time)
+
+    def remove_partial_files(self) -> None:
+        """
+        Delete partially compressed files, left behind by a run that stopped while compressing. Runs on the compression
+        thread, before anything is compressed.
+        """
+        try:
+            for file in self.base_path.parent.glob(f"{self.base_path.name}.*.partial"):
+                file.unlink(missing_ok=True)
+        except Exception:
+            sys.stderr.write("--- Failed to delete partially compressed log files ---\n")
+            traceback.print_exc(file=sys.stderr)
+
+    def process_rotated_files(self) -> None:
+        """
+        Compress rotated files, and enforce the retention limits. Runs on the compression thread.
+        """
+        try:
+            if self.compression is not None:
+                for file in self.get_rotated_files():
+                    if file.suffix not in (".gz", ".zst"):
+                        compress_file(file, self.compression)
+
+            self.apply_retention()
+        except Exception:
+            # Logging the failure could end up here again, so report it like the logging module reports its own errors.
+            # The next rotation tries again.
+            sys.stderr.write("--- Failed to compress or clean up rotated log files ---\n")
+            traceback.print_exc(file=sys.stderr)
+
+    def apply_retention(self) -> None:
+        """
+        Delete rotated files that are too old, then the oldest ones until the total size is within the limit.
+        """
+        files = self.get_rotated_files()
+
+        if self.retention_age > 0:
+            cutoff = time.time() - self.retention_age
+            for file in [file for file in files if self.get_rotation_time(file) < cutoff]:
+                file.unlink()
+                files.remove(file)
+
+        if self.retention_bytes > 0:
+            total_size = sum(file.stat().st_size for file in files)
+            while files and total_size > self.retention_bytes:
+                file = files.pop(0)
+                total_size -= file.stat().st_size
+                file.unlink()
+
+    def close(self) -> None:
+        """
+        Close the log file, after waiting for pending compression.
+        """
+        self.worker.shutdown(wait=True)
+        super().close()
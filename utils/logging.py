@@ -1,8 +1,20 @@
+import atexit
+import copy
+import json
 import logging
+import queue
+import random
+import time
 from logging import getLogger, Logger, Formatter, handlers, DEBUG, basicConfig, INFO
 from os import path
 from pathlib import Path
-from typing import Optional
+from typing import Optional, List, Dict, Any
+
+from utils.log_rotation import CompressingRotatingFileHandler
+
+log_listener: Optional[handlers.QueueListener] = None
+log_queue: Optional["DropOldestQueue"] = None
+log_sampling_filter: Optional["SamplingFilter"] = None
 
 
 def get_logger_base_name() -> str:
@@ -135,19 +147,195 @@ class ColourFormatter(Formatter):
         return output
 
 
-def init_logging(logs_path: Optional[str] = None, debug: Optional[bool] = False) -> None:
+class JsonFormatter(Formatter):
+    """
+    Formats records as single-line JSON objects. Fields passed through `extra` (e.g. guild_id, user_id, command) are
+    included as top-level keys.
+    """
+
+    reserved_attributes = set(vars(logging.makeLogRecord({}))) | {"message", "asctime"}
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {"time": record.created, "level": record.levelname, "logger": record.name,
+                 "message": record.getMessage()}
+
+        for key, value in record.__dict__.items():
+            if key not in self.reserved_attributes and not key.startswith("_"):
+                entry[key] = value
+
+        if record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+        if record.stack_info:
+            entry["stack"] = self.formatStack(record.stack_info)
+
+        return json.dumps(entry, default=str)
+
+
+class SamplingFilter(logging.Filter):
+    """
+    Samples and rate limits high-volume records. Warnings and errors are always kept.
+
+    Only records that opt in are sampled: they name their category with `extra={"sampled": "<category>"}`, e.g. the
+    command logging cog's "command_completion" records. Rules are keyed by category; other records of the same logger
+    are never sampled. Each rule can have a `rate` (fraction of records to keep, e.g. 0.01) and a `per_second` limit on
+    kept records.
+    """
+
+    def __init__(self, rules: Dict[str, Dict[str, float]]):
+        """
+        :param rules: Sampling rules, by category.
+        """
+        super().__init__()
+        self.rules = {name: (float(rule.get("rate", 1.0)), rule.get("per_second")) for name, rule in rules.items()}
+        self.windows: Dict[str, List[float]] = {name: [0.0, 0] for name in rules}
+        self.sampled_out = 0
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno >= logging.WARNING:
+            return True
+
+        rule_name = getattr(record, "sampled", None)
+        if rule_name not in self.rules:
+            return True
+
+        rate, per_second = self.rules[rule_name]
+        if rate < 1.0 and random.random() >= rate:
+            self.sampled_out += 1
+            return False
+
+        if per_second is not None:
+            window = self.windows[rule_name]
+            second = int(time.monotonic())
+            if window[0] != second:
+                window[0], window[1] = second, 0
+            if window[1] >= per_second:
+                self.sampled_out += 1
+                return False
+            window[1] += 1
+
+        return True
+
+
+class DropOldestQueue(queue.Queue):
+    """
+    Bounded queue that never blocks producers: when full, the oldest item is dropped to make room.
+    """
+
+    def __init__(self, maxsize: int):
+        super().__init__(maxsize)
+        self.dropped = 0
+
+    def put(self, item: Any, block: bool = True, timeout: Optional[float] = None) -> None:
+        with self.not_full:
+            if 0 < self.maxsize <= self._qsize():
+                self._get()
+                self.dropped += 1
+                self.unfinished_tasks -= 1
+
+            self._put(item)
+            self.unfinished_tasks += 1
+            self.not_empty.notify()
+
+
+class NonBlockingQueueHandler(handlers.QueueHandler):
+    """
+    Queue handler that leaves formatting to the handlers on the listener thread.
+
+    The default QueueHandler formats records (including tracebacks) on the logging thread, and replaces the exception
+    with its text. This only merges the message arguments, which may change after the call, and keeps exc_info, so
+    formatters like ColourFormatter still see the exception.
+    """
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        return record
+
+
+def start_queue_logging(target_handlers: List[logging.Handler], queue_size: int = 10000) -> logging.Handler:
+    """
+    Start a background thread writing records to the given handlers, and get the handler feeding it.
+    :param target_handlers: The handlers to write records to.
+    :param queue_size: Maximum number of queued records. When full, the oldest records are dropped.
+    :return: The queue handler to attach to loggers.
+    """
+    global log_listener, log_queue
+
+    shutdown_logging()
+
+    log_queue = DropOldestQueue(queue_size)
+    log_listener = handlers.QueueListener(log_queue, *target_handlers, respect_handler_level=True)
+    log_listener.start()
+
+    return NonBlockingQueueHandler(log_queue)
+
+
+def shutdown_logging() -> None:
     """
-    Initialise logging.
+    Write out all queued records and stop the logging thread.
+    """
+    global log_listener
+
+    if log_listener is None:
+        return
+
+    listener, log_listener = log_listener, None
+    listener.stop()
+
+    if log_queue.dropped:
+        # The listener thread is gone, so write the warning to the handlers directly.
+        listener.handle(logging.LogRecord(get_logger_name(), logging.WARNING, __file__, 0,
+                                          f"Dropped {log_queue.dropped} log records because the log queue was full.",
+                                          None, None))
+
+
+def get_logging_metrics() -> Dict[str, int]:
+    """
+    Get the log queue's metrics.
+    :return: The metrics.
+    """
+    if log_queue is None:
+        return {}
+
+    metrics = {"queued": log_queue.qsize(), "queue_size": log_queue.maxsize, "dropped": log_queue.dropped}
+    if log_sampling_filter is not None:
+        metrics["sampled_out"] = log_sampling_filter.sampled_out
+
+    return metrics
+
+
+def init_logging(logs_path: Optional[str] = None, debug: Optional[bool] = False, queue_size: int = 10000,
+                 log_format: str = "text", sampling: Optional[Dict[str, Dict[str, float]]] = None,
+                 max_bytes: int = 32 * 1024 * 1024, rotation_interval: float = 24 * 60 * 60,
+                 compression: Optional[str] = "gzip", retention_bytes: int = 0, retention_age: float = 0) -> None:
+    """
+    Initialise logging. Records are written by a background thread, so logging never blocks on console or disk I/O.
     :param logs_path: The path to the logs.
     :param debug: Whether to enable debug logging.
+    :param queue_size: Maximum number of records waiting to be written. When full, the oldest records are dropped.
+    :param log_format: "text" for human-readable logs, or "json" for one JSON object per line.
+    :param sampling: Sampling rules for high-volume records, by category. See SamplingFilter.
+    :param max_bytes: Size in bytes at which to rotate the log file. 0 to disable size-based rotation.
+    :param rotation_interval: Seconds between time-based rotations. 0 to disable time-based rotation.
+    :param compression: Compression of rotated log files: "gzip", "zstd" or None.
+    :param retention_bytes: Maximum total size of rotated log files. 0 for no limit.
+    :param retention_age: Maximum age in seconds of rotated log files. 0 for no limit.
     """
+    global log_sampling_filter
+
     datetime_format = "%Y-%m-%d %H:%M:%S"
     formatter = Formatter("[{asctime}] [{levelname:<8}] {name}: {message}", style="{", datefmt=datetime_format)
 
     basicConfig(level=DEBUG if debug else INFO, format="[{asctime}] [{levelname:<8}] {name}: {message}", style="{",
                 datefmt=datetime_format)
 
-    logging.root.handlers[0].setFormatter(ColourFormatter())
+    if log_format == "json":
+        formatter = JsonFormatter()
+
+    stream_handler = logging.root.handlers[0]
+    stream_handler.setFormatter(formatter if log_format == "json" else ColourFormatter())
+    target_handlers = [stream_handler]
 
     if logs_path is not None:
         # If logs_path is a relative path, we move to project root first. If this is undesirable, remove this block.
@@ -160,13 +348,28 @@ def init_logging(logs_path: Optional[str] = None, debug: Optional[bool] = False)
         if not logs_path.exists():
             logs_path.mkdir(parents=True, exist_ok=True)
 
-        file_handler = handlers.RotatingFileHandler(filename=f"{logs_path}/discord.log", encoding="utf-8",
-                                                    maxBytes=32 * 1024 * 1024, backupCount=5)
+        file_handler = CompressingRotatingFileHandler(f"{logs_path}/discord.log", max_bytes=max_bytes,
+                                                      interval=rotation_interval, compression=compression,
+                                                      retention_bytes=retention_bytes, retention_age=retention_age)
         file_handler.setFormatter(formatter)
 
         file_handler.setLevel(DEBUG if debug else INFO)
 
-        # We add the handler to the discord logger. This automatically applies to all child loggers. (e.g. discord.bot)
-        getLogger(get_logger_base_name()).addHandler(file_handler)
+        # Only the discord logger and its child loggers (e.g. discord.bot) are written to the file.
+        file_handler.addFilter(logging.Filter(get_logger_base_name()))
+        target_handlers.append(file_handler)
+
+    # All handlers run on the listener thread; the root logger only enqueues records.
+    queue_handler = start_queue_logging(target_handlers, queue_size)
+
+    # Sample before enqueueing, so dropped records cost as little as possible.
+    log_sampling_filter = None
+    if sampling:
+        log_sampling_filter = SamplingFilter(sampling)
+        queue_handler.addFilter(log_sampling_filter)
+
+    logging.root.removeHandler(stream_handler)
+    logging.root.addHandler(queue_handler)
+    atexit.register(shutdown_logging)
 
     getLogger(get_logger_base_name()).setLevel(DEBUG if debug else INFO)
@@ -0,0 +1,140 @@
+"""
+Event loop lag monitor, with a watchdog thread capturing what blocks the loop.
+"""
+
+import asyncio
+import sys
+import threading
+import traceback
+from time import monotonic
+from typing import Any, Dict, Optional
+
+from utils.logging import get_logger_for
+
+
+class LoopMonitor:
+    """
+    Measures event loop scheduling lag.
+
+    A task on the loop sleeps for a fixed interval and records how late it wakes up, and stamps a heartbeat each time.
+    A watchdog thread checks the heartbeat; once it is older than the interval plus the threshold, the loop is blocked,
+    and the watchdog logs the loop thread's current stack. When the loop resumes, the total stall is logged as well.
+    """
+
+    def __init__(self, threshold: float = 0.25, interval: float = 0.1):
+        """
+        :param threshold: Lag in seconds from which the loop counts as blocked.
+        :param interval: Seconds between lag measurements.
+        """
+        self.logger = get_logger_for(self)
+
+        self.threshold = threshold
+        self.interval = interval
+
+        self.heartbeat = monotonic()
+        self.loop_thread_id: Optional[int] = None
+        self.task: Optional[asyncio.Task] = None
+        self.watchdog: Optional[threading.Thread] = None
+        self.stopped = threading.Event()
+
+        self.stall_reported = False
+        self.stall_stack: Optional[str] = None
+
+        self.samples = 0
+        self.total_lag = 0.0
+        self.max_lag = 0.0
+        self.last_lag = 0.0
+        self.stalls = 0
+        self.longest_stall = 0.0
+
+    @property
+    def running(self) -> bool:
+        """
+        Returns whether the monitor is running.
+        """
+        return self.task is not None and not self.task.done()
+
+    def start(self) -> None:
+        """
+        Start monitoring the running loop.
+        """
+        if self.running:
+            return
+
+        self.loop_thread_id = threading.get_ident()
+        self.heartbeat = monotonic()
+        self.stopped.clear()
+
+        self.task = asyncio.create_task(self.measure_loop(), name="LoopMonitor")
+        self.watchdog = threading.Thread(target=self.watch, name="LoopMonitor watchdog", daemon=True)
+        self.watchdog.start()
+
+    def stop(self) -> None:
+        """
+        Stop monitoring.
+        """
+        self.stopped.set()
+
+        if self.task is not None:
+            self.task.cancel()
+            self.task = None
+
+        if self.watchdog is not None:
+            self.watchdog.join(timeout=self.interval * 2)
+            self.watchdog = None
+
+    async def measure_loop(self) -> None:
+        """
+        Measure how late the loop wakes up from sleeping.
+        """
+        while True:
+            start = monotonic()
+            await asyncio.sleep(self.interval)
+            now = monotonic()
+
+            lag = max(0.0, now - start - self.interval)
+            self.heartbeat = now
+            self.samples += 1
+            self.total_lag += lag
+            self.last_lag = lag
+            self.max_lag = max(self.max_lag, lag)
+
+            if lag >= self.threshold:
+                self.stalls += 1
+                self.longest_stall = max(self.longest_stall, lag)
+
+                if self.stall_stack is not None:
+                    # The full stack was already logged by the watchdog; repeat only the innermost frame.
+                    innermost = self.stall_stack.rstrip().splitlines()[-2].strip()
+                    self.logger.warning(f"Event loop was blocked for {lag:.3f}s in {innermost}")
+                else:
+                    self.logger.warning(f"Event loop was blocked for {lag:.3f}s.")
+
+            self.stall_reported = False
+            self.stall_stack = None
+
+    def watch(self) -> None:
+        """
+        Watchdog thread: capture the loop thread's stack while the loop is blocked.
+        """
+        while not self.stopped.wait(self.interval):
+            blocked_for = monotonic() - self.heartbeat - self.interval
+            if blocked_for < self.threshold or self.stall_reported:
+                continue
+
+            frame = sys._current_frames().get(self.loop_thread_id)
+            if frame is None:
+                continue
+
+            self.stall_reported = True
+            self.stall_stack = "".join(traceback.format_stack(frame))
+            self.logger.warning(f"Event loop blocked for over {blocked_for:.3f}s, currently in:\n{self.stall_stack}")
+
+    def get_metrics(self) -> Dict[str, Any]:
+        """
+        Get the monitor's metrics.
+        :return: The metrics.
+        """
+        return {"last_lag": round(self.last_lag, 4), "max_lag": round(self.max_lag, 4),
+                "mean_lag": round(self.total_lag / self.samples, 4) if self.samples else 0.0, "stalls": self.stalls,
+                "longest_stall": round(self.longest_stall, 3)}
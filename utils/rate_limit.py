@@ -0,0 +1,200 @@
+"""
+Token-bucket rate limiting backed by a pluggable shared store.
+
+Buckets hold up to `rate` tokens and refill at `rate / per` tokens per second. Refills are not written separately: a
+bucket's tokens are recomputed from the time of its last update whenever it is used, so a check is a single atomic
+read-modify-write against the store.
+"""
+
+import asyncio
+import time
+from typing import Tuple, Optional, Any, Awaitable, Callable
+
+from sqlalchemy import case, select, delete
+from sqlalchemy.dialects import sqlite, postgresql
+
+from database.database_handler import DatabaseHandler
+from entities.rate_limit_bucket import RateLimitBucket
+from utils.logging import get_logger_for
+
+
+def take_tokens(tokens: Optional[float], updated_at: Optional[float], now: float, rate: int, per: float,
+                cost: float = 1.0) -> Tuple[float, bool]:
+    """
+    Refill a bucket and try to take tokens from it.
+    :param tokens: Tokens in the bucket at the last update, or None for a new bucket.
+    :param updated_at: Time of the last update, or None for a new bucket.
+    :param now: The current time.
+    :param rate: Capacity of the bucket.
+    :param per: Time in seconds to refill the bucket completely.
+    :param cost: Tokens to take.
+    :return: The tokens left in the bucket, and whether the tokens could be taken.
+    """
+    if tokens is None or updated_at is None:
+        tokens = float(rate)
+    else:
+        tokens = min(float(rate), tokens + max(0.0, now - updated_at) * rate / per)
+
+    if tokens >= cost:
+        return tokens - cost, True
+
+    return tokens, False
+
+
+def get_retry_after(tokens: float, rate: int, per: float, cost: float = 1.0) -> float:
+    """
+    Get the time until a bucket has enough tokens again.
+    :param tokens: Tokens in the bucket.
+    :param rate: Capacity of the bucket.
+    :param per: Time in seconds to refill the bucket completely.
+    :param cost: Tokens needed.
+    :return: Time in seconds.
+    """
+    return max(0.0, (cost - tokens) * per / rate)
+
+
+class RateLimitStore:
+    """
+    Base class for rate limit stores.
+    """
+
+    async def acquire(self, key: str, rate: int, per: float, cost: float = 1.0) -> float:
+        """
+        Try to take tokens from a bucket.
+        :param key: The bucket key.
+        :param rate: Capacity of the bucket.
+        :param per: Time in seconds to refill the bucket completely.
+        :param cost: Tokens to take.
+        :return: 0 if the tokens were taken, otherwise the time in seconds until they can be.
+        """
+        raise NotImplementedError
+
+    async def reset(self, key: str) -> None:
+        """
+        Reset a bucket.
+        :param key: The bucket key.
+        """
+        raise NotImplementedError
+
+
+class MemoryRateLimitStore(RateLimitStore):
+    """
+    In-process store. Not shared between processes; meant for tests and single-process setups.
+    """
+
+    def __init__(self):
+        self.buckets = {}
+
+    async def acquire(self, key: str, rate: int, per: float, cost: float = 1.0) -> float:
+        now = time.time()
+        tokens, allowed = take_tokens(*self.buckets.get(key, (None, None)), now, rate, per, cost)
+        self.buckets[key] = (tokens, now)
+
+        return 0.0 if allowed else get_retry_after(tokens, rate, per, cost)
+
+    async def reset(self, key: str) -> None:
+        self.buckets.pop(key, None)
+
+
+class DatabaseRateLimitStore(RateLimitStore):
+    """
+    Store keeping buckets in the bot's database.
+
+    On SQLite and PostgreSQL, a check is a single upsert statement. Other databases fall back to a locked
+    select followed by an update. Statements run in a worker thread, so checks don't block the event loop.
+    """
+
+    upsert_dialects = {"sqlite": sqlite.insert, "postgresql": postgresql.insert}
+
+    def __init__(self, database_handler: DatabaseHandler,
+                 run_in_thread: Optional[Callable[..., Awaitable[Any]]] = None):
+        """
+        :param database_handler: The database handler.
+        :param run_in_thread: Coroutine function running a blocking function in a worker thread. Defaults to
+        asyncio.to_thread.
+        """
+        self.database_handler = database_handler
+        self.run_in_thread = run_in_thread or asyncio.to_thread
+        self.logger = get_logger_for(self)
+
+    async def acquire(self, key: str, rate: int, per: float, cost: float = 1.0) -> float:
+        now = time.time()
+
+        insert = self.upsert_dialects.get(self.database_handler.engine.dialect.name)
+        if insert is None:
+            tokens, allowed = await self.run_in_thread(self._acquire_locked, key, now, rate, per, cost)
+        else:
+            tokens, allowed = await self.run_in_thread(self._acquire_upsert, insert, key, now, rate, per, cost)
+
+        return 0.0 if allowed else get_retry_after(tokens, rate, per, cost)
+
+    def _acquire_upsert(self, insert: Any, key: str, now: float, rate: int, per: float,
+                        cost: float) -> Tuple[float, bool]:
+        """
+        Take tokens with a single upsert, refilling the bucket in the same statement.
+        """
+        table = RateLimitBucket.__table__
+
+        refilled = table.c.tokens + (now - table.c.updated_at) * (rate / per)
+        capped = case((refilled > rate, float(rate)), else_=refilled)
+        allowed = capped >= cost
+
+        # A new bucket starts full, and refuses requests costing more than it holds, like an existing one.
+        new_tokens, new_allowed = take_tokens(None, None, now, rate, per, cost)
+        statement = insert(table).values(key=key, tokens=new_tokens, updated_at=now, allowed=new_allowed)
+        statement = statement.on_conflict_do_update(index_elements=[table.c.key], set_={
+            "tokens": case((allowed, capped - cost), else_=capped),
+            "updated_at": now,
+            "allowed": allowed,
+        }).returning(table.c.tokens, table.c.allowed)
+
+        with self.database_handler.engine.connect().execution_options(isolation_level="AUTOCOMMIT") as connection:
+            tokens, allowed = connection.execute(statement).one()
+
+        return tokens, bool(allowed)
+
+    def _acquire_locked(self, key: str, now: float, rate: int, per: float, cost: float) -> Tuple[float, bool]:
+        """
+        Take tokens by locking the bucket row, for databases without upsert support.
+        """
+        with self.database_handler.session_maker() as session, session.begin():
+            bucket = session.execute(
+                select(RateLimitBucket).filter_by(key=key).with_for_update()).scalar_one_or_none()
+
+            if bucket is None:
+                bucket = RateLimitBucket(key=key)
+                session.add(bucket)
+
+            bucket.tokens, bucket.allowed = take_tokens(bucket.tokens, bucket.updated_at, now, rate, per, cost)
+            bucket.updated_at = now
+
+            return bucket.tokens, bucket.allowed
+
+    async def reset(self, key: str) -> None:
+        await self.run_in_thread(self._reset, key)
+
+    def _reset(self, key: str) -> None:
+        """
+        Delete a bucket.
+        """
+        with self.database_handler.engine.begin() as connection:
+            connection.execute(delete(RateLimitBucket).where(RateLimitBucket.key == key))
+
+    async def purge(self, max_age: float) -> int:
+        """
+        Delete buckets that have not been used for a while. Unused buckets are full, so this does not change behaviour.
+        :param max_age: Minimum time in seconds since the last use.
+        :return: The number of deleted buckets.
+        """
+        return await self.run_in_thread(self._purge, max_age)
+
+    def _purge(self, max_age: float) -> int:
+        """
+        Delete buckets that have not been used for a while. Blocking.
+        """
+        with self.database_handler.engine.begin() as connection:
+            result = connection.execute(
+                delete(RateLimitBucket).where(RateLimitBucket.updated_at < time.time() - max_age))
+
+        return result.rowcount
+
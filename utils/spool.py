@@ -0,0 +1,330 @@
+"""
+Durable, append-only on-disk spool, for entries that must survive until they are delivered.
+"""
+
+import asyncio
+import json
+import os
+from pathlib import Path
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+from utils.logging import get_logger_for
+
+
+class Spool:
+    """
+    Append-only queue of JSON entries, stored in numbered segment files.
+
+    Entries are appended to the newest segment, and a new segment is started once it reaches the segment size. Appends
+    are written right away but fsynced in batches, at most once per sync interval. Entries are read in order from a
+    persisted cursor, and segments are deleted once fully acknowledged. When the spool exceeds its maximum size, the
+    oldest segments are dropped.
+
+    File I/O runs in a worker thread, one operation at a time: appending never blocks, and queued appends are written
+    before entries are read.
+    """
+
+    cursor_file_name = "cursor.json"
+
+    def __init__(self, path: str, run_in_thread: Callable[..., Awaitable[Any]], segment_bytes: int = 1024 * 1024,
+                 max_bytes: int = 64 * 1024 * 1024, sync_interval: float = 1.0):
+        """
+        :param path: Directory to keep the spool in.
+        :param run_in_thread: Coroutine function running a blocking function in a worker thread.
+        :param segment_bytes: Size in bytes at which to start a new segment.
+        :param max_bytes: Maximum total size in bytes of the segments.
+        :param sync_interval: Maximum number of seconds appended entries may wait before being fsynced.
+        """
+        self.logger = get_logger_for(self)
+
+        self.path = Path(path)
+        self.run_in_thread = run_in_thread
+        self.path.mkdir(parents=True, exist_ok=True)
+        self.segment_bytes = segment_bytes
+        self.max_bytes = max_bytes
+        self.sync_interval = sync_interval
+
+        self.segments: List[int] = sorted(int(file.stem) for file in self.path.glob("*.ndjson"))
+        if not self.segments:
+            self.segments.append(0)
+
+        self.cursor: Tuple[int, int] = self._load_cursor()
+        self.peeked: List[Tuple[int, int]] = []
+
+        self._repair_tail()
+        self.writer = open(self._segment_path(self.segments[-1]), "ab")
+        self.sync_handle: Optional[asyncio.TimerHandle] = None
+
+        self.io_lock = asyncio.Lock()
+        self.buffer: List[bytes] = []
+        self.write_task: Optional[asyncio.Task] = None
+        self.background_tasks = set()
+
+        self.pending = sum(self._count_entries(segment, self.cursor[1] if segment == self.cursor[0] else 0)
+                           for segment in self.segments if segment >= self.cursor[0])
+        self.dropped = 0
+
+        if self.pending:
+            self.logger.info(f"Spool at {self.path} has {self.pending} undelivered entries.")
+
+    def _segment_path(self, segment: int) -> Path:
+        """
+        Get the path of a segment file.
+        """
+        return self.path / f"{segment:012d}.ndjson"
+
+    def _load_cursor(self) -> Tuple[int, int]:
+        """
+        Load the read cursor, or start at the oldest segment.
+        """
+        try:
+            with open(self.path / self.cursor_file_name, "r") as file:
+                segment, offset = json.load(file)
+        except (OSError, ValueError):
+            return self.segments[0], 0
+
+        if segment not in self.segments:
+            return self.segments[0], 0
+
+        return segment, offset
+
+    def _save_cursor(self) -> None:
+        """
+        Persist the read cursor atomically.
+        """
+        temporary_path = self.path / f"{self.cursor_file_name}.tmp"
+        with open(temporary_path, "w") as file:
+            json.dump(list(self.cursor), file)
+        os.replace(temporary_path, self.path / self.cursor_file_name)
+
+    def _repair_tail(self) -> None:
+        """
+        Cut off an entry left half-written by a crash, so new entries start on a fresh line.
+        """
+        path = self._segment_path(self.segments[-1])
+        if not path.exists():
+            return
+
+        with open(path, "rb+") as file:
+            data = file.read()
+            if data and not data.endswith(b"\n"):
+                file.truncate(data.rfind(b"\n") + 1)
+
+    def _count_entries(self, segment: int, offset: int) -> int:
+        """
+        Count the entries in a segment from an offset.
+        """
+        try:
+            with open(self._segment_path(segment), "rb") as file:
+                file.seek(offset)
+                return file.read().count(b"\n")
+        except OSError:
+            return 0
+
+    def append(self, entry: Any) -> None:
+        """
+        Append an entry. It is written in the background.
+        :param entry: JSON-serialisable entry.
+        """
+        self.buffer.append(json.dumps(entry, separators=(",", ":")).encode("utf-8") + b"\n")
+        self.pending += 1
+
+        if self.write_task is None or self.write_task.done():
+            self.write_task = asyncio.create_task(self.flush(), name=f"Spool writer ({self.path})")
+
+    async def flush(self) -> None:
+        """
+        Write the appended entries.
+        """
+        async with self.io_lock:
+            if not self.buffer:
+                return
+
+            lines, self.buffer = self.buffer, []
+            try:
+                dropped = await self.run_in_thread(self._write, lines)
+            except Exception as e:
+                # Keep the entries, and write them with the next ones.
+                self.logger.error(f"Failed to write to the spool at {self.path}: {e}")
+                self.buffer[:0] = lines
+                return
+
+        self.pending -= dropped
+        self.dropped += dropped
+        self._schedule_sync()
+
+    def _write(self, lines: List[bytes]) -> int:
+        """
+        Write lines to the newest segment, starting new segments as they fill up. Blocking.
+        :return: The number of entries dropped to stay within the maximum size.
+        """
+        dropped = 0
+        for line in lines:
+            self.writer.write(line)
+            if self.writer.tell() >= self.segment_bytes:
+                self._start_segment()
+                dropped += self._enforce_max_bytes()
+
+        self.writer.flush()
+        return dropped
+
+    def _start_segment(self) -> None:
+        """
+        Seal the current segment and start a new one. Blocking.
+        """
+        self._fsync()
+        self.writer.close()
+
+        self.segments.append(self.segments[-1] + 1)
+        self.writer = open(self._segment_path(self.segments[-1]), "ab")
+
+    def _enforce_max_bytes(self) -> int:
+        """
+        Drop the oldest segments while the spool is over its maximum size. Blocking.
+        :return: The number of entries dropped.
+        """
+        total_dropped = 0
+        total_bytes = sum(self._segment_path(segment).stat().st_size for segment in self.segments)
+
+        while total_bytes > self.max_bytes and len(self.segments) > 1:
+            oldest = self.segments.pop(0)
+            dropped = self._count_entries(oldest, self.cursor[1] if self.cursor[0] == oldest else 0)
+            total_bytes -= self._segment_path(oldest).stat().st_size
+            self._segment_path(oldest).unlink()
+
+            if self.cursor[0] <= oldest:
+                self.cursor = (self.segments[0], 0)
+                self.peeked = []
+                self._save_cursor()
+
+            total_dropped += dropped
+            self.logger.warning(f"Spool at {self.path} is full; dropped {dropped} undelivered entries.")
+
+        return total_dropped
+
+    def _schedule_sync(self) -> None:
+        """
+        Make sure written entries are fsynced within the sync interval.
+        """
+        if self.sync_handle is None:
+            self.sync_handle = asyncio.get_running_loop().call_later(self.sync_interval, self._start_sync)
+
+    def _start_sync(self) -> None:
+        """
+        Start fsyncing in the background, once the sync interval has passed.
+        """
+        self.sync_handle = None
+
+        task = asyncio.create_task(self.sync())
+        self.background_tasks.add(task)
+        task.add_done_callback(self.background_tasks.discard)
+
+    async def sync(self) -> None:
+        """
+        Fsync written entries.
+        """
+        if self.sync_handle is not None:
+            self.sync_handle.cancel()
+            self.sync_handle = None
+
+        async with self.io_lock:
+            try:
+                await self.run_in_thread(self._fsync)
+            except Exception as e:
+                self.logger.error(f"Failed to sync the spool at {self.path}: {e}")
+
+    def _fsync(self) -> None:
+        """
+        Fsync the newest segment. Blocking.
+        """
+        if not self.writer.closed:
+            self.writer.flush()
+            os.fsync(self.writer.fileno())
+
+    async def peek(self, count: int) -> List[Any]:
+        """
+        Read the oldest undelivered entries, without removing them. Appended entries are written first.
+        :param count: Maximum number of entries to read.
+        :return: The entries, oldest first.
+        """
+        await self.flush()
+
+        async with self.io_lock:
+            return await self.run_in_thread(self._peek, count)
+
+    def _peek(self, count: int) -> List[Any]:
+        """
+        Read the oldest undelivered entries. Blocking.
+        """
+        entries = []
+        self.peeked = []
+
+        segment, offset = self.cursor
+        for segment in [segment for segment in self.segments if segment >= self.cursor[0]]:
+            with open(self._segment_path(segment), "rb") as file:
+                file.seek(offset)
+                for line in file:
+                    offset += len(line)
+                    if not line.endswith(b"\n"):
+                        break
+
+                    try:
+                        entries.append(json.loads(line))
+                    except ValueError:
+                        self.logger.error(f"Skipping corrupt spool entry in segment {segment}.")
+                        entries.append(None)
+                    self.peeked.append((segment, offset))
+
+                    if len(entries) >= count:
+                        return entries
+
+            offset = 0
+
+        return entries
+
+    async def ack(self, count: int) -> None:
+        """
+        Remove entries returned by the last peek, once they are delivered.
+        :param count: Number of entries to remove, from the oldest.
+        """
+        async with self.io_lock:
+            if count <= 0 or not self.peeked:
+                return
+
+            acknowledged = min(count, len(self.peeked))
+            await self.run_in_thread(self._ack, acknowledged)
+            self.pending -= acknowledged
+
+    def _ack(self, count: int) -> None:
+        """
+        Move the cursor past acknowledged entries, and delete delivered segments. Blocking.
+        """
+        self.cursor = self.peeked[count - 1]
+        self.peeked = []
+
+        # Delete fully delivered segments, except the one being written to.
+        while len(self.segments) > 1 and self.segments[0] < self.cursor[0]:
+            self._segment_path(self.segments.pop(0)).unlink()
+
+        if self.cursor[0] != self.segments[-1] and self.cursor[1] >= self._segment_path(self.cursor[0]).stat().st_size:
+            self._segment_path(self.segments.pop(0)).unlink()
+            self.cursor = (self.segments[0], 0)
+
+        self._save_cursor()
+
+    async def close(self) -> None:
+        """
+        Write the appended entries, then fsync and close the spool.
+        """
+        await self.flush()
+        await self.sync()
+
+        async with self.io_lock:
+            await self.run_in_thread(self.writer.close)
+
+    def get_metrics(self) -> Dict[str, Any]:
+        """
+        Get the spool's metrics.
+        :return: The metrics.
+        """
+        return {"pending": self.pending, "segments": len(self.segments), "dropped": self.dropped}
@@ -0,0 +1,353 @@
+"""
+Per-invocation command tracing: spans for each stage of a command, latency histograms, slow trace logging and export
+in the Chrome trace event format (viewable in Perfetto or chrome://tracing).
+"""
+
+import bisect
+import contextvars
+import functools
+import json
+import os
+import time
+from contextlib import contextmanager
+from itertools import count
+from time import perf_counter
+from typing import Any, Dict, Iterator, List, Optional
+
+import aiohttp
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+from utils.logging import get_logger_for
+
+current_trace: contextvars.ContextVar[Optional["Trace"]] = contextvars.ContextVar("current_trace", default=None)
+
+trace_ids = count(1)
+
+
+class Span:
+    """
+    A timed stage within a trace.
+    """
+
+    def __init__(self, name: str, start: float, attributes: Optional[Dict[str, Any]] = None):
+        self.name = name
+        self.start = start
+        self.end: Optional[float] = None
+        self.attributes = attributes or {}
+
+    @property
+    def duration(self) -> float:
+        """
+        Returns the duration of the span in seconds, up to now if it hasn't ended.
+        """
+        return (self.end if self.end is not None else perf_counter()) - self.start
+
+
+class Trace:
+    """
+    The spans of one command invocation.
+    """
+
+    def __init__(self, name: str, attributes: Optional[Dict[str, Any]] = None):
+        self.trace_id = next(trace_ids)
+        self.name = name
+        self.attributes = attributes or {}
+        self.start = perf_counter()
+        self.wall_start = time.time()
+        self.end: Optional[float] = None
+        self.spans: List[Span] = []
+
+    @property
+    def duration(self) -> float:
+        """
+        Returns the duration of the trace in seconds, up to now if it hasn't ended.
+        """
+        return (self.end if self.end is not None else perf_counter()) - self.start
+
+    def start_span(self, name: str, **attributes) -> Span:
+        """
+        Start a span. End it by setting its end time.
+        :param name: Name of the span.
+        :param attributes: Attributes of the span.
+        :return: The span.
+        """
+        span = Span(name, perf_counter(), attributes)
+        self.spans.append(span)
+        return span
+
+    def format(self) -> str:
+        """
+        Format the span breakdown, with each span's start offset and duration.
+        """
+        lines = [f"{self.name} took {self.duration * 1000:.1f}ms {self.attributes}"]
+        for span in sorted(self.spans, key=lambda span: span.start):
+            details = f" {span.attributes}" if span.attributes else ""
+            lines.append(f"  +{(span.start - self.start) * 1000:8.1f}ms {span.duration * 1000:8.1f}ms "
+                         f"{span.name}{details}")
+        return "\n".join(lines)
+
+    def to_trace_events(self) -> List[Dict[str, Any]]:
+        """
+        Convert the trace to Chrome trace events: one complete ("X") event for the trace and one per span, each trace on
+        its own track.
+        """
+        def to_event(name: str, start: float, duration: float, args: Dict[str, Any]) -> Dict[str, Any]:
+            return {"name": name, "cat": "command", "ph": "X", "pid": os.getpid(), "tid": self.trace_id,
+                    "ts": round((self.wall_start + start - self.start) * 1_000_000),
+                    "dur": round(duration * 1_000_000), "args": args}
+
+        return [to_event(self.name, self.start, self.duration, self.attributes)] + \
+            [to_event(span.name, span.start, span.duration, span.attributes) for span in self.spans]
+
+
+@contextmanager
+def span(name: str, **attributes) -> Iterator[Optional[Span]]:
+    """
+    Record a span on the current trace, if there is one.
+    :param name: Name of the span.
+    :param attributes: Attributes of the span.
+    """
+    trace = current_trace.get()
+    if trace is None:
+        yield None
+        return
+
+    recorded = trace.start_span(name, **attributes)
+    try:
+        yield recorded
+    finally:
+        recorded.end = perf_counter()
+
+
+def traced(name: str, func):
+    """
+    Wrap a coroutine function to record a span around each call, when there is a current trace.
+    :param name: Name of the span.
+    :param func: The coroutine function.
+    :return: The wrapped function.
+    """
+    @functools.wraps(func)
+    async def wrapper(*args, **kwargs):
+        with span(name):
+            return await func(*args, **kwargs)
+
+    return wrapper
+
+
+class LatencyHistogram:
+    """
+    Histogram of latencies in fixed, roughly logarithmic buckets.
+    """
+
+    bounds = [0.001, 0.002, 0.005, 0.01, 0.02, 0.05, 0.1, 0.2, 0.5, 1.0, 2.0, 5.0, 10.0]
+    """Upper bounds of the buckets in seconds. The last bucket holds everything above."""
+
+    def __init__(self):
+        self.counts = [0] * (len(self.bounds) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def record(self, duration: float) -> None:
+        """
+        Record a latency.
+        :param duration: The latency in seconds.
+        """
+        self.counts[bisect.bisect_left(self.bounds, duration)] += 1
+        self.count += 1
+        self.total += duration
+        self.max = max(self.max, duration)
+
+    def percentile(self, percentile: float) -> float:
+        """
+        Estimate a percentile, as the upper bound of the bucket it falls in (at most the maximum).
+        :param percentile: The percentile, from 0 to 100.
+        :return: The estimate in seconds.
+        """
+        target = percentile / 100 * self.count
+        seen = 0
+        for index, bucket_count in enumerate(self.counts):
+            seen += bucket_count
+            if seen >= target and bucket_count:
+                return min(self.bounds[index], self.max) if index < len(self.bounds) else self.max
+        return 0.0
+
+    def get_metrics(self) -> Dict[str, Any]:
+        """
+        Get the histogram's summary, in milliseconds.
+        """
+        return {"count": self.count, "mean_ms": round(self.total / self.count * 1000, 2) if self.count else 0.0,
+                "p50_ms": round(self.percentile(50) * 1000, 2), "p95_ms": round(self.percentile(95) * 1000, 2),
+                "p99_ms": round(self.percentile(99) * 1000, 2), "max_ms": round(self.max * 1000, 2)}
+
+
+class Tracer:
+    """
+    Starts and finishes command traces.
+
+    Finished traces are recorded into latency histograms per command and stage ("total" for the whole invocation).
+    Traces slower than the threshold are logged with their span breakdown. If an export writer is set, every trace is
+    exported as Chrome trace events.
+    """
+
+    def __init__(self, slow_threshold: float = 1.0):
+        """
+        :param slow_threshold: Duration in seconds from which traces are logged. 0 to disable.
+        """
+        self.logger = get_logger_for(self)
+
+        self.slow_threshold = slow_threshold
+        self.export_writer = None
+
+        self.histograms: Dict[str, Dict[str, LatencyHistogram]] = {}
+        self.traces = 0
+        self.slow_traces = 0
+
+    def start_trace(self, name: str, **attributes) -> Trace:
+        """
+        Start a trace, and make it the current trace of the running task.
+        :param name: Name of the trace, e.g. the command's name.
+        :param attributes: Attributes of the trace.
+        :return: The trace.
+        """
+        trace = Trace(name, attributes)
+        current_trace.set(trace)
+        return trace
+
+    def finish_trace(self, trace: Trace, success: bool) -> None:
+        """
+        Finish a trace: record it in the histograms, log it if slow, and export it.
+        :param trace: The trace.
+        :param success: Whether the command succeeded.
+        """
+        if trace.end is None:
+            # Finished after the fact (e.g. from a completion event): the trace ends with its last span.
+            ended = [recorded.end for recorded in trace.spans if recorded.end is not None]
+            trace.end = max(ended) if ended else perf_counter()
+        for open_span in trace.spans:
+            if open_span.end is None:
+                open_span.end = trace.end
+        trace.attributes["success"] = success
+
+        histograms = self.histograms.setdefault(trace.name, {})
+        histograms.setdefault("total", LatencyHistogram()).record(trace.duration)
+        stage_durations: Dict[str, float] = {}
+        for recorded in trace.spans:
+            stage = recorded.name.split(" ", 1)[0]
+            stage_durations[stage] = stage_durations.get(stage, 0.0) + recorded.duration
+        for stage, duration in stage_durations.items():
+            histograms.setdefault(stage, LatencyHistogram()).record(duration)
+
+        self.traces += 1
+        if 0 < self.slow_threshold <= trace.duration:
+            self.slow_traces += 1
+            self.logger.warning(f"Slow command trace:\n{trace.format()}")
+
+        if self.export_writer is not None:
+            for trace_event in trace.to_trace_events():
+                self.export_writer.add(trace_event)
+
+    def create_http_trace_config(self) -> aiohttp.TraceConfig:
+        """
+        Create an aiohttp trace config recording a span for each HTTP request made during a trace.
+        :return: The trace config, to pass to the client as `http_trace`.
+        """
+        async def on_request_start(session, context, params: aiohttp.TraceRequestStartParams):
+            trace = current_trace.get()
+            context.span = trace.start_span(f"http {params.method} {params.url.path}") if trace else None
+
+        async def on_request_end(session, context, params: aiohttp.TraceRequestEndParams):
+            if context.span is not None:
+                context.span.end = perf_counter()
+                context.span.attributes["status"] = params.response.status
+
+        async def on_request_exception(session, context, params: aiohttp.TraceRequestExceptionParams):
+            if context.span is not None:
+                context.span.end = perf_counter()
+                context.span.attributes["error"] = type(params.exception).__name__
+
+        trace_config = aiohttp.TraceConfig()
+        trace_config.on_request_start.append(on_request_start)
+        trace_config.on_request_end.append(on_request_end)
+        trace_config.on_request_exception.append(on_request_exception)
+        return trace_config
+
+    @staticmethod
+    def instrument_engine(engine: Engine) -> None:
+        """
+        Record a span for each database statement executed during a trace. Statements run in the bot's thread pool are
+        part of the trace of the code that offloaded them; statements run in other threads are not.
+        :param engine: The engine.
+        """
+        @event.listens_for(engine, "before_cursor_execute")
+        def before_cursor_execute(connection, cursor, statement, parameters, context, executemany):
+            trace = current_trace.get()
+            if trace is not None:
+                context.trace_span = trace.start_span("db", statement=statement.split(None, 1)[0])
+
+        @event.listens_for(engine, "after_cursor_execute")
+        def after_cursor_execute(connection, cursor, statement, parameters, context, executemany):
+            recorded = getattr(context, "trace_span", None)
+            if recorded is not None:
+                recorded.end = perf_counter()
+
+    @staticmethod
+    def instrument_command(command) -> None:
+        """
+        Record spans for the checks, argument conversion and callback of a command. Commands are instrumented once, by
+        wrapping the methods discord.py calls for each stage.
+        :param command: A prefix (commands.Command) or application (app_commands.Command) command.
+        """
+        if getattr(command, "traced", False):
+            return
+        command.traced = True
+
+        if not hasattr(command, "_parse_arguments") and not hasattr(command, "_transform_arguments"):
+            # Context menus only get the trace's total.
+            return
+
+        if hasattr(command, "_transform_arguments"):
+            # Application command: Command._invoke_with_namespace runs these stages in order.
+            command._check_can_run = traced("checks", command._check_can_run)
+            command._transform_arguments = traced("conversion", command._transform_arguments)
+            command._do_call = traced("callback", command._do_call)
+            return
+
+        # Prefix command: Command.prepare runs the checks and conversion, and then the before hooks right before the
+        # callback, so the callback span starts there and ends with the trace.
+        command.can_run = traced("checks", command.can_run)
+        command._parse_arguments = traced("conversion", command._parse_arguments)
+        call_before_hooks = command.call_before_hooks
+
+        @functools.wraps(call_before_hooks)
+        async def call_before_hooks_and_start_callback(ctx):
+            await call_before_hooks(ctx)
+            trace = current_trace.get()
+            if trace is not None:
+                trace.start_span("callback")
+
+        command.call_before_hooks = call_before_hooks_and_start_callback
+
+    def write_trace_events(self, path: str, trace_events: List[Dict[str, Any]]) -> None:
+        """
+        Append trace events to a file in the JSON array trace format, whose closing bracket is optional, so the file
+        can be appended to and loaded at any time. Blocking.
+        :param path: Path of the file.
+        :param trace_events: The trace events.
+        """
+        is_new = not os.path.exists(path) or os.path.getsize(path) == 0
+        with open(path, "a", encoding="utf-8") as file:
+            if is_new:
+                file.write("[\n")
+            file.writelines(json.dumps(trace_event, separators=(",", ":"), default=str) + ",\n"
+                            for trace_event in trace_events)
+
+    def get_metrics(self) -> Dict[str, Any]:
+        """
+        Get the tracer's metrics: trace counts, and the histograms per command and stage.
+        :return: The metrics.
+        """
+        return {"traces": self.traces, "slow_traces": self.slow_traces,
+                "commands": {name: {stage: histogram.get_metrics() for stage, histogram in histograms.items()}
+                             for name, histograms in self.histograms.items()}}